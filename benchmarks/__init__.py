@@ -0,0 +1,13 @@
+'''
+Performance benchmarks of mobilize
+
+These are not tests: they measure how fast mobilize does its work,
+rather than whether it does it correctly.  Run them from the root of
+the source tree:
+
+  python3 -m benchmarks.render
+
+Each benchmark module can save its results as a baseline, and compare
+later runs against it; see benchmarks.support.
+
+'''
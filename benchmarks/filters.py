@@ -0,0 +1,276 @@
+'''
+Filter micro-benchmarks
+
+Times every public filter of mobilize.filters, and the to_imgserve
+filter, on synthetic pages of growing size (see benchmarks.pagegen),
+to show how each scales with the size of the DOM it is given.
+
+Each filter is applied as a component applies it: most to the whole
+page body, the table filters to each div holding a single table.
+For each filter and page size, the benchmark reports the best time
+of a number of runs, each on a fresh copy of the page, and the time
+per 1000 elements.  It then fits time against element count, as
+time ~ elements ** exponent; filters whose exponent exceeds
+--superlinear scale worse than linearly, and are flagged.
+
+  python3 -m benchmarks.filters
+  python3 -m benchmarks.filters -k table --depth 12 --noise 1
+  python3 -m benchmarks.filters --save-baseline /tmp/filters.json
+
+'''
+
+import sys
+from functools import partial
+from benchmarks import support
+from benchmarks import pagegen
+
+#: Measurement compared against baselines
+THROUGHPUT = 'elems_per_sec'
+
+#: Default exponent above which a filter is flagged as scaling worse than linearly
+DEFAULT_SUPERLINEAR = 1.15
+
+#: Page the filters are applied to, for those resolving URLs
+DESKTOP_URL = 'http://www.example.com/section/page.html'
+
+def get_args(argv=None):
+    '''fetch arguments from commmand line'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the filters on synthetic pages of growing size.')
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        dest     = 'repeat',
+        type     = int,
+        default  = 7,
+        help     = 'Number of timed runs of each filter on each page size; the best counts (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--sizes',
+        dest     = 'sizes',
+        type     = int,
+        nargs    = '+',
+        default  = list(pagegen.SIZE_FACTORS),
+        help     = 'Page size factors (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--depth',
+        dest     = 'depth',
+        type     = int,
+        default  = None,
+        help     = 'Nesting depth of the page content, for all sizes',
+        )
+    parser.add_argument(
+        '--noise',
+        dest     = 'noise',
+        type     = float,
+        default  = None,
+        help     = 'Attribute noise of the pages, from 0 to 1, for all sizes',
+        )
+    parser.add_argument(
+        '--superlinear',
+        dest     = 'superlinear',
+        type     = float,
+        default  = DEFAULT_SUPERLINEAR,
+        help     = 'Scaling exponent above which a filter is flagged (default: %(default)s)',
+        )
+    parser.add_argument(
+        '-k',
+        dest     = 'only',
+        default  = None,
+        help     = 'Only run filters whose name contains this string',
+        )
+    support.add_baseline_args(parser)
+    return parser.parse_args(argv)
+
+# Filter arguments
+
+def _not_img(elem):
+    return 'img' != elem.tag
+
+def _column_specs(table_elem):
+    '''
+    Spec map of a table: the first column, then the rest
+    '''
+    from mobilize.filters import Spec
+    rows = list(table_elem.iter('tr'))
+    cols = len(rows[0].findall('td'))
+    return [
+        Spec('first', 0, 0, len(rows) - 1, 0),
+        Spec('rest', 0, 1, len(rows) - 1, cols - 1),
+        ]
+
+def _table2divgroups(params):
+    from mobilize.filters import Spec, table2divgroups
+    return partial(table2divgroups, specmap=[
+            Spec('first', 0, 0, params['rows'] - 1, 0),
+            Spec('rest', 0, 1, params['rows'] - 1, params['cols'] - 1),
+            ])
+
+def _to_imgserve(params):
+    from mobilize.images import ImgServe
+    return ImgServe(srcset=True, lqip=2, eager=4)
+
+def benchmarked(params):
+    '''
+    The filters benchmarked, for pages of the given parameters
+
+    Filters are created anew for each run, as some (like ImgServe)
+    keep state over a page.
+
+    @param params : Page parameters (see pagegen.synthetic_page)
+    @type  params : dict
+
+    @return       : (filter name, filter, target) triples; target is 'body' or 'tables'
+    @rtype        : list of tuple
+
+    '''
+    from mobilize import filters
+    return [
+        ('nomiscattrib', filters.nomiscattrib, 'body'),
+        ('nomiscattrib_if', partial(filters.nomiscattrib_if, predicate=_not_img), 'body'),
+        ('noattribs', partial(filters.noattribs, tags=['td', 'table', 'img'], attribs=['width', 'height', 'bgcolor']), 'body'),
+        ('noevents', partial(filters.noevents, xpath='.//*'), 'body'),
+        ('noimgsize', filters.noimgsize, 'body'),
+        ('noinputsize', filters.noinputsize, 'body'),
+        ('nodecorativeimg', filters.nodecorativeimg, 'body'),
+        ('noembeds', filters.noembeds, 'body'),
+        ('nobr', filters.nobr, 'body'),
+        ('squeezebr', filters.squeezebr, 'body'),
+        ('omit', partial(filters.omit, xpaths=['.//form'], csspaths=['img[width="1"]']), 'body'),
+        ('omitattrib_one', partial(filters.omitattrib_one, toremove=['style']), 'body'),
+        ('embedfacade', filters.embedfacade, 'body'),
+        ('resizeobject', filters.resizeobject, 'body'),
+        ('resizeiframe', filters.resizeiframe, 'body'),
+        ('absimgsrc', partial(filters.absimgsrc, desktop_url=DESKTOP_URL), 'body'),
+        ('abslinkfilesrc', partial(filters.abslinkfilesrc, desktop_url=DESKTOP_URL), 'body'),
+        ('formaction', filters.formaction, 'body'),
+        ('formcontroltypes', filters.formcontroltypes, 'body'),
+        ('heroimg', filters.heroimg, 'body'),
+        ('imgsub', partial(filters.imgsub, subs={'/images/spacer.gif' : '/mobile/spacer.gif'}), 'body'),
+        ('relhyperlinks', partial(filters.relhyperlinks, domain='www.example.com'), 'body'),
+        ('relhyperlinks_full', partial(filters.relhyperlinks_full, domains=['www.example.com', 'example.com'],
+                                       protocols=['http', 'https']), 'body'),
+        ('table2divs', filters.table2divs, 'tables'),
+        ('table2divrows', filters.table2divrows, 'tables'),
+        ('table2divgroups', _table2divgroups(params), 'tables'),
+        ('table2divgroupsgs', partial(filters.table2divgroupsgs, specmapgen=_column_specs), 'tables'),
+        ('to_imgserve', _to_imgserve(params), 'body'),
+        ]
+
+def uncovered():
+    '''
+    Public filters of mobilize.filters with no benchmark
+
+    @return : Filter names
+    @rtype  : list of str
+
+    '''
+    from mobilize import filters
+    names = {name for name, _, _ in benchmarked(pagegen.scaled(1))}
+    return sorted(name for name in dir(filters)
+                  if not name.startswith('_')
+                  and getattr(getattr(filters, name), 'is_filter', False)
+                  and isinstance(getattr(filters, name), type(uncovered))
+                  and name not in names)
+
+def targets(root):
+    '''
+    The elements of a page filters are applied to, by target
+    '''
+    body = root.find('body')
+    return {
+        'body'   : [body],
+        'tables' : body.find_class(pagegen.TABLE_WRAPPER_CLASS),
+        }
+
+def count_elems(elems):
+    return sum(1 for elem in elems for _ in elem.iter())
+
+def time_filter(root, name, params, repeat):
+    '''
+    Best time of applying one filter to a fresh copy of a page
+
+    @return : (seconds, number of elements filtered)
+    @rtype  : tuple
+
+    '''
+    import copy
+    import time
+    best = None
+    for _ in range(repeat + 1):
+        filters = {bench[0] : bench for bench in benchmarked(params)}
+        _, filt, target = filters[name]
+        elems = targets(copy.deepcopy(root))[target]
+        nelems = count_elems(elems)
+        start = time.perf_counter()
+        for elem in elems:
+            filt(elem)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, nelems
+
+def exponent(points):
+    '''
+    Least squares fit of log(time) to log(elements)
+
+    @param points : (elements, seconds) pairs
+    @type  points : list of tuple
+
+    @return       : Scaling exponent, or None if it cannot be fit
+    @rtype        : float
+
+    '''
+    import math
+    points = [(math.log(elems), math.log(seconds)) for elems, seconds in points if elems > 0 and seconds > 0]
+    if len(points) < 2:
+        return None
+    xmean = sum(x for x, _ in points) / len(points)
+    ymean = sum(y for _, y in points) / len(points)
+    spread = sum((x - xmean) ** 2 for x, _ in points)
+    if 0 == spread:
+        return None
+    return sum((x - xmean) * (y - ymean) for x, y in points) / spread
+
+def main(argv=None):
+    from lxml import html
+    args = get_args(argv)
+    support.stub_imgserve()
+    missing = uncovered()
+    if missing:
+        print('WARNING: no benchmark for filters: {}'.format(', '.join(missing)))
+    overrides = {key : getattr(args, key) for key in ('depth', 'noise') if getattr(args, key) is not None}
+    pages = []
+    for factor in args.sizes:
+        params = pagegen.scaled(factor, **overrides)
+        pages.append((factor, params, html.fromstring(pagegen.synthetic_page(**params))))
+    names = [name for name, _, _ in benchmarked(pages[0][1])
+             if args.only is None or args.only in name]
+    results = {}
+    flagged = []
+    print('{:<20} {}  {:>8}'.format('filter', ''.join('{:>18}'.format('x{} (ms, us/k)'.format(f)) for f in args.sizes), 'exponent'))
+    for name in names:
+        points = []
+        cells = []
+        for factor, params, root in pages:
+            seconds, nelems = time_filter(root, name, params, args.repeat)
+            points.append((nelems, seconds))
+            cells.append('{:>9.3f} {:>7.1f}'.format(seconds * 1000, seconds * 1e9 / max(nelems, 1)))
+            results['{}@x{}'.format(name, factor)] = {
+                'seconds'  : seconds,
+                'elems'    : nelems,
+                THROUGHPUT : nelems / seconds if seconds > 0 else 0,
+                }
+        fit = exponent(points)
+        mark = ''
+        if fit is not None and fit > args.superlinear:
+            mark = '  SUPERLINEAR'
+            flagged.append(name)
+        print('{:<20} {}  {:>8}{}'.format(name, ' '.join(cells), '-' if fit is None else '{:.2f}'.format(fit), mark))
+    if flagged:
+        print('Scaling worse than linearly: {}'.format(', '.join(flagged)))
+    return support.finish(args, results, THROUGHPUT)
+
+if '__main__' == __name__:
+    sys.exit(main())
@@ -0,0 +1,395 @@
+'''
+Load test of a mobile site against a local stand-in for the desktop site
+
+Runs three things on this machine, so no client site is touched:
+
+  - an origin: an HTTP/1.1 server with keep-alive, standing in for
+    the desktop site.  It serves synthetic pages (see
+    benchmarks.pagegen) of the given sizes and charset, after a delay
+    drawn from a latency distribution, and fails a given fraction of
+    requests with a 503.
+  - the mobile site, as mk_wsgi_application, served by a pre-forked
+    pool of worker processes sharing one listening socket, each
+    handling one request at a time - as under mod_wsgi with
+    threads=1.  (Moplate components keep the elements extracted for
+    the page being rendered, so a mobile site must not render two
+    pages at once in the same process.)  The environment gets
+    MWU_SRC_DOMAIN and REQUEST_URI, as the Apache configuration sets
+    them, pointing at the origin.
+  - a client, keeping a fixed number of requests in flight for a
+    fixed time.
+
+It reports throughput and latency percentiles of the mobile site,
+which can be saved as a baseline and compared against later (see
+benchmarks.support), to measure changes to connection handling,
+caching or concurrency.
+
+By default the mobile site renders every page with one moplate and
+the real siteskel templates; --msite names a module whose "msite"
+attribute is used instead, as in siteskel/apache/wsgiscript.py.
+
+Latency distributions are given as KIND:PARAMS, in seconds:
+
+  fixed:0.05           always 50ms
+  uniform:0.01,0.2     between 10 and 200ms
+  exp:0.05             exponential, with a mean of 50ms
+  lognormal:0.05,0.6   log-normal, with a median of 50ms and a sigma of 0.6
+
+  python3 -m benchmarks.loadtest --latency lognormal:0.05,0.6 --error-rate 0.01
+  python3 -m benchmarks.loadtest --workers 1 --concurrency 1 --duration 5
+
+The client opens a connection per request, as the stdlib WSGI server
+closes each one after its response.
+
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import signal
+import threading
+from benchmarks import support
+from benchmarks import pagegen
+
+#: Measurement compared against baselines
+THROUGHPUT = 'requests_per_sec'
+
+#: Text in every origin page outside of ASCII, so the charset matters
+NON_ASCII_TEXT = 'Café Zürich – ¿Qué tal?'
+
+def get_args(argv=None):
+    '''fetch arguments from commmand line'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Load test a mobile site against a local stand-in origin.')
+    parser.add_argument(
+        '--workers',
+        dest     = 'workers',
+        type     = int,
+        default  = 4,
+        help     = 'Worker processes serving the mobile site (default: %(default)s)',
+        )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        dest     = 'concurrency',
+        type     = int,
+        default  = 16,
+        help     = 'Requests kept in flight by the client (default: %(default)s)',
+        )
+    parser.add_argument(
+        '-d',
+        '--duration',
+        dest     = 'duration',
+        type     = float,
+        default  = 10,
+        help     = 'Seconds to run the load for (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--latency',
+        dest     = 'latency',
+        default  = 'fixed:0.05',
+        help     = 'Origin latency distribution (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--sizes',
+        dest     = 'sizes',
+        type     = int,
+        nargs    = '+',
+        default  = [1, 4],
+        help     = 'Size factors of the origin pages, picked at random per request (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--charset',
+        dest     = 'charset',
+        default  = 'utf-8',
+        help     = 'Charset of the origin pages (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--error-rate',
+        dest     = 'error_rate',
+        type     = float,
+        default  = 0,
+        help     = 'Fraction of origin requests failing with a 503 (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--msite',
+        dest     = 'msite',
+        default  = None,
+        help     = 'Module with the mobile site to test, as its "msite" attribute',
+        )
+    parser.add_argument(
+        '--seed',
+        dest     = 'seed',
+        type     = int,
+        default  = 0,
+        help     = 'Random seed of the origin (default: %(default)s)',
+        )
+    support.add_baseline_args(parser)
+    return parser.parse_args(argv)
+
+def latency_sampler(spec):
+    '''
+    Create a function drawing delays from a latency distribution
+
+    @param spec : Distribution, as KIND:PARAMS (see module docs)
+    @type  spec : str
+
+    @return     : Function taking a random.Random, returning seconds
+    @rtype      : callable
+
+    '''
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(value) for value in params.split(',')]
+    except ValueError:
+        raise ValueError('Bad latency distribution: {}'.format(spec))
+    if 'fixed' == kind and 1 == len(values):
+        return lambda rand: values[0]
+    if 'uniform' == kind and 2 == len(values):
+        return lambda rand: rand.uniform(*values)
+    if 'exp' == kind and 1 == len(values):
+        return lambda rand: rand.expovariate(1 / values[0]) if values[0] > 0 else 0
+    if 'lognormal' == kind and 2 == len(values):
+        import math
+        return lambda rand: rand.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError('Bad latency distribution: {}'.format(spec))
+
+def origin_pages(sizes, charset):
+    '''
+    The pages the origin serves, encoded
+
+    @return : Page bodies, one per size factor
+    @rtype  : list of bytes
+
+    '''
+    pages = []
+    for factor in sizes:
+        page = pagegen.synthetic_page(**pagegen.scaled(factor))
+        page = re.sub(r'(<body><div[^>]*>)', r'\1<p>{}</p>'.format(NON_ASCII_TEXT), page, count=1)
+        pages.append(page.encode(charset, 'xmlcharrefreplace'))
+    return pages
+
+def mk_origin_server(pages, charset, latency, error_rate, seed):
+    '''
+    Create the origin server, listening on a free port of localhost
+
+    @return : Server
+    @rtype  : http.server.ThreadingHTTPServer
+
+    '''
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    rand = random.Random(seed)
+    lock = threading.Lock()
+    class OriginHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with lock:
+                delay = latency(rand)
+                failed = rand.random() < error_rate
+                body = rand.choice(pages)
+            time.sleep(max(delay, 0))
+            if failed:
+                body = b'Service Unavailable'
+                self.send_response(503)
+                self.send_header('Content-Type', 'text/plain')
+            else:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset={}'.format(charset))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def log_message(self, format, *args):
+            pass
+    class OriginServer(ThreadingHTTPServer):
+        daemon_threads = True
+    return OriginServer(('127.0.0.1', 0), OriginHandler)
+
+def default_msite():
+    '''
+    Mobile site rendering every page with one moplate
+    '''
+    from mobilize import MobileSite, Domains, HandlerMap, Moplate, components
+    moplate = Moplate([
+            components.XPath('//body/div', idname='content'),
+            ], {'default_title' : 'Load test'}, name='loadtest')
+    class LoadTestSite(MobileSite):
+        img_srcset = True
+        img_lqip = 2
+        img_eager = 4
+    return LoadTestSite(Domains(mobile='127.0.0.1', desktop='127.0.0.1'), HandlerMap([('.', moplate)]))
+
+def load_msite(module_name):
+    import importlib
+    return importlib.import_module(module_name).msite
+
+def as_deployed(application, origin_host):
+    '''
+    Wrap the WSGI application, to get the environment Apache would give it
+    '''
+    def deployed(environ, start_response):
+        environ['MWU_SRC_DOMAIN'] = origin_host
+        uri = environ.get('PATH_INFO', '/')
+        if environ.get('QUERY_STRING'):
+            uri += '?' + environ['QUERY_STRING']
+        environ['REQUEST_URI'] = uri
+        return application(environ, start_response)
+    return deployed
+
+def mk_mobile_server(application):
+    '''
+    Create the mobile site server, listening on a free port of localhost
+
+    The server handles one request at a time; run several processes
+    of it for concurrency (see fork_servers).
+
+    @return : Server
+    @rtype  : wsgiref.simple_server.WSGIServer
+
+    '''
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+    class WorkerWSGIServer(WSGIServer):
+        request_queue_size = 128
+    return make_server('127.0.0.1', 0, application, server_class=WorkerWSGIServer, handler_class=QuietHandler)
+
+def fork_servers(server, count):
+    '''
+    Serve from child processes, all accepting on the server's socket
+
+    @return : Process IDs of the children
+    @rtype  : list of int
+
+    '''
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if 0 == pid:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    return pids
+
+def stop(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+def drive(host, port, path, concurrency, duration):
+    '''
+    Keep requests in flight against a server for a while
+
+    @return : (seconds, status or None on connection error, body bytes) per request
+    @rtype  : list of tuple
+
+    '''
+    import http.client
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    def client():
+        done = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = None
+            nbytes = 0
+            try:
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+                conn.request('GET', path)
+                resp = conn.getresponse()
+                nbytes = len(resp.read())
+                status = resp.status
+                conn.close()
+            except (OSError, http.client.HTTPException):
+                pass
+            done.append((time.perf_counter() - start, status, nbytes))
+        with lock:
+            samples.extend(done)
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+def percentile(ordered, fraction):
+    '''
+    Nearest-rank percentile of sorted values
+    '''
+    import math
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(samples, duration):
+    latencies = sorted(seconds for seconds, _, _ in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests'    : len(samples),
+        THROUGHPUT    : len(samples) / duration,
+        'errors'      : sum(1 for _, status, _ in samples if status is None or status >= 500),
+        'statuses'    : statuses,
+        'p50_sec'     : percentile(latencies, 0.5),
+        'p95_sec'     : percentile(latencies, 0.95),
+        'p99_sec'     : percentile(latencies, 0.99),
+        'max_sec'     : latencies[-1] if latencies else None,
+        'bytes_per_sec' : sum(nbytes for _, _, nbytes in samples) / duration,
+        }
+
+def report(result):
+    def ms(seconds):
+        return '-' if seconds is None else '{:.1f} ms'.format(seconds * 1000)
+    print('{} requests, {:.1f} req/sec, {:.0f} KiB/sec'.format(
+            result['requests'], result[THROUGHPUT], result['bytes_per_sec'] / 1024))
+    print('latency p50 {}  p95 {}  p99 {}  max {}'.format(
+            ms(result['p50_sec']), ms(result['p95_sec']), ms(result['p99_sec']), ms(result['max_sec'])))
+    print('statuses: {}  errors: {}'.format(
+            ', '.join('{} x{}'.format(status, count) for status, count in sorted(result['statuses'].items())),
+            result['errors']))
+
+def main(argv=None):
+    from mobilize.httputil import mk_wsgi_application
+    args = get_args(argv)
+    support.stub_imgserve()
+    latency = latency_sampler(args.latency)
+    origin = mk_origin_server(origin_pages(args.sizes, args.charset), args.charset, latency, args.error_rate, args.seed)
+    origin_host = '{}:{}'.format(*origin.server_address)
+    msite = default_msite() if args.msite is None else load_msite(args.msite)
+    mobile = mk_mobile_server(as_deployed(mk_wsgi_application(msite), origin_host))
+    # The origin gets its own process, so its work does not slow the client
+    pids = fork_servers(origin, 1)
+    pids += fork_servers(mobile, args.workers)
+    origin.server_close()
+    try:
+        print('origin {} ({}), mobile site 127.0.0.1:{} ({} workers), {} concurrent for {}s'.format(
+                origin_host, args.latency, mobile.server_port, args.workers, args.concurrency, args.duration))
+        started = time.perf_counter()
+        samples = drive('127.0.0.1', mobile.server_port, '/', args.concurrency, args.duration)
+        result = summarize(samples, time.perf_counter() - started)
+    finally:
+        stop(pids)
+        mobile.server_close()
+    report(result)
+    return support.finish(args, {'loadtest' : result}, THROUGHPUT)
+
+if '__main__' == __name__:
+    sys.exit(main())
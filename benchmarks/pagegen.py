@@ -0,0 +1,219 @@
+'''
+Synthetic desktop pages, of tunable size
+
+Pages are made of the things mobilize filters work on: nested divs,
+paragraphs with links (relative, absolute, and to downloadable
+files), images (sized, unsized, decorative spacers), runs of BR tags,
+layout tables, forms, and embedded players.  With "noise", elements
+also get the presentational and event handler attributes typical of
+old desktop sites.
+
+The same parameters and seed always make the same page.
+
+  from benchmarks.pagegen import synthetic_page, scaled
+  page = synthetic_page(**scaled(16))
+
+'''
+
+import random
+
+#: Size factors of the standard series of pages; content grows linearly with the factor
+SIZE_FACTORS = (1, 4, 16, 64)
+
+#: Class of the div wrapping each table
+TABLE_WRAPPER_CLASS = 'bench-table'
+
+#: Attributes added as noise, with the values to choose from
+_NOISE_ATTRIBS = {
+    'style'       : ('color: red', 'margin: 0 auto; width: 740px', 'font-size: 11px'),
+    'align'       : ('left', 'center', 'right'),
+    'valign'      : ('top', 'middle'),
+    'border'      : ('0', '1'),
+    'bgcolor'     : ('#ffffff', '#cccccc'),
+    'onclick'     : ('track(this)', 'return false;'),
+    'onmouseover' : ('hover(this)',),
+    'width'       : ('100%', '740', '50'),
+    }
+
+_WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+          'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore')
+
+def scaled(factor, **overrides):
+    '''
+    Page parameters growing linearly with a size factor
+
+    @param factor    : Size factor; 1 is a small page
+    @type  factor    : int
+
+    @param overrides : Parameters to use instead of the scaled ones
+    @type  overrides : dict
+
+    @return          : Keyword arguments of synthetic_page
+    @rtype           : dict
+
+    '''
+    params = {
+        'depth'      : 4,
+        'paragraphs' : 16 * factor,
+        'links'      : 24 * factor,
+        'images'     : 8 * factor,
+        'tables'     : 2,
+        'rows'       : 8 * factor,
+        'cols'       : 4,
+        'forms'      : factor,
+        'embeds'     : factor,
+        'noise'      : 0.5,
+        }
+    params.update(overrides)
+    return params
+
+def synthetic_page(depth=4, paragraphs=16, links=24, images=8, tables=2, rows=8, cols=4,
+                   forms=1, embeds=1, noise=0.5, seed=0):
+    '''
+    Create a synthetic desktop page
+
+    Content is spread over the leaves of a tree of nested divs, depth
+    levels deep.  Each table is wrapped in a div of class
+    TABLE_WRAPPER_CLASS.
+
+    @param depth      : Nesting depth of the divs holding the content
+    @type  depth      : int
+
+    @param paragraphs : Number of paragraphs
+    @type  paragraphs : int
+
+    @param links      : Number of links, spread over the paragraphs
+    @type  links      : int
+
+    @param images     : Number of images
+    @type  images     : int
+
+    @param tables     : Number of tables
+    @type  tables     : int
+
+    @param rows       : Rows per table
+    @type  rows       : int
+
+    @param cols       : Columns per table
+    @type  cols       : int
+
+    @param forms      : Number of forms
+    @type  forms      : int
+
+    @param embeds     : Number of embedded players (iframes and objects)
+    @type  embeds     : int
+
+    @param noise      : Probability of each element getting each noise attribute, from 0 to 1
+    @type  noise      : float
+
+    @param seed       : Random seed
+    @type  seed       : int
+
+    @return           : Page HTML
+    @rtype            : str
+
+    '''
+    rand = random.Random(seed)
+    gen = _Generator(rand, noise)
+    blocks = []
+    for ii in range(paragraphs):
+        blocks.append(gen.paragraph(links // paragraphs + (1 if ii < links % paragraphs else 0)))
+    for ii in range(images):
+        blocks.append(gen.image(ii))
+    for ii in range(tables):
+        blocks.append('<div class="{}">{}</div>'.format(TABLE_WRAPPER_CLASS, gen.table(rows, cols)))
+    for ii in range(forms):
+        blocks.append(gen.form(ii))
+    for ii in range(embeds):
+        blocks.append(gen.embed(ii))
+    rand.shuffle(blocks)
+    return '<!DOCTYPE html>\n<html><head><title>Synthetic page</title></head>\n<body>{}</body></html>\n'.format(
+        gen.nest(blocks, depth))
+
+class _Generator:
+    def __init__(self, rand, noise):
+        self.rand = rand
+        self.noise = noise
+        self.ids = 0
+
+    def attribs(self, **given):
+        attrs = dict(given)
+        for name, values in _NOISE_ATTRIBS.items():
+            if name not in attrs and self.rand.random() < self.noise:
+                attrs[name] = self.rand.choice(values)
+        if self.rand.random() < self.noise:
+            self.ids += 1
+            attrs['id'] = 'n{}'.format(self.ids)
+        return ''.join(' {}="{}"'.format(name, value) for name, value in attrs.items())
+
+    def text(self, nwords):
+        return ' '.join(self.rand.choice(_WORDS) for _ in range(nwords))
+
+    def link(self):
+        kind = self.rand.randrange(4)
+        if 0 == kind:
+            href = '/page/{}.html'.format(self.rand.randrange(1000))
+        elif 1 == kind:
+            href = 'http://www.example.com/section/{}/'.format(self.rand.randrange(100))
+        elif 2 == kind:
+            href = 'docs/report-{}.pdf'.format(self.rand.randrange(100))
+        else:
+            href = 'https://other.example.org/?q={}'.format(self.rand.randrange(100))
+        return '<a{}>{}</a>'.format(self.attribs(href=href), self.text(2))
+
+    def paragraph(self, nlinks):
+        parts = [self.text(self.rand.randint(5, 15))]
+        for _ in range(nlinks):
+            parts.append(self.link())
+            parts.append(self.text(self.rand.randint(1, 5)))
+        if self.rand.random() < 0.5:
+            # Layout by line breaks
+            parts.append('<br>' * self.rand.randint(1, 3) + self.text(3))
+        return '<p{}>{}</p>'.format(self.attribs(), ' '.join(parts))
+
+    def image(self, ii):
+        if 0 == ii % 5:
+            return '<img{}>'.format(self.attribs(src='/images/spacer.gif', width='1', height='1', alt=''))
+        attrs = {'src' : '/images/photo-{}.jpg'.format(ii), 'alt' : self.text(2)}
+        if ii % 3:
+            attrs['width'] = str(self.rand.choice((120, 300, 640, 1024)))
+            attrs['height'] = str(self.rand.choice((80, 200, 480, 768)))
+        return '<img{}>'.format(self.attribs(**attrs))
+
+    def table(self, rows, cols):
+        trs = []
+        for row in range(rows):
+            tds = []
+            for col in range(cols):
+                if self.rand.random() < 0.15:
+                    content = '&nbsp;'
+                elif self.rand.random() < 0.2:
+                    content = self.link()
+                else:
+                    content = self.text(self.rand.randint(1, 6))
+                tds.append('<td{}>{}</td>'.format(self.attribs(), content))
+            trs.append('<tr{}>{}</tr>'.format(self.attribs(), ''.join(tds)))
+        return '<table{}><tbody>{}</tbody></table>'.format(self.attribs(), ''.join(trs))
+
+    def form(self, ii):
+        return ('<form{}>'
+                '<input type="text" name="q{}" size="40"><input type="email" name="email" size="30">'
+                '<textarea name="msg" cols="60" rows="10"></textarea><input type="submit" value="Go">'
+                '</form>').format(self.attribs(action='/search.php', method='get'), ii)
+
+    def embed(self, ii):
+        if ii % 2:
+            return '<object width="640" height="390" data="http://www.youtube.com/v/video{}"></object>'.format(ii)
+        return '<iframe{}></iframe>'.format(self.attribs(src='http://player.example.com/embed/{}'.format(ii), width='640', height='360'))
+
+    def nest(self, blocks, depth):
+        '''
+        Spread blocks over a tree of divs, depth levels deep
+        '''
+        if depth <= 1 or len(blocks) <= 1:
+            return '<div{}>{}</div>'.format(self.attribs(), ''.join(blocks))
+        fanout = self.rand.randint(2, 4)
+        step = -(-len(blocks) // fanout)
+        children = [self.nest(blocks[start:start + step], depth - 1)
+                    for start in range(0, len(blocks), step)]
+        return '<div{}>{}</div>'.format(self.attribs(), ''.join(children))
@@ -0,0 +1,280 @@
+'''
+End-to-end rendering benchmark
+
+Renders desktop pages into mobile pages with representative
+moplates, as the Moplate handler does for a request once the source
+page has been fetched: parsing, extracting XPath and CssPath
+components, running component, moplate and site filters (table
+filters, to_imgserve with a stubbed ImgDb, link rewriting), and
+rendering the real templates from siteskel.
+
+The corpus is the whole-page test data, plus an inflated copy of the
+largest page, standing in for the big pages that are slowest to
+mobilize.  Pages in another directory can be added with --corpus;
+they are rendered with a generic moplate.
+
+For each page, the benchmark reports pages per second, and the mean
+time of each stage of the rendering (see mobilize.timing).
+
+  python3 -m benchmarks.render
+  python3 -m benchmarks.render --save-baseline /tmp/render.json
+  # ... make a change ...
+  python3 -m benchmarks.render --baseline /tmp/render.json
+
+'''
+
+import os
+import sys
+from benchmarks import support
+
+#: Directory of the standard corpus
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), '..', 'mobilize', 'tests', 'data', 'whole-html')
+
+#: Measurement compared against baselines
+THROUGHPUT = 'pages_per_sec'
+
+def get_args(argv=None):
+    '''fetch arguments from commmand line'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the rendering of mobile pages.')
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        dest     = 'repeat',
+        type     = int,
+        default  = 20,
+        help     = 'Number of timed renderings of each page (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--corpus',
+        dest     = 'corpus',
+        default  = None,
+        help     = 'Directory of additional desktop pages (*.html) to render',
+        )
+    parser.add_argument(
+        '-k',
+        dest     = 'only',
+        default  = None,
+        help     = 'Only run cases whose name contains this string',
+        )
+    support.add_baseline_args(parser)
+    return parser.parse_args(argv)
+
+# Moplates of the corpus pages
+
+def cnn_moplate():
+    from mobilize import Moplate, components, filters
+    return Moplate([
+            components.CssPath('#cnn_hdr-nav', idname='nav', postfilters=[filters.squeezebr]),
+            components.XPath('//div[contains(@class, "cnn_sectbin")]', idname='sections',
+                             postfilters=[filters.nodecorativeimg, filters.noembeds]),
+            components.CssPath('#cnn_ftrcntnt', idname='footer', postfilters=[filters.nobr]),
+            components.GoogleAnalytics(),
+            ], {'default_title' : 'CNN'}, name='cnn')
+
+def luxwny_moplate():
+    from functools import partial
+    from mobilize import Moplate, components, filters
+    residents = filters.Spec('residents', 0, 0, 4, 1)
+    return Moplate([
+            components.XPath('//*[@id="allNav"]', idname='nav', postfilters=[filters.table2divs]),
+            components.CssPath('#communityTable', idname='communities', postfilters=[filters.table2divrows]),
+            components.CssPath('#residentsTable', idname='residents',
+                               postfilters=[partial(filters.table2divgroups, specmap=[residents])]),
+            components.XPath('//*[@id="content"]', idname='content', postfilters=[filters.formcontroltypes]),
+            components.GoogleAnalytics(),
+            ], name='luxwny')
+
+def msia_moplate():
+    from mobilize import Moplate, components, filters
+    return Moplate([
+            components.XPath('//*[@id="main_nav"]', idname='nav'),
+            components.CssPath('#quicklinks', idname='quicklinks', optional=True),
+            components.CssPath('#content', idname='content',
+                               postfilters=[filters.noimgsize, filters.resizeobject, filters.formcontroltypes]),
+            components.GoogleAnalytics(),
+            ], name='msia')
+
+def generic_moplate():
+    from mobilize import Moplate, components
+    return Moplate([
+            components.XPath('//body', idname='body', innerhtml=True),
+            ], name='generic')
+
+class Case:
+    '''
+    A page to render, and the moplate to render it with
+    '''
+    def __init__(self, name, path, mk_moplate, inflate=1):
+        self.name = name
+        self.path = path
+        self.mk_moplate = mk_moplate
+        self.inflate = inflate
+
+    def page(self):
+        with open(self.path, 'rb') as handle:
+            page = handle.read().decode('utf-8', 'replace')
+        if self.inflate > 1:
+            page = inflated(page, self.inflate)
+        return page
+
+def inflated(page, times):
+    '''
+    A page with the content of its body repeated
+    '''
+    import copy
+    from lxml import html
+    doc = html.fromstring(page)
+    body = doc.find('body')
+    children = list(body)
+    for _ in range(times - 1):
+        for child in children:
+            body.append(copy.deepcopy(child))
+    return html.tostring(doc, encoding='unicode')
+
+def cases(corpus=None):
+    '''
+    The benchmark cases, in order
+
+    @param corpus : Directory of additional pages
+    @type  corpus : str
+
+    @return       : Cases
+    @rtype        : list of Case
+
+    '''
+    def standard(filename):
+        return os.path.join(CORPUS_DIR, filename)
+    found = [
+        Case('cnn', standard('cnn.html'), cnn_moplate),
+        Case('cnn-x8', standard('cnn.html'), cnn_moplate, inflate=8),
+        Case('luxwny', standard('luxwny.html'), luxwny_moplate),
+        Case('msia', standard('msia.org.html'), msia_moplate),
+        Case('msia-2', standard('msia.org.2.html'), msia_moplate),
+        ]
+    if corpus is not None:
+        for filename in sorted(os.listdir(corpus)):
+            if filename.endswith('.html'):
+                found.append(Case(filename[:-len('.html')], os.path.join(corpus, filename), generic_moplate))
+    return found
+
+def bench_site():
+    '''
+    Mobile site whose filters are used for every page
+    '''
+    from mobilize import MobileSite, Domains
+    class BenchSite(MobileSite):
+        img_srcset = True
+        img_lqip = 2
+        img_eager = 4
+    return BenchSite(Domains(mobile='m.example.com', desktop='www.example.com'), [])
+
+def mk_render(msite, moplate, page, timed):
+    '''
+    A function rendering the page once, as the Moplate handler does
+
+    If timed, each rendering records its stages in new timings, kept
+    in the list returned along with the function.
+    '''
+    from mobilize.httputil import RequestInfo
+    from mobilize.timing import Timings
+    environ = {
+        'REQUEST_METHOD'  : 'GET',
+        'REQUEST_URI'     : '/',
+        'PATH_INFO'       : '/',
+        'QUERY_STRING'    : '',
+        'HTTP_HOST'       : msite.domains.mobile,
+        'wsgi.url_scheme' : 'http',
+        }
+    params = {
+        'fullsite'     : msite.fullsite,
+        'request_path' : '/',
+        'todesktop'    : 'http://{}/?mredir=0'.format(msite.fullsite),
+        'lite'         : None,
+        }
+    recorded = []
+    def render():
+        reqinfo = RequestInfo(environ)
+        if timed:
+            reqinfo.timings = Timings()
+            recorded.append(reqinfo.timings)
+        moplate.render(page, params, msite.mk_site_filters(params), reqinfo)
+    return render, recorded
+
+def stage_means(recorded):
+    '''
+    Mean seconds of each stage, over a number of renderings
+
+    Component stages are summed over components, and filter stages
+    by filter, as "filter <name>".
+    '''
+    totals = {}
+    def add(name, seconds):
+        totals[name] = totals.get(name, 0) + seconds
+    for timings in recorded:
+        record = timings.record()
+        for name, seconds in record['stages'].items():
+            add(name, seconds)
+        for component in record['components'].values():
+            for name, seconds in component.items():
+                if 'filters' == name:
+                    for filtname, filtseconds in seconds.items():
+                        add('filter ' + filtname, filtseconds)
+                else:
+                    add(name, seconds)
+    return {name : total / len(recorded) for name, total in totals.items()}
+
+def run_case(msite, case, repeat):
+    '''
+    Benchmark one case
+
+    Throughput is measured without timings, so that their overhead
+    does not count; the stage breakdown comes from separate, timed
+    renderings.
+
+    @return : Results of the case
+    @rtype  : dict
+
+    '''
+    import statistics
+    moplate = case.mk_moplate()
+    page = case.page()
+    render, _ = mk_render(msite, moplate, page, timed=False)
+    times = support.measure(render, repeat)
+    render, recorded = mk_render(msite, moplate, page, timed=True)
+    support.measure(render, max(1, repeat // 4), warmup=0)
+    median = statistics.median(times)
+    return {
+        'page_bytes'    : len(page.encode('utf-8')),
+        'median_sec'    : median,
+        'min_sec'       : min(times),
+        THROUGHPUT      : 1 / median,
+        'stages'        : stage_means(recorded),
+        }
+
+def report(name, result):
+    print('{:<12} {:>8.1f} pages/sec  median {:7.2f} ms  min {:7.2f} ms  {:>7} bytes'.format(
+            name, result[THROUGHPUT], result['median_sec'] * 1000, result['min_sec'] * 1000, result['page_bytes']))
+    stages = result['stages']
+    for stage in ('parse', 'extract', 'process', 'html', 'template'):
+        if stage in stages:
+            print('    {:<48} {:8.3f} ms'.format(stage, stages[stage] * 1000))
+    # Filters are part of process; slowest first
+    filts = sorted((item for item in stages.items() if item[0].startswith('filter ')), key=lambda item: -item[1])
+    for stage, seconds in filts:
+        print('      {:<46} {:8.3f} ms'.format(stage, seconds * 1000))
+
+def main(argv=None):
+    args = get_args(argv)
+    support.stub_imgserve()
+    msite = bench_site()
+    results = {}
+    for case in cases(args.corpus):
+        if args.only is not None and args.only not in case.name:
+            continue
+        results[case.name] = run_case(msite, case, args.repeat)
+        report(case.name, results[case.name])
+    return support.finish(args, results, THROUGHPUT)
+
+if '__main__' == __name__:
+    sys.exit(main())
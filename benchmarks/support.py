@@ -0,0 +1,185 @@
+'''
+Code shared by the benchmarks
+
+BASELINES
+
+A benchmark's results are a dict of cases, by name; each case is a
+dict of measurements, including a throughput (higher is better).
+Saved as a baseline, a later run compares its throughputs against
+those of the same cases, and fails if any dropped by more than a
+threshold fraction.  Baselines are only comparable on the machine
+they were recorded on, so they are not kept in the source tree:
+record one before making a change, then check the change against it.
+
+'''
+
+import sys
+import time
+
+#: Default allowed drop in throughput, as a fraction of the baseline
+DEFAULT_THRESHOLD = 0.15
+
+class StubImgDb:
+    '''
+    Stand-in for imgserve.ImgDb, the database of measured source images
+
+    Records are made up from the image URL, so they are the same on
+    every run: most images are known, with their dimensions and a
+    placeholder, and the rest are not.
+    '''
+    #: One in this many images is not known
+    miss_every = 4
+
+    def get(self, src):
+        import zlib
+        from mobilize.images import LQIP_KEY
+        key = zlib.crc32(src.encode('utf-8'))
+        if 0 == key % self.miss_every:
+            return None
+        return {
+            'width'  : 100 + key % 900,
+            'height' : 50 + (key >> 10) % 600,
+            LQIP_KEY : 'data:image/jpeg;base64,/9j/4AAQSkZJRgABAQ',
+            }
+
+def normalize_img_size(value):
+    '''
+    Stand-in for imgserve.normalize_img_size: an img tag dimension as a positive int, or None
+    '''
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value.endswith('px'):
+        value = value[:-2]
+    try:
+        size = int(value)
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+def stub_imgserve():
+    '''
+    Install stand-ins for the imgserve module, used by the to_imgserve filter
+
+    The real module looks up images in a shared database, which would
+    make the benchmarks measure that database rather than mobilize.
+    '''
+    import types
+    module = types.ModuleType('imgserve')
+    module.ImgDb = StubImgDb
+    module.normalize_img_size = normalize_img_size
+    sys.modules['imgserve'] = module
+
+def measure(func, repeat, warmup=1):
+    '''
+    Time repeated calls of a function
+
+    @param func   : Function to time, taking no arguments
+    @type  func   : callable
+
+    @param repeat : Number of timed calls
+    @type  repeat : int
+
+    @param warmup : Number of untimed calls made first
+    @type  warmup : int
+
+    @return       : Seconds taken by each timed call
+    @rtype        : list of float
+
+    '''
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def add_baseline_args(parser):
+    '''
+    Add the baseline options to a benchmark's command line parser
+    '''
+    parser.add_argument(
+        '--save-baseline',
+        dest     = 'save_baseline',
+        metavar  = 'PATH',
+        default  = None,
+        help     = 'Save the results as a baseline JSON file',
+        )
+    parser.add_argument(
+        '--baseline',
+        dest     = 'baseline',
+        metavar  = 'PATH',
+        default  = None,
+        help     = 'Compare the results against a baseline JSON file, failing on regressions',
+        )
+    parser.add_argument(
+        '--threshold',
+        dest     = 'threshold',
+        type     = float,
+        default  = DEFAULT_THRESHOLD,
+        help     = 'Allowed drop in throughput, as a fraction of the baseline (default: %(default)s)',
+        )
+
+def save_baseline(path, results):
+    import json
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+def load_baseline(path):
+    import json
+    with open(path) as handle:
+        return json.load(handle)
+
+def regressions(baseline, results, key, threshold):
+    '''
+    Cases whose throughput dropped by more than the threshold
+
+    Cases missing from either the baseline or the results are ignored.
+
+    @param baseline  : Baseline results
+    @type  baseline  : dict: str -> dict
+
+    @param results   : Current results
+    @type  results   : dict: str -> dict
+
+    @param key       : Measurement key of the throughput of each case
+    @type  key       : str
+
+    @param threshold : Allowed drop, as a fraction of the baseline
+    @type  threshold : float
+
+    @return          : (case name, baseline throughput, current throughput) triples
+    @rtype           : list of tuple
+
+    '''
+    found = []
+    for name in sorted(set(baseline) & set(results)):
+        before = baseline[name][key]
+        after = results[name][key]
+        if after < before * (1 - threshold):
+            found.append((name, before, after))
+    return found
+
+def finish(args, results, key):
+    '''
+    Save or check the baseline, as requested on the command line
+
+    @return : Process exit status
+    @rtype  : int
+
+    '''
+    if args.save_baseline is not None:
+        save_baseline(args.save_baseline, results)
+        print('Saved baseline to {}'.format(args.save_baseline))
+    if args.baseline is None:
+        return 0
+    found = regressions(load_baseline(args.baseline), results, key, args.threshold)
+    for name, before, after in found:
+        print('REGRESSION {}: {} {:.1f} -> {:.1f} ({:+.1%})'.format(name, key, before, after, after / before - 1))
+    if found:
+        return 1
+    print('No regressions over {:.0%} against {}'.format(args.threshold, args.baseline))
+    return 0
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+'''
+Profile the rendering of a saved page by a mobile site's moplate
+
+Picks the handler the site maps the URL path to, renders the page
+with it a number of times, and prints where the time goes: parsing,
+extracting and processing each component, each filter within, each
+component's HTML, and the template (see mobilize.timing).  No request
+is made to the source site.
+
+  bin/profile_moplate.py -I /var/www/m.example.com /products/ products.html
+  bin/profile_moplate.py -I /var/www/m.example.com -n 50 -H 'Save-Data: on' /products/ products.html
+
+'''
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def get_args():
+    '''fetch arguments from commmand line'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Time the rendering of a saved page by the moplate of a URL path.')
+    parser.add_argument(
+        'url',
+        help     = 'Relative URL of the page on the mobile site, e.g. /products/',
+        )
+    parser.add_argument(
+        'page',
+        help     = 'Saved HTML of the desktop page',
+        )
+    parser.add_argument(
+        '-I',
+        '--include',
+        dest     = 'include',
+        action   = 'append',
+        default  = [],
+        help     = 'Directory to add to the module path, e.g. that of the mobile site (repeatable)',
+        )
+    parser.add_argument(
+        '-m',
+        '--msite',
+        dest     = 'msite',
+        default  = 'msite',
+        help     = 'Module defining the mobile site, as "msite" (default: %(default)s)',
+        )
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        dest     = 'repeat',
+        type     = int,
+        default  = 10,
+        help     = 'Number of timed renderings (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--warmup',
+        dest     = 'warmup',
+        type     = int,
+        default  = 1,
+        help     = 'Number of untimed renderings first (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--charset',
+        dest     = 'charset',
+        default  = None,
+        help     = 'Charset of the saved page (default: from the page, else the site default)',
+        )
+    parser.add_argument(
+        '-H',
+        '--header',
+        dest     = 'headers',
+        action   = 'append',
+        default  = [],
+        help     = 'Request header, as "Name: value" (repeatable)',
+        )
+    return parser.parse_args()
+
+def mk_environ(msite, url, headers):
+    '''
+    WSGI environment of a GET request for the URL on the mobile site
+    '''
+    path, _, querystring = url.partition('?')
+    environ = {
+        'REQUEST_METHOD'  : 'GET',
+        'REQUEST_URI'     : url,
+        'PATH_INFO'       : path,
+        'QUERY_STRING'    : querystring,
+        'HTTP_HOST'       : msite.domains.mobile,
+        'SERVER_PORT'     : '80',
+        'wsgi.url_scheme' : 'http',
+        }
+    for header in headers:
+        name, _, value = header.partition(':')
+        environ['HTTP_' + name.strip().upper().replace('-', '_')] = value.strip()
+    return environ
+
+def rows(records):
+    '''
+    Table rows: (label, seconds of each rendering, output bytes or None)
+    '''
+    def seconds(get):
+        return [get(record) or 0 for record in records]
+    first = records[0]
+    found = [('parse', seconds(lambda record: record['stages'].get('parse')), None)]
+    for component_id, times in first['components'].items():
+        def component(record):
+            return record['components'].get(component_id, {})
+        for name in ('extract', 'process'):
+            if name in times:
+                found.append(('{} {}'.format(component_id, name),
+                              seconds(lambda record: component(record).get(name)), None))
+            if 'process' == name:
+                for filtname in times['filters']:
+                    found.append(('    {}'.format(filtname),
+                                  seconds(lambda record: component(record)['filters'].get(filtname)), None))
+        found.append(('{} html'.format(component_id), seconds(lambda record: component(record).get('html')),
+                      first['component_bytes'].get(component_id)))
+    found.append(('template', seconds(lambda record: record['stages'].get('template')), None))
+    found.append(('total', seconds(lambda record: record['stages']['render']), first['output_bytes']))
+    return found
+
+def report(records):
+    import statistics
+    found = rows(records)
+    total = statistics.mean(found[-1][1])
+    print('{:<64} {:>9} {:>9} {:>6} {:>9}'.format('stage', 'mean ms', 'min ms', '%', 'bytes'))
+    for label, seconds, nbytes in found:
+        mean = statistics.mean(seconds)
+        print('{:<64} {:9.3f} {:9.3f} {:6.1f} {:>9}'.format(
+                label, mean * 1000, min(seconds) * 1000, 100 * mean / total if total else 0,
+                '' if nbytes is None else nbytes))
+
+def main(args):
+    import importlib
+    from mobilize import httputil
+    from mobilize.exceptions import NoMatchingHandlerException
+    from mobilize.handlers import Moplate
+    from mobilize.timing import Timings
+    sys.path.extend(args.include)
+    msite = importlib.import_module(args.msite).msite
+    try:
+        handler = msite.handler_map.get_handler_for(args.url)
+    except NoMatchingHandlerException:
+        print('{} matches no handler of the site; it would be passed through'.format(args.url), file=sys.stderr)
+        return 1
+    if not isinstance(handler, Moplate):
+        print('{} is handled by {}, which is not a moplate'.format(args.url, handler.name), file=sys.stderr)
+        return 1
+    print('{} is rendered by moplate {}'.format(args.url, handler.name))
+    with open(args.page, 'rb') as handle:
+        page_bytes = handle.read()
+    charset = args.charset or httputil.guess_charset({}, page_bytes, msite.default_charset)
+    page = httputil.netbytes2str(page_bytes, charset)
+    environ = mk_environ(msite, args.url, args.headers)
+    records = []
+    for ii in range(args.warmup + args.repeat):
+        request_environ = dict(environ)
+        reqinfo = httputil.RequestInfo(request_environ)
+        reqinfo.timings = Timings()
+        extra_params = handler.render_params(request_environ, msite, reqinfo)
+        with reqinfo.timings.stage('render'):
+            rendered = handler.render(page, extra_params, msite.mk_site_filters(extra_params), reqinfo)
+        reqinfo.timings.note(output_bytes=len(rendered.encode('utf-8')))
+        if ii >= args.warmup:
+            records.append(reqinfo.timings.record())
+    print('{} bytes in, {} DOM nodes, {} renderings'.format(len(page_bytes), records[0].get('dom_nodes', 0), len(records)))
+    report(records)
+    return 0
+
+if '__main__' == __name__:
+    sys.exit(main(get_args()))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+'''
+Render captured pages again, offline (see mobilize.capture)
+
+Each capture is rendered through the moplate the mobile site now maps
+its URL to, without contacting the source site.  Use it to profile or
+time rendering on real pages, or to check what a change to moplates or
+to mobilize does to their output:
+
+  bin/replay.py -I /var/www/m.example.com -o /tmp/before captures/
+  # ... make the change ...
+  bin/replay.py -I /var/www/m.example.com --compare /tmp/before --diff captures/
+
+'''
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def get_args():
+    '''fetch arguments from commmand line'''
+    import argparse
+    parser = argparse.ArgumentParser(description='Render captured requests through the mobile site, offline.')
+    parser.add_argument(
+        'captures',
+        nargs    = '+',
+        help     = 'Capture files, or directories of them',
+        )
+    parser.add_argument(
+        '-I',
+        '--include',
+        dest     = 'include',
+        action   = 'append',
+        default  = [],
+        help     = 'Directory to add to the module path, e.g. that of the mobile site (repeatable)',
+        )
+    parser.add_argument(
+        '-m',
+        '--msite',
+        dest     = 'msite',
+        default  = 'msite',
+        help     = 'Module defining the mobile site, as "msite" (default: %(default)s)',
+        )
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        dest     = 'repeat',
+        type     = int,
+        default  = 1,
+        help     = 'Number of times to render each capture (default: %(default)s)',
+        )
+    parser.add_argument(
+        '--profile',
+        dest     = 'profile',
+        metavar  = 'PATH',
+        default  = None,
+        help     = 'Profile the renderings with cProfile, writing pstats to this file',
+        )
+    parser.add_argument(
+        '-o',
+        '--output-dir',
+        dest     = 'output_dir',
+        default  = None,
+        help     = 'Write each rendered page to this directory, named after the capture',
+        )
+    parser.add_argument(
+        '--compare',
+        dest     = 'compare',
+        metavar  = 'DIR',
+        default  = None,
+        help     = 'Compare each rendered page to the one written to this directory by --output-dir',
+        )
+    parser.add_argument(
+        '--diff',
+        dest     = 'diff',
+        action   = 'store_true',
+        default  = False,
+        help     = 'With --compare, print a unified diff of each changed page',
+        )
+    return parser.parse_args()
+
+def output_path(output_dir, capture):
+    return os.path.join(output_dir, capture.name + '.html')
+
+def compare(compare_dir, capture, rendered, show_diff):
+    '''
+    Compare a rendered page to an earlier rendering of it
+
+    @return : 'same', 'changed', or 'new' if there is no earlier rendering
+    @rtype  : str
+
+    '''
+    path = output_path(compare_dir, capture)
+    if not os.path.exists(path):
+        return 'new'
+    with open(path, encoding='utf-8') as handle:
+        before = handle.read()
+    if before == rendered:
+        return 'same'
+    if show_diff:
+        import difflib
+        sys.stdout.writelines(difflib.unified_diff(
+                before.splitlines(True), rendered.splitlines(True), path, capture.name))
+    return 'changed'
+
+def main(args):
+    import time
+    import statistics
+    import importlib
+    from mobilize import capture as mcapture
+    sys.path.extend(args.include)
+    msite = importlib.import_module(args.msite).msite
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    changed = 0
+    counts = {}
+    for path in mcapture.capture_paths(args.captures):
+        capture = mcapture.load(path)
+        times = []
+        rendered = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                rendered = mcapture.replay(msite, capture)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            times.append(time.perf_counter() - start)
+        if rendered is None:
+            status = 'skipped'
+            print('{:<64} {}'.format(capture.name, 'no moplate'))
+        else:
+            status = 'rendered'
+            if args.output_dir is not None:
+                with open(output_path(args.output_dir, capture), 'w', encoding='utf-8') as handle:
+                    handle.write(rendered)
+            if args.compare is not None:
+                status = compare(args.compare, capture, rendered, args.diff)
+                if 'changed' == status:
+                    changed += 1
+            print('{:<64} {:8.2f} ms {:>8} -> {:>8} bytes  {}'.format(
+                    capture.name, statistics.median(times) * 1000, len(capture.body),
+                    len(rendered.encode('utf-8')), status))
+        counts[status] = counts.get(status, 0) + 1
+    print(', '.join('{} {}'.format(count, status) for status, count in sorted(counts.items())))
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        print('Wrote profile to {}'.format(args.profile))
+    return 1 if changed else 0
+
+if '__main__' == __name__:
+    sys.exit(main(get_args()))
@@ -15,6 +15,7 @@ from .handlers import (
     todesktop,
     passthrough,
     Moplate,
+    MultiSourceMoplate,
     )
 
 MOBILIZE_ROOT = os.path.dirname(__file__)
@@ -23,5 +24,6 @@ SITESKEL_ROOT = os.path.join(MOBILIZE_ROOT, '..', 'siteskel')
 __all__ = [
     'MobileSite',
     'Moplate',
+    'MultiSourceMoplate',
     'Domains',
     ]
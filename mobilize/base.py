@@ -150,6 +150,87 @@ class MobileSite:
 
     #: Whether to fake certain HTTP HEAD requests
     fake_head_requests = True
+
+    #: Whether imgserve images get responsive srcset/sizes attributes
+    img_srcset = False
+
+    #: Number of images, from the top of each page, to show low-quality placeholders for (see mobilize.images.ImgServe)
+    img_lqip = 0
+
+    #: Number of images, from the top of each page, to load eagerly; later ones are lazy-loaded.  None disables lazy loading.
+    img_eager = None
+
+    #: Whether to size images from the DPR and viewport width client
+    #: hints.  Mobilized responses then carry Accept-CH, and Vary on
+    #: those hints, so any cache in front of the mobile site must
+    #: honor Vary (see mobilize.images.img_sizing).
+    client_hints = False
+
+    #: Lite mode settings, for visitors with constrained connections; or None to disable lite mode (see mobilize.lite)
+    lite_profile = None
+
+    #: Maximum size of POST/PUT request bodies, in bytes; or None for no limit.  Larger requests get a 413 response.
+    max_request_body = None
+
+    #: Path of the internal metrics page, such as '/_mwu/metrics' (see mobilize.metrics); or None to disable it
+    metrics_path = None
+
+    #: Client addresses allowed to read the metrics page
+    metrics_allow = ('127.0.0.1', '::1')
+
+    #: Directory to write request profiles to (see mobilize.profiling); or None to disable profiling
+    profile_dir = None
+
+    #: Profile one in this many requests; 0 to only profile on request
+    profile_sample = 0
+
+    #: Secret signing profiling tokens; or None to disable profiling on request
+    profile_secret = None
+
+    #: Client addresses allowed to request a profile
+    profile_allow = ('127.0.0.1', '::1')
+
+    #: Profiler to use: 'cprofile', or 'sample' for the statistical sampler
+    profile_mode = 'cprofile'
+
+    #: Path of the slow request log (see mobilize.timing); or None to disable it
+    slow_request_log = None
+
+    #: Minimum time of requests written to the slow request log, in seconds
+    slow_request_threshold = 1.0
+
+    #: Path of the file to write request traces to (see mobilize.tracing); or None to disable tracing
+    trace_file = None
+
+    #: Directory to save captures of requests to, for offline replay (see mobilize.capture); or None to disable capturing
+    capture_dir = None
+
+    #: Capture one in this many mobilizeable requests
+    capture_sample = 1000
+
+    #: Stop capturing once the capture directory holds this many captures; or None for no limit
+    capture_limit = 1000
+
+    #: Number of component fragments to cache, for cacheable components (see mobilize.fragcache); 0 to disable the cache
+    fragment_cache_size = 0
+
+    #: Stock request header transformations (a mobilize.headers.HeaderPlan); None for the standard ones
+    request_header_plan = None
+
+    #: Stock response header transformations (a mobilize.headers.HeaderPlan); None for the standard ones
+    response_header_plan = None
+
+    #: Compiled security hooks (see security_rules)
+    _security_rules = None
+
+    #: Slow request log (see slow_log)
+    _slow_log = None
+
+    #: Trace exporter (see tracer)
+    _tracer = None
+
+    #: Fragment cache (see fragment_cache)
+    _fragment_cache = None
     
     def __init__(self,
                  domains,
@@ -184,6 +265,12 @@ class MobileSite:
 
         This list can be altered or added to by subclasses.
 
+        If params has "img_maxw" or "img_dpr" keys (set when the site
+        uses client hints), they determine image sizing for the
+        to_imgserve filter.  If params has a "lite" key other than
+        None, it is the lite profile applying to this request, which
+        caps image sizes further and appends its own filters.
+
         @param params : Site-level template parameters
         @type  params : dict
         
@@ -191,17 +278,38 @@ class MobileSite:
         @rtype        : list of callable
         
         '''
-        from mobilize.images import to_imgserve
+        from mobilize.images import ImgServe
+        imgserve_options = {
+            'srcset' : self.img_srcset,
+            'lqip'   : self.img_lqip,
+            'eager'  : self.img_eager,
+            }
+        if 'img_maxw' in params:
+            imgserve_options['default_maxw'] = params['img_maxw']
+        if 'img_dpr' in params:
+            imgserve_options['dpr'] = params['img_dpr']
+        lite = params.get('lite')
+        if lite is not None:
+            imgserve_options.update(
+                srcset = False,
+                default_maxw = min(lite.maxw, imgserve_options.get('default_maxw', lite.maxw)),
+                dpr = 1,
+                )
+        # Partials rather than lambdas, so each filter keeps a
+        # readable name in timings (see mobilize.timing.callable_name)
+        from functools import partial
         site_filters = []
         if self.imgsubs:
-            site_filters.append(lambda elem: filters.imgsub(elem, self.imgsubs))
+            site_filters.append(partial(filters.imgsub, subs=self.imgsubs))
         if 'fullsite' in params and 'request_path' in params:
             desktop_url = 'http://%(fullsite)s%(request_path)s' % params
             site_filters.extend((
-                lambda elem: filters.absimgsrc(elem, desktop_url),
-                to_imgserve,
-                lambda elem: filters.abslinkfilesrc(elem, desktop_url),
+                partial(filters.absimgsrc, desktop_url=desktop_url),
+                ImgServe(**imgserve_options),
+                partial(filters.abslinkfilesrc, desktop_url=desktop_url),
                 ))
+        if lite is not None:
+            site_filters.extend(lite.mk_filters())
         return site_filters
 
     def request_overrides(self, wsgienviron):
@@ -272,12 +380,67 @@ class MobileSite:
         '''
         return []
 
+    def security_rules(self):
+        '''
+        The site's security hooks, compiled for checking requests
+
+        The rules are compiled once, on first use; so sechooks must
+        return the same hooks for the lifetime of the site object.
+
+        @return : Compiled security hooks
+        @rtype  : mobilize.secure.SecurityRules
+
+        '''
+        if self._security_rules is None:
+            from mobilize.secure import SecurityRules
+            self._security_rules = SecurityRules(self.sechooks())
+        return self._security_rules
+
+    def slow_log(self):
+        '''
+        The slow request log, if enabled
+
+        @return : Slow request log, or None
+        @rtype  : mobilize.timing.SlowRequestLog
+
+        '''
+        if self._slow_log is None and self.slow_request_log is not None:
+            from mobilize.timing import SlowRequestLog
+            self._slow_log = SlowRequestLog(self.slow_request_log, self.slow_request_threshold)
+        return self._slow_log
+
+    def tracer(self):
+        '''
+        The exporter of request traces, if tracing is enabled
+
+        @return : Trace exporter, or None
+        @rtype  : mobilize.tracing.FileExporter
+
+        '''
+        if self._tracer is None and self.trace_file is not None:
+            from mobilize.tracing import FileExporter
+            self._tracer = FileExporter(self.trace_file)
+        return self._tracer
+
+    def fragment_cache(self):
+        '''
+        The cache of component fragments, if enabled
+
+        @return : Fragment cache, or None
+        @rtype  : mobilize.fragcache.FragmentCache
+
+        '''
+        if self._fragment_cache is None and self.fragment_cache_size > 0:
+            from mobilize.fragcache import FragmentCache
+            self._fragment_cache = FragmentCache(self.fragment_cache_size)
+        return self._fragment_cache
+
     def postprocess_response_headers(self, headers, status):
         '''
         Apply any final universal postprocessing to response headers
 
         @param headers : Response headers
-        @type  headers : list of (name, value)
+        @type  headers : list of (name, value), or dict (see mobilize.httputil.iterheaders)
 
         @param status : HTTP status response code from source server
         @type  status : 200
@@ -286,17 +449,10 @@ class MobileSite:
         @rtype  : list of (name, value)
         
         '''
-        from mobilize.util import isscalar
+        from mobilize.httputil import iterheaders
         removed = (
             'transfer-encoding', # What's returned to the client is not actually chunked.
             )
-        def expand(items):
-            for k, v in items:
-                if isscalar(v):
-                    yield k, v
-                else:
-                    for _v in v:
-                        yield k, _v
         def modify(header, value):
             import re
             if 'location' == header:
@@ -308,11 +464,9 @@ class MobileSite:
                     value = value.replace(':2443/', ':2280/')
             return (header, value)
         modified = [modify(header, value)
-                    for header, value in expand(headers)
+                    for header, value in iterheaders(headers)
                     if header not in removed]
-        for hook in self.sechooks():
-            modified = hook.response(modified)
-        return modified
+        return self.security_rules().response(modified)
 
     def must_fake_http_head(self, reqinfo):
         '''
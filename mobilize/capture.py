@@ -0,0 +1,276 @@
+'''
+Capture of production traffic, for offline replay
+
+A site with a capture directory (MobileSite.capture_dir) saves one in
+every MobileSite.capture_sample mobilizeable requests to it: the
+request's WSGI environment (see environ_subset), and the headers and
+body of the source site's response.  Each capture is a gzipped JSON
+file, written before the page is rendered, so pages that break
+rendering are captured too.  Capturing stops once the directory holds
+MobileSite.capture_limit captures; remove some to resume.
+
+Captures hold real pages and request headers, so store them as you
+would the site's access logs.  Cookies and credentials are never
+captured.
+
+bin/replay.py renders captures again, through the moplates of the
+current mobile site and with no network access, for profiling,
+benchmarking, and comparing the output before and after a change:
+
+  bin/replay.py -I /var/www/m.example.com --output-dir /tmp/before /var/spool/mwu-capture
+  # ... change moplates or mobilize ...
+  bin/replay.py -I /var/www/m.example.com --compare /tmp/before /var/spool/mwu-capture
+
+'''
+
+import os
+import time
+
+#: Suffix of capture files
+CAPTURE_SUFFIX = '.capture.json.gz'
+
+#: Version of the capture file format
+CAPTURE_VERSION = 1
+
+#: WSGI environment keys never captured
+ENVIRON_OMIT = frozenset([
+    'HTTP_COOKIE',
+    'HTTP_AUTHORIZATION',
+    'HTTP_PROXY_AUTHORIZATION',
+    'HTTP_X_MWU_PROFILE',
+    ])
+
+#: Source response headers never captured, by lowercase name
+HEADERS_OMIT = frozenset([
+    'set-cookie',
+    'set-cookie2',
+    'authentication-info',
+    'proxy-authentication-info',
+    ])
+
+#: Non-CGI WSGI environment keys captured
+ENVIRON_KEEP = frozenset([
+    'wsgi.url_scheme',
+    ])
+
+class Capture:
+    '''
+    A captured request, and the source site's response to it
+
+    Properties:
+      handler  : name of the handler the request was captured in
+      captured : time of capture, in seconds since the epoch
+      environ  : WSGI environment subset (see environ_subset)
+      status   : HTTP status of the source response
+      headers  : source response headers, with lowercase names (minus HEADERS_OMIT)
+      body     : source response body
+      path     : file the capture was loaded from, or None
+
+    '''
+    def __init__(self, handler, captured, environ, status, headers, body, path=None):
+        self.handler = handler
+        self.captured = captured
+        self.environ = environ
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.path = path
+
+    @property
+    def name(self):
+        '''
+        Name of the capture: its file name, without the suffix
+        '''
+        if self.path is None:
+            return None
+        name = os.path.basename(self.path)
+        if name.endswith(CAPTURE_SUFFIX):
+            name = name[:-len(CAPTURE_SUFFIX)]
+        return name
+
+def sampled(msite):
+    '''
+    Whether to capture the current request
+
+    @param msite : Mobile site
+    @type  msite : mobilize.base.MobileSite
+
+    @return      : True iff the request is to be captured
+    @rtype       : bool
+
+    '''
+    import random
+    if msite.capture_dir is None or msite.capture_sample < 1:
+        return False
+    if 0 != random.randrange(msite.capture_sample):
+        return False
+    if msite.capture_limit is not None and _count(msite.capture_dir) >= msite.capture_limit:
+        return False
+    return True
+
+def environ_subset(environ):
+    '''
+    The part of a WSGI environment saved with a capture
+
+    This is the CGI variables and request headers, which are what
+    rendering depends on, minus cookies and credentials (see
+    ENVIRON_OMIT).  Server objects, like wsgi.input, are dropped.
+
+    @param environ : WSGI environment
+    @type  environ : dict
+
+    @return        : Environment subset
+    @rtype         : dict: str -> str
+
+    '''
+    return {
+        key : value for key, value in environ.items()
+        if type(value) is str
+        and key not in ENVIRON_OMIT
+        and (key in ENVIRON_KEEP or '.' not in key)
+        }
+
+def write(capture_dir, name, environ, resp, body):
+    '''
+    Save a capture
+
+    The file is written under a temporary name, then renamed, so that
+    a replay running at the same time never reads it half-written.
+
+    @param capture_dir : Directory to write to
+    @type  capture_dir : str
+
+    @param name        : Name of the handler of the request
+    @type  name        : str
+
+    @param environ     : WSGI environment
+    @type  environ     : dict
+
+    @param resp        : Source response
+    @type  resp        : httplib2.Response
+
+    @param body        : Source response body
+    @type  body        : bytes
+
+    @return            : Path of the capture
+    @rtype             : str
+
+    '''
+    import gzip
+    import json
+    import base64
+    from mobilize.httputil import get_rel_url
+    from mobilize.profiling import _slug
+    captured = time.time()
+    path = os.path.join(capture_dir, '{}.{:03d}-{}-{}-{}{}'.format(
+            time.strftime('%Y%m%dT%H%M%S', time.gmtime(captured)),
+            int(captured * 1000) % 1000,
+            os.getpid(),
+            _slug(name),
+            _slug(get_rel_url(environ)),
+            CAPTURE_SUFFIX,
+            ))
+    record = {
+        'version'  : CAPTURE_VERSION,
+        'handler'  : name,
+        'captured' : captured,
+        'environ'  : environ_subset(environ),
+        'status'   : resp.status,
+        'headers'  : {key.lower() : value for key, value in resp.items()
+                      if 'status' != key and key.lower() not in HEADERS_OMIT},
+        'body'     : base64.b64encode(body).decode('ascii'),
+        }
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as handle:
+        json.dump(record, handle)
+    os.replace(tmp_path, path)
+    return path
+
+def load(path):
+    '''
+    Load a capture
+
+    @param path : Capture file
+    @type  path : str
+
+    @return     : Capture
+    @rtype      : Capture
+
+    '''
+    import gzip
+    import json
+    import base64
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        record = json.load(handle)
+    assert CAPTURE_VERSION == record['version'], 'Unsupported capture version {} in {}'.format(record['version'], path)
+    return Capture(record['handler'], record['captured'], record['environ'], record['status'],
+                   record['headers'], base64.b64decode(record['body']), path)
+
+def capture_paths(paths):
+    '''
+    The capture files among some paths
+
+    Directories are searched (not recursively) for capture files.
+
+    @param paths : Capture files and directories
+    @type  paths : list of str
+
+    @return      : Capture files, sorted within each directory (so by time of capture)
+    @rtype       : list of str
+
+    '''
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(CAPTURE_SUFFIX))
+        else:
+            found.append(path)
+    return found
+
+def replay(msite, capture, reqinfo=None):
+    '''
+    Render a captured page again, as the site's moplate for it would now
+
+    No request is made to the source site: the captured response is
+    rendered, with the same template parameters and site filters as
+    a live request.  The moplate is looked up in the site's current
+    handler map, not by the name saved in the capture.
+
+    @param msite   : Mobile site
+    @type  msite   : mobilize.base.MobileSite
+
+    @param capture : Capture
+    @type  capture : Capture
+
+    @param reqinfo : Request info to render with, e.g. for its timings; or None to create one
+    @type  reqinfo : mobilize.httputil.RequestInfo
+
+    @return        : Rendered mobile page body, or None if no moplate handles the request
+    @rtype         : str
+
+    '''
+    from mobilize import httputil
+    from mobilize.handlers import Moplate
+    from mobilize.exceptions import NoMatchingHandlerException
+    environ = dict(capture.environ)
+    try:
+        handler = msite.handler_map.get_handler_for(httputil.get_rel_url(environ))
+    except NoMatchingHandlerException:
+        return None
+    if not isinstance(handler, Moplate):
+        return None
+    if reqinfo is None:
+        reqinfo = httputil.RequestInfo(environ)
+    charset = httputil.guess_charset(capture.headers, capture.body, msite.default_charset)
+    src_resp_body = httputil.netbytes2str(capture.body, charset)
+    extra_params = handler.render_params(environ, msite, reqinfo)
+    return handler.render(src_resp_body, extra_params, msite.mk_site_filters(extra_params), reqinfo)
+
+# supporting code
+
+def _count(capture_dir):
+    try:
+        return sum(1 for name in os.listdir(capture_dir) if name.endswith(CAPTURE_SUFFIX))
+    except OSError:
+        return 0
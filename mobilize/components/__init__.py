@@ -21,3 +21,4 @@ the name - but never by parsing the desktop page content.
 
 from .simple import *
 from .extracted import *
+from .chrome import *
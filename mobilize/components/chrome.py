@@ -0,0 +1,181 @@
+import time
+import threading
+
+from mobilize.log import logger
+from .simple import Simple
+
+__all__ = ['SiteChrome']
+
+class SiteChrome(Simple):
+    '''
+    Content common to all pages, sourced once from a reference page
+
+    Navigation menus, footers and the like are usually the same on
+    every page of the desktop site.  Rather than extracting them from
+    each page, a SiteChrome component extracts them from one reference
+    page (by default, the home page) with an extracted component, and
+    keeps the resulting HTML in memory.  Create it once, and use the
+    same instance in every moplate, so they all share it:
+
+      nav = SiteChrome(CssPath('#nav', idname='nav'), ttl=600)
+      home = Moplate([nav, CssPath('#content')], name='home')
+      product = Moplate([nav, CssPath('#product')], name='product')
+
+    The reference page is fetched on the first request rendered with
+    the component, in that request.  After that, once the content is
+    ttl seconds old, the next request starts a refresh in a background
+    thread, and is served the current content meanwhile.  If a fetch
+    fails, the current content is kept, and another is tried retry
+    seconds later.
+
+    The reference page is fetched without the visitor's cookies or
+    credentials, so the content is the same for everyone.  The site
+    filters are applied to it as for a request for the reference page
+    (without client hints, or lite mode), except that its images get
+    no low-quality placeholders, and are not lazy-loaded: these are
+    for the first images of the page content (see ImgServe).  Each
+    server process keeps its own copy.
+
+    The wrapped component must have an idname, which the SiteChrome
+    takes as its own.
+
+    Rendering outside a request - as by bin/replay.py - does not fetch
+    the reference page; the component is then empty.
+
+    '''
+
+    #: Request headers passed on to the source site when fetching the reference page
+    REQUEST_HEADERS = ('host', 'user-agent', 'accept', 'accept-language')
+
+    def __init__(self, component, ref_url='/', ttl=300, retry=30):
+        '''
+        ctor
+
+        @param component : Extracted component with an idname, applied to the reference page
+        @type  component : mobilize.components.Extracted
+
+        @param ref_url   : Relative URL of the reference page on the source site
+        @type  ref_url   : str
+
+        @param ttl       : Seconds before the content is refreshed
+        @type  ttl       : int or float
+
+        @param retry     : Seconds before trying again after a failed fetch
+        @type  retry     : int or float
+
+        '''
+        assert component.extracted, component
+        assert component.idname is not None, 'The component of a SiteChrome needs an idname'
+        self.component = component
+        self.idname = component.idname
+        self.ref_url = ref_url
+        self.ttl = ttl
+        self.retry = retry
+        self.optional = component.optional
+        #: Current HTML of the component; None until the reference page is first fetched
+        self.fragment = None
+        #: Time the current content was fetched, or None
+        self.fetched = None
+        self._due = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def relevant(self, reqinfo):
+        return self.component.relevant(reqinfo)
+
+    def html(self):
+        if self.fragment is None:
+            return ''
+        return self.fragment
+
+    def refresh_if_stale(self, msite, environ, reqinfo):
+        '''
+        Fetch the reference page, if due
+
+        This is called by the moplate before each rendering.  The
+        first fetch is made right away; later ones in the background.
+
+        @param msite   : Mobile site
+        @type  msite   : mobilize.base.MobileSite
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @param reqinfo : request info
+        @type  reqinfo : mobilize.httputil.RequestInfo
+
+        '''
+        if time.time() < self._due:
+            return
+        with self._lock:
+            if self._refreshing or time.time() < self._due:
+                return
+            self._refreshing = True
+        background = False
+        try:
+            request_headers = reqinfo.headers(msite.request_overrides(environ), msite.request_header_plan)
+            headers = {header : value for header, value in request_headers.items()
+                       if header.lower() in self.REQUEST_HEADERS and value is not None}
+            args = (msite, reqinfo.root_url + self.ref_url, headers)
+            if self.fragment is None:
+                self._refresh(*args)
+            else:
+                threading.Thread(target=self._refresh, args=args, name='mobilize-chrome', daemon=True).start()
+                background = True
+        finally:
+            if not background:
+                self._refreshing = False
+
+    def render_source(self, msite, url, headers):
+        '''
+        Fetch the reference page, and render the component from it
+
+        @param msite   : Mobile site
+        @type  msite   : mobilize.base.MobileSite
+
+        @param url     : Full URL of the reference page
+        @type  url     : str
+
+        @param headers : Request headers
+        @type  headers : dict
+
+        @return        : HTML of the component
+        @rtype         : str
+
+        @raises mobilize.exceptions.SourceFetchError : The reference page could not be fetched
+
+        '''
+        from mobilize import httputil
+        from mobilize.handlers import _html_fromstring
+        from mobilize.exceptions import SourceFetchError
+        from mobilize.images import ImgServe
+        resp, body = msite.get_http().request(url, headers=headers)
+        if 200 != resp.status or not body:
+            raise SourceFetchError('{} {} from {}'.format(resp.status, resp.reason, url))
+        charset = httputil.guess_charset(resp, body, msite.default_charset)
+        doc = _html_fromstring(httputil.netbytes2str(body, charset))
+        params = {
+            'fullsite'     : msite.fullsite,
+            'request_path' : self.ref_url,
+            }
+        site_filters = msite.mk_site_filters(params)
+        for filt in site_filters:
+            if isinstance(filt, ImgServe):
+                # Placeholders and eager loading are for the first images of the page content
+                filt.lqip = 0
+                filt.eager = None
+        self.component.extract(doc)
+        self.component.process(self.idname, site_filters)
+        return self.component.html()
+
+    def _refresh(self, msite, url, headers):
+        try:
+            self.fragment = self.render_source(msite, url, headers)
+            self.fetched = time.time()
+            self._due = self.fetched + self.ttl
+        except Exception as ex:
+            # Keep what we have; this must not break the page, nor kill the thread silently
+            logger.warning('Could not refresh site chrome from %s: %s', url, ex)
+            self._due = time.time() + self.retry
+        finally:
+            self._refreshing = False
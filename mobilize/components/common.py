@@ -3,6 +3,9 @@ class Component:
     abstract base of all component classes
 
     '''
+    #: Whether this component may be left out of lite pages (see mobilize.lite)
+    optional = False
+
     def html(self):
         '''
         Render the element content HTML
@@ -29,8 +32,10 @@ class Component:
         device, etc.
 
         Component subclasses may override this method.  If it returns
-        True, the default, the component is included; on False, the
-        component is left out of the rendering.
+        True, the component is included; on False, the component is
+        left out of the rendering.  By default, every component is
+        relevant, except that optional components are left out of lite
+        pages if the site's lite profile says so (see mobilize.lite).
 
         Note the component-rendering mechanism must support this
         relevance check.  All such mechanisms in Mobilize are supposed
@@ -45,4 +50,8 @@ class Component:
         @rtype         : str
         
         '''
+        if self.optional:
+            lite = getattr(reqinfo, 'lite', None)
+            if lite is not None and lite.skip_optional:
+                return False
         return True
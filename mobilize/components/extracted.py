@@ -2,6 +2,7 @@ import copy
 import re
 
 from mobilize import util
+from mobilize import fragcache
 from .common import Component
 
 #: Indicates that filtering should be applied on every extracted element individually
@@ -30,6 +31,12 @@ class Extracted(Component):
     #: Element selection predicate.  None means keep everything
     keep_if = None
 
+    #: Final HTML, when taken from or kept in the fragment cache; else None
+    fragment = None
+
+    #: Name of the source document to extract from; None for the main source
+    source = None
+
     def __init__(self,
                  selector,
                  filters=None,
@@ -44,6 +51,9 @@ class Extracted(Component):
                  tag='div',
                  innerhtml=False,
                  keep_if=None,
+                 optional=False,
+                 cacheable=False,
+                 source=None,
                  ):
         '''
         ctor
@@ -119,6 +129,21 @@ class Extracted(Component):
         before proceeding.  All this happens before any filters are
         applied.
 
+        If optional is True, the component is left out of lite pages
+        (see mobilize.lite).
+
+        If cacheable is True, and the site has a fragment cache, the
+        final HTML is cached, keyed on the extracted source and the
+        filters applied (see mobilize.fragcache).  Use it for content
+        that repeats from request to request, like navigation menus.
+        As its filters are skipped on a cache hit, a cacheable
+        component with innerhtml=True must not extract elements that
+        later components extract too.
+
+        source names the document to extract from, for a moplate with
+        several sources (see mobilize.handlers.MultiSourceMoplate).
+        By default, the component extracts from the page requested.
+
         TODO: make FILT_COLLAPSED the default filtermode
 
         @param selector    : What part of the document to extract
@@ -159,6 +184,15 @@ class Extracted(Component):
     
         @param innerhtml   : If true, select the matching element's content only
         @type  innerhtml   : bool
+
+        @param optional    : Whether this component may be left out of lite pages
+        @type  optional    : bool
+
+        @param cacheable   : Whether to keep the final HTML in the fragment cache
+        @type  cacheable   : bool
+
+        @param source      : Name of the source document to extract from
+        @type  source      : str, or None for the main source
         
         '''
         if type(selector) in (list, tuple):
@@ -176,6 +210,9 @@ class Extracted(Component):
         self.tag = tag
         self.innerhtml = innerhtml
         self.keep_if = keep_if
+        self.optional = optional
+        self.cacheable = cacheable
+        self.source = source
 
     def _extract(self, source):
         '''
@@ -229,7 +266,7 @@ class Extracted(Component):
                 self.elems[ii] = copy.deepcopy(elem)
         return self.elems
 
-    def process(self, default_idname=None, extra_filters=None, reqinfo=None):
+    def process(self, default_idname=None, extra_filters=None, reqinfo=None, own_filters=None):
         '''
         Process the extracted element, before rendering as a string
 
@@ -237,7 +274,9 @@ class Extracted(Component):
         from the document source.  We apply certain transformations and
         mods needed before it can be rendered into a string.
 
-        Operates on self.elem, replacing it as a side effect.
+        Operates on self.elem, replacing it as a side effect.  If the
+        final HTML is found in the fragment cache (reqinfo.fragments),
+        it is set to self.fragment instead, and None is returned.
 
         The element will be wrapped in a new div, which is given the
         class and ID according to the classvalue and idname member
@@ -254,30 +293,62 @@ class Extracted(Component):
         @param extra_filters  : Additional filters to post-apply, from moplate
         @type  extra_filters  : list of callable; or None for no filters (empty list)
 
-        @return               : New element with the applied changes
+        @param reqinfo        : request info
+        @type  reqinfo        : mobilize.httputil.RequestInfo
+
+        @param own_filters    : This component's filters, if pruned (see mobilize.renderplan)
+        @type  own_filters    : sequence of callable; or None for self.filters
+
+        @return               : New element with the applied changes; None if taken from the fragment cache
         @rtype                : lxml.html.HtmlElement
         
         '''
+        from itertools import chain
         from lxml.html import HtmlElement
+        from mobilize.timing import callable_name
         if extra_filters is None:
             extra_filters = []
+        if own_filters is None:
+            own_filters = self.filters
+        timings = getattr(reqinfo, 'timings', None)
+        fragments = getattr(reqinfo, 'fragments', None)
+        def relevant(filt):
+            _is_relevant = True
+            if hasattr(filt, 'relevant'):
+                assert callable(filt.relevant), filt.relevant
+                _is_relevant = filt.relevant(reqinfo)
+            return _is_relevant
+        relevant_filters = [filt for filt in chain(own_filters, extra_filters)
+                            if relevant(filt)]
         def applyfilters(elem):
-            from itertools import chain
-            def relevant(filt):
-                _is_relevant = True
-                if hasattr(filt, 'relevant'):
-                    assert callable(filt.relevant), filt.relevant
-                    _is_relevant = filt.relevant(reqinfo)
-                return _is_relevant
-            for filt in chain(self.filters, extra_filters):
-                if relevant(filt):
+            for filt in relevant_filters:
+                if timings is None:
                     filt(elem)
+                else:
+                    with timings.stage('filter', component=idname, filter=callable_name(filt)):
+                        filt(elem)
         assert type(self.elems) is list, self.elems
         if self.idname is None:
             assert default_idname is not None, 'cannot determine an idname!'
             idname = default_idname
         else:
             idname = self.idname
+        self.fragment = None
+        key = None
+        if self.cacheable and fragments is not None:
+            wrapping = (self.tag, self.classvalue, idname, self.style, self.innerhtml, self.filtermode)
+            key = fragcache.fragment_key(self.elems, wrapping, relevant_filters)
+            if key is not None:
+                self.fragment = fragments.get(key)
+                if self.fragment is not None:
+                    if not (self.innerhtml and len(self.elems) == 1):
+                        # Take them out of the source, as wrapping them would
+                        for elem in self.elems:
+                            if elem.getparent() is not None:
+                                elem.getparent().remove(elem)
+                    self.elem = None
+                    return None
+                states = fragcache.filter_states(relevant_filters)
         if self.filtermode == FILT_EACHELEM:
             # applying filters to extracted elements individually
             for elem in self.elems:
@@ -299,9 +370,14 @@ class Extracted(Component):
         if bool(self.style):
             newelem.attrib['style'] = self.style
         self.elem = newelem
+        if key is not None and states == fragcache.filter_states(relevant_filters):
+            self.fragment = util.elem2str(newelem)
+            fragments.put(key, self.fragment)
         return newelem
         
     def html(self):
+        if self.fragment is not None:
+            return self.fragment
         assert self.elem is not None, 'Must invoke self.extract() and self.process() before rendering to html'
         return util.elem2str(self.elem)
 
@@ -378,18 +454,21 @@ class BigImage(XPath):
     Given current (2011) mobile screen sizes, it's best to use these
     on images that are 480px or wider, and look good when compressed
     to as low as half that width.
+
+    Such an image is normally the hero image of the page, so it is
+    marked to load eagerly, with high priority (see filters.heroimg).
     
     '''
 
     def __init__(self, csspath=None, xpath=None, idname=None):
         from mobilize.util import classvalue
-        from mobilize.filters import noimgsize
+        from mobilize.filters import noimgsize, heroimg
         assert not (csspath is None and xpath is None), 'You must provide either a csspath or an xpath!'
         if xpath is None:
             xpath = _csspath2xpath(csspath)
         kwargs = dict(
             classvalue = classvalue('bigimage'),
-            postfilters = [noimgsize],
+            postfilters = [noimgsize, heroimg],
             )
         if idname is not None:
             kwargs['idname'] = idname
@@ -9,3 +9,18 @@ class NoMatchingHandlerException(MobilizeException):
     Indicates no handler is available that matches the given URL/dispatch
     '''
 
+
+class SourceFetchError(MobilizeException):
+    '''
+    Indicates a page could not be fetched from the source site (see components.SiteChrome)
+    '''
+
+class RequestBodyTooLarge(MobilizeException):
+    '''
+    Indicates the request body is larger than the site allows (see MobileSite.max_request_body)
+    '''
+
+class RequestBodyResent(MobilizeException):
+    '''
+    Indicates the HTTP client tried to send a streamed request body again (see httputil.RequestBody.sendable)
+    '''
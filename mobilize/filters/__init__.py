@@ -28,6 +28,8 @@ from .filterbase import (
 from .remove import (
     noattribs,
     nobr,
+    nodecorativeimg,
+    noembeds,
     noevents,
     noimgsize,
     noinputsize,
@@ -39,6 +41,7 @@ from .remove import (
     )
 
 from .resize import (
+    embedfacade,
     resizeobject,
     resizeiframe,
     )
@@ -56,6 +59,7 @@ from .misc import (
     abslinkfilesrc,
     formaction,
     formcontroltypes,
+    heroimg,
     imgsub,
     relhyperlinks,
     relhyperlinks_full,
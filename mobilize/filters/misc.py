@@ -250,6 +250,26 @@ def imgsub(elem, subs):
                 assert type(value) == str, type(value)
                 img.attrib['src'] = value
     
+@filterapi
+def heroimg(elem):
+    '''
+    Mark the first image as a hero image, to be loaded with high priority
+
+    The first img in the element (or the element itself, if an img)
+    gets loading="eager" and fetchpriority="high".  Besides hinting
+    the browser, this exempts the image from lazy loading by
+    mobilize.images.ImgServe.
+
+    @param elem : Root element to search within
+    @type  elem : HtmlElement
+    
+    '''
+    from mobilize.util import findonetag
+    img = findonetag(elem, 'img')
+    if img is not None:
+        img.attrib['loading'] = 'eager'
+        img.attrib['fetchpriority'] = 'high'
+
 # Supporting code
 
 def _link_converter(attribute, desktop_url):
@@ -235,6 +235,67 @@ def nobr(elem, space=True):
                 br_elem.tail = ' ' + br_elem.tail 
         br_elem.drop_tree()
 
+#: Default text of the links that replace embeds, in the noembeds filter
+NOEMBEDS_TEXT = 'View embedded content'
+
+@filterapi
+def noembeds(elem, text=NOEMBEDS_TEXT):
+    '''
+    Replace iframe and object embeds with plain links to their content
+
+    Every iframe and object element within elem (including elem
+    itself) is replaced with an A tag of CSS class "mwu-embedlink",
+    linking to the embedded URL.  For an object, that URL is taken
+    from its "data" attribute, a child embed's "src", or a "movie"
+    param, in that order.  Embeds with no discernible URL, and hidden
+    ones (see mobilize.util.hidden_embed), are dropped.
+
+    This avoids loading the embedded page - often heavy third-party
+    players and their scripts - unless the visitor asks for it.
+
+    @param elem : Root element to search within
+    @type  elem : lxml.html.HtmlElement
+
+    @param text : Link text
+    @type  text : str
+    
+    '''
+    from mobilize.util import htmlelem, classname, replace_child, embed_url, hidden_embed
+    for embed_elem in list(elem.iter('iframe', 'object')):
+        url = embed_url(embed_elem)
+        if url and not hidden_embed(embed_elem):
+            link = htmlelem('a', attrib={'href' : url, 'class' : classname('embedlink')}, text=text)
+            link.tail = embed_elem.tail
+            if embed_elem is elem:
+                replace_child(elem, elem, link)
+            elif embed_elem.getparent() is not None:
+                embed_elem.getparent().replace(embed_elem, link)
+        elif embed_elem is not elem:
+            embed_elem.drop_tree()
+
+@filterapi
+def nodecorativeimg(elem):
+    '''
+    Remove decorative images
+
+    An image is considered decorative if it has an empty alt
+    attribute (alt=""), role="presentation" or role="none", or
+    aria-hidden="true".  These are the markers authors use for images
+    that carry no content, so they can be dropped when bandwidth is
+    at a premium.  An img tag with no alt attribute at all is kept.
+
+    @param elem : Root element to search within
+    @type  elem : lxml.html.HtmlElement
+    
+    '''
+    def decorative(img):
+        return ('' == img.attrib.get('alt', None)
+                or img.attrib.get('role', '').lower() in {'presentation', 'none'}
+                or 'true' == img.attrib.get('aria-hidden', '').lower())
+    for img in elem.findall('.//img'):
+        if decorative(img):
+            img.drop_tree()
+
 @filterapi
 def omitattrib_one(elem, toremove):
     '''
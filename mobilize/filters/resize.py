@@ -3,19 +3,48 @@ Filters whose job is to resize elements
 
 '''
 
+import re
 from .filterbase import filterapi
 from mobilize.util import (
     findonetag,
     )
 
+#: Poster images for well-known embed providers.  Each entry is a
+#: regex matching the embed URL, and a format string for the poster
+#: URL, filled with the regex's named groups.
+EMBED_POSTERS = [
+    (re.compile(r'^(?:https?:)?//(?:www\.)?youtube(?:-nocookie)?\.com/(?:embed|v)/(?P<videoid>[\w-]+)'),
+     'https://i.ytimg.com/vi/{videoid}/hqdefault.jpg'),
+    ]
+
+#: Default height/width ratio of an embed facade, when the embed does not specify its size
+FACADE_ASPECT = 9 / 16
+
 # Supporting code
 
+def embed_poster(url):
+    '''
+    Find the poster image for an embed URL, if the provider is known
+
+    @param url : URL of the embedded content
+    @type  url : str
+
+    @return    : poster image URL, or None if unknown
+    @rtype     : str, or None
+    
+    '''
+    for regex, poster in EMBED_POSTERS:
+        match = regex.search(url)
+        if match is not None:
+            return poster.format(**match.groupdict())
+    return None
+
 def setwidth(elem, width):
     try:
         oldheight = float(elem.attrib['height'])
         oldwidth =  float(elem.attrib['width'])
         elem.attrib['height'] = str(int(0.5 + oldheight * width / oldwidth))
-    except (ValueError, KeyError):
+    except (ValueError, KeyError, ZeroDivisionError):
         if 'height' in elem.attrib:
             del elem.attrib['height']
     elem.attrib['width'] = str(width)
@@ -65,3 +94,66 @@ def resizeiframe(elem, width=280):
     if iframe_elem is not None:
         setwidth(iframe_elem, width)
 
+
+@filterapi
+def embedfacade(elem, width=280, text='Tap to load'):
+    '''
+    Replace iframe and object embeds with click-to-load facades
+
+    Every iframe and object element within elem (including elem
+    itself) is replaced with a lightweight placeholder: a div of CSS
+    class "mwu-elem-facade", holding a poster image and a link to the
+    embedded content.  The embed URL and size are kept in the div's
+    data-mwu-embed, data-mwu-width and data-mwu-height attributes.
+    When the visitor taps the facade, the script in globalbase.html
+    swaps in an iframe loading that URL.  So the embedded player and
+    its scripts are only downloaded if the visitor actually wants
+    them.
+
+    The facade is sized like resizeiframe would size the embed: width
+    pixels wide, preserving the embed's aspect ratio.  The poster image
+    is given that size, and keeps its own URL: the site filters (see
+    mobilize.images.ImgServe) then serve it through imgserve.  Posters are only available
+    for the providers in EMBED_POSTERS; other facades show just the
+    link.  Embeds with no discernible URL, and hidden ones (see
+    mobilize.util.hidden_embed), are left alone.
+
+    @param elem  : Root element to search within
+    @type  elem  : lxml.html.HtmlElement
+
+    @param width : Width of the facade
+    @type  width : int
+
+    @param text  : Link text
+    @type  text  : str
+    
+    '''
+    from mobilize.util import htmlelem, classname, replace_child, embed_url, hidden_embed
+    for embed_elem in list(elem.iter('iframe', 'object')):
+        url = embed_url(embed_elem)
+        if url is None or hidden_embed(embed_elem):
+            continue
+        sized = htmlelem('iframe', attrib=dict(embed_elem.attrib))
+        setwidth(sized, width)
+        height = int(sized.attrib.get('height', int(0.5 + width * FACADE_ASPECT)))
+        children = []
+        poster = embed_poster(url)
+        if poster is not None:
+            children.append(htmlelem('img', attrib={
+                'src'    : poster,
+                'width'  : str(width),
+                'height' : str(height),
+                'alt'    : '',
+                }))
+        children.append(htmlelem('a', attrib={'href' : url, 'class' : classname('facade-load')}, text=text))
+        facade = htmlelem('div', children=children, attrib={
+            'class'           : classname('facade'),
+            'data-mwu-embed'  : url,
+            'data-mwu-width'  : str(width),
+            'data-mwu-height' : str(height),
+            })
+        facade.tail = embed_elem.tail
+        if embed_elem is elem:
+            replace_child(elem, elem, facade)
+        elif embed_elem.getparent() is not None:
+            embed_elem.getparent().replace(embed_elem, facade)
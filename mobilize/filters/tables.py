@@ -45,6 +45,19 @@ class Spec:
         self.classname = classname
         self.lastfilter = lastfilter
 
+    def fingerprint(self):
+        '''
+        Fingerprint of the spec, for filter fingerprints (see mobilize.fragcache)
+        '''
+        from mobilize.fragcache import fingerprint
+        lastfilter = None
+        if self.lastfilter is not None:
+            lastfilter = fingerprint(self.lastfilter)
+            if lastfilter is None:
+                return None
+        return 'Spec{!r}'.format((self.idname, self.rowstart, self.colstart, self.rowend, self.colend,
+                                  self.classname, lastfilter))
+
 def cell_lookup(table_elem):
     '''
     Builds a lookup mapping of cells in an TABLE element
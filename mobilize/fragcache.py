@@ -0,0 +1,218 @@
+'''
+Cache of the filtered HTML of extracted components
+
+Headers, navigation menus, footers and sidebars extracted from the
+desktop page are often the same from one request to the next.  An
+extracted component created with cacheable=True (see
+mobilize.components.Extracted) keeps its final HTML in the site's
+fragment cache, keyed on:
+
+  - its extracted source elements, serialized;
+  - how it wraps them (tag, class, ID, style, filter mode); and
+  - the fingerprint of each filter relevant to the request (see
+    fingerprint), in order.
+
+On a hit, the component skips its filters and the serialization of
+its element altogether.
+
+Enable the cache with MobileSite.fragment_cache_size.  Its hits and
+misses are counted in the mobilize_cache_lookups_total metric, as
+cache "fragment".
+
+FILTER FINGERPRINTS
+
+A filter's output must depend only on its input element and on what
+its fingerprint describes.  These are fingerprinted:
+
+  - functions defined at module level, by their qualified name;
+  - functools.partial objects of those, along with their arguments,
+    if these are plain values (strings, numbers, and tuples, lists,
+    sets and dicts of them) or fingerprintable functions; and
+  - objects with a fingerprint() method, returning a string (or
+    None if they cannot be fingerprinted after all).
+
+Lambdas, nested functions and other callables cannot be
+fingerprinted: a component with any of them among its relevant
+filters is not cached.
+
+Note the site filters include absimgsrc and abslinkfilesrc with the
+URL of the desktop page as an argument, so by default, fragments are
+shared by requests for the same page.  For content shared by all
+pages, see mobilize.components.SiteChrome.
+
+STATEFUL FILTERS
+
+Some filters keep state over a page - ImgServe counts the images it
+has converted, to treat the first few differently - so their output
+is not a function of their input alone.  Such filters have a state()
+method, returning a snapshot of their state.  A fragment is only
+stored if processing it left the state of every such filter
+unchanged, i.e. they had nothing to do on it (for ImgServe: it
+holds no images).  Reusing the fragment then cannot skip a change of
+state.  For the same reason, the fingerprint of a stateful filter
+need not describe its options.
+
+'''
+
+import types
+import threading
+from collections import OrderedDict
+from functools import partial
+
+#: Cache name, in the cache lookup metrics
+METRICS_NAME = 'fragment'
+
+class FragmentCache:
+    '''
+    Least-recently-used cache of component HTML, by key
+    '''
+    def __init__(self, maxsize):
+        '''
+        ctor
+
+        @param maxsize : Maximum number of fragments kept
+        @type  maxsize : int
+
+        '''
+        assert maxsize > 0, maxsize
+        self.maxsize = maxsize
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        The fragment for a key
+
+        @param key : Fragment key (see fragment_key)
+        @type  key : str
+
+        @return    : HTML of the fragment, or None if not cached
+        @rtype     : str
+
+        '''
+        from mobilize import metrics
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+        metrics.CACHE.inc(cache=METRICS_NAME, result='miss' if fragment is None else 'hit')
+        return fragment
+
+    def put(self, key, fragment):
+        '''
+        Keep a fragment, evicting the least recently used if full
+
+        @param key      : Fragment key (see fragment_key)
+        @type  key      : str
+
+        @param fragment : HTML of the fragment
+        @type  fragment : str
+
+        '''
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+
+    def __len__(self):
+        return len(self._fragments)
+
+def fingerprint(filt):
+    '''
+    A string identifying what a filter does
+
+    @param filt : Filter
+    @type  filt : callable
+
+    @return     : Fingerprint, or None if the filter cannot be fingerprinted
+    @rtype      : str
+
+    '''
+    if hasattr(filt, 'fingerprint'):
+        return filt.fingerprint()
+    if isinstance(filt, partial):
+        func = fingerprint(filt.func)
+        args = _plain(filt.args)
+        keywords = _plain(filt.keywords)
+        if None in (func, args, keywords):
+            return None
+        return '{}{}{}'.format(func, args, keywords)
+    if isinstance(filt, types.FunctionType):
+        if filt.__closure__ is not None or '<' in filt.__qualname__:
+            # lambda, or nested function
+            return None
+        return '{}.{}'.format(filt.__module__, filt.__qualname__)
+    return None
+
+def fragment_key(elems, wrapping, filters):
+    '''
+    Key of a fragment in the cache
+
+    @param elems    : Extracted source elements
+    @type  elems    : list of lxml.html.HtmlElement
+
+    @param wrapping : Plain values describing how the elements are wrapped
+    @type  wrapping : tuple
+
+    @param filters  : Filters relevant to the request, in the order applied
+    @type  filters  : list of callable
+
+    @return         : Key, or None if the fragment cannot be cached
+    @rtype          : str
+
+    '''
+    import hashlib
+    from lxml import html
+    digest = hashlib.blake2b(digest_size=20)
+    for filt in filters:
+        filt_fingerprint = fingerprint(filt)
+        if filt_fingerprint is None:
+            return None
+        digest.update(filt_fingerprint.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(repr(wrapping).encode('utf-8'))
+    for elem in elems:
+        digest.update(b'\0')
+        digest.update(html.tostring(elem))
+    return digest.hexdigest()
+
+def filter_states(filters):
+    '''
+    Snapshot of the states of the stateful filters among some filters
+
+    @param filters : Filters
+    @type  filters : list of callable
+
+    @return        : States, to compare with a later snapshot
+    @rtype         : list
+
+    '''
+    return [filt.state() for filt in filters if hasattr(filt, 'state')]
+
+# supporting code
+
+def _plain(value):
+    '''
+    repr of a plain value; None if not plain
+    '''
+    if value is None or type(value) in (str, bytes, int, float, bool):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        items = [_plain(item) for item in value]
+        if None in items:
+            return None
+        return '{}({})'.format(type(value).__name__, ', '.join(items))
+    if isinstance(value, (set, frozenset)):
+        items = [_plain(item) for item in value]
+        if None in items:
+            return None
+        return 'set({})'.format(', '.join(sorted(items)))
+    if isinstance(value, dict):
+        items = [(_plain(key), _plain(item)) for key, item in value.items()]
+        if any(None in pair for pair in items):
+            return None
+        return 'dict({})'.format(', '.join('{}: {}'.format(key, item) for key, item in sorted(items)))
+    if callable(value) or hasattr(value, 'fingerprint'):
+        return fingerprint(value)
+    return None
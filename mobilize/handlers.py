@@ -8,9 +8,15 @@ reusable (e.g., todesktop, which is an instance of ToDesktop)
 
 '''
 import re
+import time
+import threading
 from mobilize.log import logger
-from . import util
+from . import capture
 from . import httputil
+from . import metrics
+from . import profiling
+from . import timing
+from . import tracing
 
 class Handler:
     '''
@@ -176,46 +182,95 @@ class WebSourcer(Handler):
         @rtype                : list of str
         
         '''
-        from mobilize.log import format_headers_log
-        logger.info('Matching moplate: {}'.format(self.name))
+        from mobilize.log import log_headers
+        from mobilize.exceptions import RequestBodyTooLarge
+        logger.info('Matching moplate: %s', self.name)
         reqinfo = httputil.RequestInfo(environ)
-        for sechook in msite.sechooks():
-            sechook.check_request(reqinfo)
+        slow_log = msite.slow_log()
+        tracer = msite.tracer()
+        if slow_log is not None or tracer is not None:
+            reqinfo.timings = timing.Timings()
+            reqinfo.timings.note(method=reqinfo.method, url=reqinfo.url, handler=self.name)
+        if tracer is not None:
+            reqinfo.trace = tracing.TraceContext.from_environ(environ)
+        reqinfo.fragments = msite.fragment_cache()
         fake_head_req = msite.must_fake_http_head(reqinfo)
         http = msite.get_http()
         request_overrides = msite.request_overrides(environ)
-        logger.info(format_headers_log('NEW: raw request headers', reqinfo, list(reqinfo.iterrawheaders())))
-        request_headers = reqinfo.headers(request_overrides)
-        logger.info(format_headers_log('modified request headers', reqinfo, request_headers))
-        source_url = reqinfo.root_url + self.source_rel_url(reqinfo.rel_url)
+        log_headers('NEW: raw request headers', reqinfo, reqinfo.rawheaders())
+        request_headers = reqinfo.headers(request_overrides, msite.request_header_plan)
+        log_headers('modified request headers', reqinfo, request_headers)
+        source_url = reqinfo.root_url + self.source_rel_url(profiling.without_token(msite, reqinfo.rel_url))
         if fake_head_req:
             reqinfo.method = 'GET'
-        resp, src_resp_bytes = http.request(source_url, method=reqinfo.method, body=reqinfo.body,
-                                           headers=request_headers)
+        body = reqinfo.body_stream(msite.max_request_body)
+        if body is not None and body.length is None:
+            # Let the http client chunk the body itself
+            for header in list(request_headers):
+                if header.lower() in {'content-length', 'transfer-encoding'}:
+                    del request_headers[header]
+        if reqinfo.mobilizeable and not fake_head_req:
+            self.prefetch(msite, reqinfo, request_headers)
+        with metrics.ORIGIN_LATENCY.time(handler=self.name), timing.stage(reqinfo, 'origin'):
+            resp, src_resp_bytes = http.request(source_url, method=reqinfo.method,
+                                               body=None if body is None else body.sendable(),
+                                               headers=request_headers)
+        metrics.ORIGIN_RESPONSES.inc(status=resp.status)
+        if body is not None and body.exceeded:
+            raise RequestBodyTooLarge(body.total)
+        if body is not None and body.resent:
+            logger.warning('Request body not resent to %s after a connection failure; responded %s', source_url, resp.status)
         if fake_head_req:
             reqinfo.method = 'HEAD' # restore original method
             src_resp_bytes = b''
-        logger.info(format_headers_log('raw response headers', reqinfo, resp, status=resp.status))
+        log_headers('raw response headers', reqinfo, resp, status=resp.status)
         charset = httputil.guess_charset(resp, src_resp_bytes, msite.default_charset)
+        if reqinfo.timings is not None:
+            reqinfo.timings.note(origin_status=resp.status, origin_bytes=len(src_resp_bytes), charset=charset)
         status = '%s %s' % (resp.status, resp.reason)
         # Note that for us to mobilize the response, both the request
         # AND the response must be "mobilizeable".
         if reqinfo.mobilizeable and httputil.mobilizeable(resp):
+            if src_resp_bytes and capture.sampled(msite):
+                _capture(msite, self.name, environ, resp, src_resp_bytes)
             src_resp_body = httputil.netbytes2str(src_resp_bytes, charset)
             final_body, final_resp_headers = self._final_wsgi_response(environ, msite, reqinfo, resp, src_resp_body)
         else:
             # TODO: must apply response overrides, at least for 301/302 redirs for one specific client
-            final_resp_headers = httputil.dict2list(resp)
+            final_resp_headers = resp # flattened by postprocess_response_headers
             final_body = src_resp_bytes
         final_resp_headers = msite.postprocess_response_headers(final_resp_headers, resp.status)
         assert type(final_resp_headers) == list
         if fake_head_req:
             final_resp_headers.append(('X-MWU-Info', 'Faked HEAD request as GET on source server'))
-        logger.info(format_headers_log('final resp headers', reqinfo, final_resp_headers))
+        log_headers('final resp headers', reqinfo, final_resp_headers)
+        metrics.RESPONSE_BYTES.inc(len(final_body), handler=self.name)
+        if reqinfo.timings is not None:
+            reqinfo.timings.note(output_bytes=len(final_body))
+            _report_timings(reqinfo, slow_log, tracer)
         # TODO: if the next line raises a TypeError, catch it and log final_resp_headers in detail (and everything else while we're at it)
         start_response(status, final_resp_headers)
         return [final_body]
 
+    def prefetch(self, msite, reqinfo, request_headers):
+        '''
+        Start fetching whatever else the response needs
+
+        This is called just before the request to the source, so that
+        other fetches can overlap with it.  By default, there is
+        nothing else to fetch.
+
+        @param msite           : Mobile site
+        @type  msite           : MobileSite
+
+        @param reqinfo         : request info
+        @type  reqinfo         : mobilize.httputil.RequestInfo
+
+        @param request_headers : Headers of the request to the source
+        @type  request_headers : dict
+
+        '''
+
     def _final_wsgi_response(self, environ, msite, reqinfo, resp, src_resp_body):
         '''
         Create the final WSGI response body and headers
@@ -263,6 +318,9 @@ class Moplate(WebSourcer):
         'globalbase.html',
         ]
 
+    #: Sources other than the main one, by name; only a MultiSourceMoplate has any
+    sources = {}
+
     def __init__(self,
                  components,
                  params          = None,
@@ -281,6 +339,9 @@ class Moplate(WebSourcer):
         available to the template as the "elements" attribute of the
         parameter dictionary.
 
+        Components extracted from another source than the page itself
+        (see Extracted) are only for a MultiSourceMoplate.
+
         The params field is for a starting set of template parameters
         for final rendering.  It is optional, defaulting to an empty
         dict, and there are ways to add to this set later on.  It MUST
@@ -292,7 +353,13 @@ class Moplate(WebSourcer):
         template can be either a string, or an instance of
         jinja2.Template.  If the former, it's assumed to be the name
         of a template to load from TEMPLATE_DIRS.
-        
+
+        Unless given in params, the title and heading parameters are
+        taken from the source document's title and first h1 - but only
+        if the template (or one it extends, includes or imports) uses
+        them, as found when it is loaded (see
+        mobilize.templates.template_variables).
+
         The imgsubs parameter can be used to specify image URL
         substitutions specific to this moplate.  If provided, a
         filters.imgsubs filter will be applied to all moplate components
@@ -321,6 +388,7 @@ class Moplate(WebSourcer):
         
         '''
         from jinja2 import Template
+        from mobilize.templates import template_variables
         if template_loader is None:
             template_loader = self.default_template_loader()
         if template is None:
@@ -328,8 +396,12 @@ class Moplate(WebSourcer):
         if not isinstance(template, Template):
             template = template_loader.get_template(template)
         assert isinstance(template, Template), type(template)
-        logger.debug('Moplate {} using template named "{}"'.format(name, template.name))
+        logger.debug('Moplate %s using template named "%s"', name, template.name)
         super().__init__(**kw)
+        for component in components:
+            if component.extracted:
+                assert component.source is None or component.source in self.sources, \
+                    'Unknown source "{}" of component; sources of this moplate: {}'.format(component.source, sorted(self.sources))
         self.template = template
         self.components = components
         if params:
@@ -338,6 +410,28 @@ class Moplate(WebSourcer):
             self.params = {}
         assert 'elements' not in self.params, '"elements" is reserved/magical in mobile template params.  See Moplate class documention'
         self.imgsubs = imgsubs
+        #: Names of the parameters the template may use, or None if unknown
+        self.template_variables = template_variables(template)
+        #: What rendering takes that does not depend on the request
+        self.plan = self.compile_plan()
+
+    def compile_plan(self):
+        '''
+        Compile the render plan of this moplate (see mobilize.renderplan)
+
+        The moplate-level filters are only part of the plan if
+        mk_moplate_filters is not overridden; otherwise, they are made
+        for each request, as they may depend on its parameters.
+
+        @return : Render plan
+        @rtype  : mobilize.renderplan.RenderPlan
+
+        '''
+        from mobilize.renderplan import RenderPlan
+        moplate_filters = None
+        if type(self).mk_moplate_filters is Moplate.mk_moplate_filters:
+            moplate_filters = self.mk_moplate_filters(self.params)
+        return RenderPlan(self.components, moplate_filters)
 
     def default_template_loader(self):
         '''
@@ -384,20 +478,56 @@ class Moplate(WebSourcer):
         Workhorse for render() method
         '''
         assert '' != full_body
-        doc = self.fromstring(full_body)
-        params = _rendering_params(doc, [self.params, extra_params])
+        with timing.stage(reqinfo, 'parse'):
+            doc = self.fromstring(full_body)
+        if getattr(reqinfo, 'timings', None) is not None:
+            reqinfo.timings.note(dom_nodes=sum(1 for _ in doc.iter()))
+        params = _rendering_params(doc, [self.params, extra_params], self.template_variables)
+        docs = self.source_docs(doc, reqinfo)
         assert 'elements' not in params # Not yet anyway
-        if site_filters is None:
-            site_filters = []
-        all_filters = self.mk_moplate_filters(params) + list(site_filters)
-        components = [c for c in self.components
-                      if c.relevant(reqinfo)]
-        for ii, component in enumerate(components):
-            if component.extracted:
-                component.extract(doc)
-                component.process(util.idname(ii), all_filters, reqinfo)
-        params['elements'] = [component.html() for component in components]
-        return self.template.render(**params)
+        moplate_filters = self.plan.moplate_filters
+        if moplate_filters is None:
+            moplate_filters = self.mk_moplate_filters(params)
+        all_filters = list(moplate_filters)
+        if site_filters is not None:
+            all_filters.extend(site_filters)
+        steps = self.plan.steps(reqinfo)
+        for step in steps:
+            if step.component.extracted:
+                with timing.stage(reqinfo, 'extract', component=step.component_id):
+                    step.component.extract(docs[step.component.source])
+                with timing.stage(reqinfo, 'process', component=step.component_id):
+                    step.component.process(step.component_id, all_filters, reqinfo, step.filters)
+        params['elements'] = []
+        for step in steps:
+            with timing.stage(reqinfo, 'html', component=step.component_id):
+                params['elements'].append(step.component.html())
+        if getattr(reqinfo, 'timings', None) is not None:
+            reqinfo.timings.note(component_bytes={
+                    step.component_id : len(element.encode('utf-8'))
+                    for step, element in zip(steps, params['elements'])})
+        with timing.stage(reqinfo, 'template'):
+            return self.template.render(**params)
+
+    def source_docs(self, doc, reqinfo):
+        '''
+        The documents components extract from, by source name
+
+        The main source, from which the page is rendered, is named
+        None.  Only multi-source moplates have others (see
+        MultiSourceMoplate).
+
+        @param doc     : Document of the main source
+        @type  doc     : lxml.html.HtmlElement
+
+        @param reqinfo : request info
+        @type  reqinfo : mobilize.httputil.RequestInfo
+
+        @return        : Documents
+        @rtype         : dict: str -> lxml.html.HtmlElement
+
+        '''
+        return {None : doc}
 
     def mk_moplate_filters(self, params):
         '''
@@ -412,7 +542,8 @@ class Moplate(WebSourcer):
         will contain a properly initialized imgsub filter.
 
         The params argument can be used to generate filters specific
-        to the parameter set.
+        to the parameter set.  Note it only has the title and heading
+        parameters if the template uses them.
 
         Note that these are applied after any component-level filters,
         but before any site-level filters.
@@ -424,27 +555,176 @@ class Moplate(WebSourcer):
         @rtype        : list of callable
         
         '''
+        from functools import partial
         from mobilize.filters import imgsub
         filts = []
         if self.imgsubs:
-            filts.append(lambda elem: imgsub(elem, self.imgsubs))
+            filts.append(partial(imgsub, subs=self.imgsubs))
         return filts
 
-    def _final_wsgi_response(self, environ, msite, reqinfo, resp, src_resp_body):
+    def render_params(self, environ, msite, reqinfo):
+        '''
+        Template parameters of a rendering for a request
+
+        These are the extra_params passed to render.  If lite mode
+        applies to the request, this also sets reqinfo.lite.
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @param msite   : Mobile site
+        @type  msite   : mobilize.base.MobileSite
+
+        @param reqinfo : request info
+        @type  reqinfo : mobilize.httputil.RequestInfo
+
+        @return        : Template parameters
+        @rtype         : dict
+
+        '''
+        # Keep any profiling token out of the page
+        rel_url = profiling.without_token(msite, reqinfo.rel_url)
         extra_params = {
             'fullsite'     : msite.fullsite,
-            'request_path' : reqinfo.rel_url,
-            'todesktop'    : _todesktoplink(reqinfo.protocol, msite.fullsite, reqinfo.rel_url),
+            'request_path' : rel_url,
+            'todesktop'    : _todesktoplink(reqinfo.protocol, msite.fullsite, rel_url),
             }
-        final_body = self.render(src_resp_body, extra_params, msite.mk_site_filters(extra_params), reqinfo)
+        if msite.client_hints:
+            from mobilize.images import img_sizing
+            extra_params['img_maxw'], extra_params['img_dpr'] = img_sizing(environ)
+        if msite.lite_profile is not None and msite.lite_profile.requested(environ):
+            reqinfo.lite = msite.lite_profile
+        extra_params['lite'] = reqinfo.lite
+        return extra_params
+
+    def _final_wsgi_response(self, environ, msite, reqinfo, resp, src_resp_body):
+        from mobilize.components import SiteChrome
+        for component in self.components:
+            if isinstance(component, SiteChrome):
+                component.refresh_if_stale(msite, environ, reqinfo)
+        extra_params = self.render_params(environ, msite, reqinfo)
+        with metrics.RENDER_LATENCY.time(moplate=self.name), timing.stage(reqinfo, 'render'):
+            final_body = self.render(src_resp_body, extra_params, msite.mk_site_filters(extra_params), reqinfo)
         response_overrides = msite.response_overrides(environ)
         response_overrides['content-length'] = str(len(final_body))
-        final_resp_headers = httputil.get_response_headers(resp, environ, response_overrides)
+        final_resp_headers = httputil.get_response_headers(resp, environ, response_overrides, msite.response_header_plan)
+        if msite.client_hints:
+            from mobilize.images import ACCEPT_CH, CLIENT_HINTS
+            final_resp_headers.append(('accept-ch', ACCEPT_CH))
+            final_resp_headers = httputil.add_vary(final_resp_headers, CLIENT_HINTS)
+        if msite.lite_profile is not None:
+            final_resp_headers = msite.lite_profile.response_headers(final_resp_headers, environ)
         final_body = bytes(final_body, 'utf-8')
 
         assert type(final_body) is bytes
         return final_body, final_resp_headers
 
+class MultiSourceMoplate(Moplate):
+    '''
+    A moplate rendering pages from several source pages
+
+    Besides the page requested, a multi-source moplate fetches other
+    named source pages, and its components can extract from any of
+    them (see the source argument of mobilize.components.Extracted).
+    For example, to add the reviews of a product, found on another
+    desktop page, keeping the query string (see NewBaseUrl):
+
+      product = MultiSourceMoplate(
+          [CssPath('#product'), CssPath('#reviews', source='reviews')],
+          sources={'reviews' : '/product/reviews.php'},
+          deadline=3)
+
+    The other sources are fetched in background threads, concurrently
+    with the page requested, so the page takes about as long as the
+    slowest fetch, rather than the sum of them all.  They are fetched
+    with a GET request, and the same request headers as the page
+    requested.
+
+    All fetches share a deadline, counted from the start of the
+    request.  When rendering, the moplate waits for them until then.
+    A source not fetched by the deadline, or that fails, or that
+    responds with another status than 200, is replaced by an empty
+    document (and a warning is logged): components extracting from it
+    come out empty, as for a page where their selector does not match.
+
+    Renderings outside a request - as by bin/replay.py - do not fetch
+    the other sources either; they are all empty.
+
+    '''
+
+    #: Request headers not passed on to the other sources, which are fetched without a body
+    OMIT_HEADERS = {'content-length', 'content-type', 'transfer-encoding'}
+
+    def __init__(self, components, sources, deadline=10, **kw):
+        '''
+        ctor
+
+        Besides these, this takes the same arguments as Moplate.
+
+        @param components : Page components
+        @type  components : list
+
+        @param sources    : URL mapping of each other source, by name (see WebSourcer.source_rel_url)
+        @type  sources    : dict: str -> str or callable
+
+        @param deadline   : Seconds to wait for the other sources, from the start of the request
+        @type  deadline   : int or float
+
+        '''
+        from mobilize.httputil import NewBaseUrl
+        self.sources = {}
+        for name, source in sources.items():
+            assert name is not None, 'None is the name of the main source'
+            if type(source) is str:
+                source = NewBaseUrl(source)
+            assert callable(source), (name, source)
+            self.sources[name] = source
+        self.deadline = deadline
+        super().__init__(components, **kw)
+
+    def prefetch(self, msite, reqinfo, request_headers):
+        headers = {header : value for header, value in request_headers.items()
+                   if header.lower() not in self.OMIT_HEADERS}
+        executor = _source_executor()
+        pending = _PendingSources(time.time() + self.deadline, msite.default_charset)
+        for name, source in self.sources.items():
+            url = reqinfo.root_url + source(profiling.without_token(msite, reqinfo.rel_url))
+            pending.fetches[name] = (url, executor.submit(_fetch_source, msite, url, headers, self.deadline))
+        reqinfo.sources = pending
+
+    def source_docs(self, doc, reqinfo):
+        docs = {None : doc}
+        pending = getattr(reqinfo, 'sources', None)
+        if pending is None:
+            for name in self.sources:
+                docs[name] = _html_fromstring(EMPTY_SOURCE)
+            return docs
+        import concurrent.futures
+        with timing.stage(reqinfo, 'sources'):
+            futures = [future for url, future in pending.fetches.values()]
+            concurrent.futures.wait(futures, timeout=max(0, pending.deadline - time.time()))
+            fetch_seconds = {}
+            for name, (url, future) in pending.fetches.items():
+                body = None
+                if not future.done():
+                    future.cancel()
+                    logger.warning('Source %s not fetched within %s seconds: %s', name, self.deadline, url)
+                elif future.exception() is not None:
+                    logger.warning('Could not fetch source %s from %s: %s', name, url, future.exception())
+                else:
+                    resp, body, fetch_seconds[name] = future.result()
+                    if 200 != resp.status:
+                        logger.warning('Source %s responded %s %s: %s', name, resp.status, resp.reason, url)
+                        body = None
+                if body:
+                    charset = httputil.guess_charset(resp, body, pending.charset)
+                    docs[name] = self.fromstring(httputil.netbytes2str(body, charset))
+                else:
+                    docs[name] = _html_fromstring(EMPTY_SOURCE)
+        if reqinfo.timings is not None:
+            reqinfo.timings.note(source_seconds=fetch_seconds)
+        return docs
+
 class ToDesktop(Handler):
     '''
     Send the mobile request to the desktop URL
@@ -462,7 +742,7 @@ class ToDesktop(Handler):
     def wsgi_response(self, msite, environ, start_response):
         from mobilize.httputil import RequestInfo
         reqinfo = RequestInfo(environ)
-        to = 'http://{}{}'.format(msite.fullsite, reqinfo.rel_url)
+        to = 'http://{}{}'.format(msite.fullsite, profiling.without_token(msite, reqinfo.rel_url))
         start_response(self.status, [('location', to)])
         return ['<html><body><a href="{}">Go to page</a>'.format(to)]
 
@@ -479,7 +759,7 @@ class PassThrough(WebSourcer):
     Pass through the response from the desktop source
     '''
     def _final_wsgi_response(self, environ, msite, reqinfo, resp, src_resp_body):
-        logger.info('Passing through response for {}'.format(reqinfo.url))
+        logger.info('Passing through response for %s', reqinfo.url)
         return _passthrough_response(src_resp_body, resp)
 
 class SecurityBlock(Handler):
@@ -502,6 +782,36 @@ The request to {rel_url} is forbidden as a security measure.'''.format(status=se
         start_response(self.status, [])
         return [message]
 
+class BodyTooLarge(Handler):
+    '''
+    Refuse a request whose body is over the site's limit (see MobileSite.max_request_body)
+    '''
+    status = httputil.HTTP_STATUSES[413]
+
+    def wsgi_response(self, msite, environ, start_response):
+        message = '''<html><head><title>{status}</title></head><body>
+<h1>{status}</h1>
+The request body is too large.'''.format(status=self.status)
+        start_response(self.status, [])
+        return [message]
+
+class MetricsEndpoint(Handler):
+    '''
+    Serve the internal metrics, in the Prometheus text format
+
+    Only clients in the site's metrics_allow get the metrics; others
+    are blocked as by SecurityBlock.  See mobilize.metrics.
+    '''
+    def wsgi_response(self, msite, environ, start_response):
+        if environ.get('REMOTE_ADDR') not in msite.metrics_allow:
+            return securityblock.wsgi_response(msite, environ, start_response)
+        body = bytes(metrics.exposition(), 'utf-8')
+        start_response('200 OK', [
+                ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                ('Content-Length', str(len(body))),
+                ])
+        return [body]
+
 class Redirect(Handler):
     '''
     General redirect handeler
@@ -560,9 +870,86 @@ def redirect_to(where, status_code=302):
 todesktop = ToDesktop()
 passthrough = PassThrough()
 securityblock = SecurityBlock()
+bodytoolarge = BodyTooLarge()
+metricsendpoint = MetricsEndpoint()
 
 # Supporting code
 
+#: Number of threads fetching the other sources of multi-source moplates, in each process
+SOURCE_FETCH_THREADS = 16
+
+#: Document standing in for a source that could not be fetched
+EMPTY_SOURCE = '<html><body></body></html>'
+
+class _PendingSources:
+    '''
+    Fetches of the other sources of a multi-source moplate, for a request
+    '''
+    def __init__(self, deadline, charset):
+        #: Time by which the fetches must be done
+        self.deadline = deadline
+        #: Default charset of the source site
+        self.charset = charset
+        #: (URL, future of (response, body, seconds)) by source name
+        self.fetches = {}
+
+_source_executor_lock = threading.Lock()
+_source_executor_instance = None
+def _source_executor():
+    '''
+    The thread pool fetching the other sources of multi-source moplates
+
+    Created on first use, so it is made in each server process, after any fork.
+    '''
+    global _source_executor_instance
+    if _source_executor_instance is None:
+        from concurrent.futures import ThreadPoolExecutor
+        with _source_executor_lock:
+            if _source_executor_instance is None:
+                _source_executor_instance = ThreadPoolExecutor(SOURCE_FETCH_THREADS, thread_name_prefix='mobilize-source')
+    return _source_executor_instance
+
+def _fetch_source(msite, url, headers, timeout):
+    '''
+    Fetch another source of a multi-source moplate; runs in the thread pool
+    '''
+    http = msite.get_http()
+    http.timeout = timeout
+    started = time.time()
+    resp, body = http.request(url, headers=headers)
+    return resp, body, time.time() - started
+
+def _report_timings(reqinfo, slow_log, tracer):
+    '''
+    Write the timings of a request to the slow request log and trace file, as enabled
+    '''
+    timings = reqinfo.timings
+    if slow_log is not None:
+        try:
+            slow_log.write(timings)
+        except OSError as ex:
+            logger.warning('Could not write slow request log: %s', ex)
+    if tracer is not None:
+        facts = timings.facts
+        try:
+            tracer.export(tracing.spans(reqinfo.trace, timings, '{} {}'.format(reqinfo.method, facts['handler']), {
+                        'http.request.method'       : reqinfo.method,
+                        'url.full'                  : facts['url'],
+                        'http.response.status_code' : facts.get('origin_status', 0),
+                        'mobilize.handler'          : facts['handler'],
+                        }))
+        except OSError as ex:
+            logger.warning('Could not write trace: %s', ex)
+
+def _capture(msite, name, environ, resp, src_resp_bytes):
+    '''
+    Save a capture of the request, for offline replay (see mobilize.capture)
+    '''
+    try:
+        capture.write(msite.capture_dir, name, environ, resp, src_resp_bytes)
+    except OSError as ex:
+        logger.warning('Could not write capture to %s: %s', msite.capture_dir, ex)
+
 def _passthrough_response(body, resp):
     resp_headers = httputil.dict2list(resp)
     return body, resp_headers
@@ -611,7 +998,26 @@ def _todesktoplink(protocol, fullsite, rel_url):
     link += 'mredir=0'
     return link
 
-def _rendering_params(doc, paramdictlist):
+def _rendering_params(doc, paramdictlist, used=None):
+    '''
+    Template parameters, completed with those found in the source document
+
+    Those found in the source document (title, heading) are only
+    looked for if the template uses them, and not given otherwise.
+
+    @param doc           : Source document
+    @type  doc           : lxml.html.HtmlElement
+
+    @param paramdictlist : Parameters, later dicts taking precedence
+    @type  paramdictlist : list of dict
+
+    @param used          : Names of the parameters the template uses, or None if unknown
+    @type  used          : set of str
+
+    @return              : Parameters
+    @rtype               : dict
+
+    '''
     params = {}
     for paramdict in paramdictlist:
         if type(paramdict) is dict:
@@ -642,6 +1048,6 @@ def _rendering_params(doc, paramdictlist):
         'heading' : mk_findtext('.//h1'),
         }
     for param, finder in source_params.items():
-        if param not in params:
+        if param not in params and (used is None or param in used):
             params[param] = finder()
     return params
@@ -1,3 +1,10 @@
+import functools
+from .request import (
+    request_xforms,
+    request_additions,
+    )
+from .response import response_xforms
+
 def _identity(environ, value):
     return value
 
@@ -8,9 +15,84 @@ def _get_xform_from(header, xforms):
     return _identity
 
 def get_request_xform(header, method='GET'):
-    from .request import request_xforms
     return _get_xform_from(header, request_xforms)
 
 def get_response_xform(header, method='GET'):
-    from .response import response_xforms
     return _get_xform_from(header, response_xforms)
+
+class HeaderPlan:
+    '''
+    Header transformations, resolved once rather than per header per request
+
+    A plan combines the stock transformations of existing headers
+    with additions of new ones.  Resolving a header name to its
+    lowercased key and transformer is memoized, so each distinct
+    header name is looked up only once per plan.
+
+    Sites can customize their plans; see MobileSite.request_header_plan
+    and MobileSite.response_header_plan.
+
+    '''
+    #: Maximum number of header names whose resolution is memoized
+    cache_size = 512
+
+    def __init__(self, xforms, additions=()):
+        '''
+        ctor
+
+        @param xforms    : Transformations of existing headers, keyed by lowercased header name
+        @type  xforms    : dict: str -> callable(environ, value)
+
+        @param additions : Headers to add, if not already present
+        @type  additions : sequence of (header, callable(environ, None))
+        
+        '''
+        self.xforms = dict(xforms)
+        self.additions = list(additions)
+        self.resolve = functools.lru_cache(maxsize=self.cache_size)(self._resolve)
+
+    def _resolve(self, header):
+        '''
+        @return : lowercased header name, and its transformer
+        @rtype  : (str, callable)
+        '''
+        key = header.lower()
+        return key, self.xforms.get(key, _identity)
+
+    def transform(self, environ, header, value, overrides):
+        '''
+        Calculate the new value of a header
+
+        See mobilize.httputil.get_response_headers for an explanation
+        of overrides, which take precedence over the plan's own
+        transformations.
+
+        @param environ   : WSGI environment
+        @type  environ   : dict
+
+        @param header    : Header name
+        @type  header    : str
+
+        @param value     : Header value
+        @type  value     : str
+
+        @param overrides : Additional transformations
+        @type  overrides : dict: str -> mixed
+
+        @return          : New header value
+        @rtype           : str
+        
+        '''
+        key, xform = self.resolve(header)
+        if key in overrides:
+            override = overrides[key]
+            if callable(override):
+                return override(environ, value)
+            return override
+        return xform(environ, value)
+
+#: Standard plan for request headers
+request_plan = HeaderPlan(request_xforms, request_additions)
+
+#: Standard plan for response headers
+response_plan = HeaderPlan(response_xforms)
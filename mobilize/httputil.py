@@ -4,7 +4,7 @@ HTTP and WSGI server utilities
 '''
 
 import re
-import collections
+import functools
 from mobilize.log import logger
 
 def _name2field(name, prefix=''):
@@ -23,6 +23,33 @@ def _name2field(name, prefix=''):
     field = '-'.join(part.capitalize() for part in parts)
     return field
 
+#: Request header keys in the WSGI environment that lack the HTTP_ prefix
+_EXTRA_ENVIRON_HEADERS = frozenset((
+    'CONTENT_LENGTH',
+    'CONTENT_TYPE',
+    ))
+
+@functools.lru_cache(maxsize=1024)
+def _environ_field(rawkey):
+    '''
+    Header name of a WSGI environment key
+
+    The same few environment keys are seen on every request, so this
+    is memoized.
+
+    @param rawkey : WSGI environment key, e.g. HTTP_USER_AGENT
+    @type  rawkey : str
+
+    @return : Camel-Case field name if this is an http request header, or None if it's not.
+    @rtype  : str
+    
+    '''
+    if rawkey.startswith('HTTP_'):
+        return _name2field(rawkey, 'HTTP_')
+    if rawkey in _EXTRA_ENVIRON_HEADERS:
+        return _name2field(rawkey)
+    return None
+
 def _get_root_url(environ, use_defined_fullsite=True):
     '''
     Get the root URL of the incoming request
@@ -48,7 +75,7 @@ def _get_root_url(environ, use_defined_fullsite=True):
         url += ':' + str(port)
     return url
 
-def get_response_headers(resp_headers, environ, overrides):
+def get_response_headers(resp_headers, environ, overrides, plan=None):
     '''
     Fetch and calculate the mobile response headers
 
@@ -75,25 +102,17 @@ def get_response_headers(resp_headers, environ, overrides):
     @param overrides : Additional response transformations
     @type  overrides : dict: str -> mixed
 
+    @param plan      : Stock transformations; None for the standard ones
+    @type  plan      : mobilize.headers.HeaderPlan
+
     @return          : transformed response headers
     @rtype           : list of (header, value) tuples
     
     '''
-    from .headers import get_response_xform
-    def hv(header, value):
-        if header in overrides:
-            override = overrides[header]
-            if isinstance(override, collections.Callable):
-                newvalue = override(environ, value)
-            else:
-                newvalue = override
-            respheader = (header, newvalue)
-        else:
-            xformer = get_response_xform(header.lower())
-            value = xformer(environ, value)
-            respheader = (header, value)
-        return respheader
-    return list(hv(header, value) for header, value in resp_headers.items())
+    if plan is None:
+        from .headers import response_plan as plan
+    return [(header, plan.transform(environ, header, value, overrides))
+            for header, value in resp_headers.items()]
 
 def mobilizeable(resp):
     '''
@@ -196,14 +215,73 @@ def dict2list(d):
 
     The keys of this dict are strings: header names.  The value can be either a string, or an iterable of strings
     '''
-    def items(header, value):
-        from mobilize.util import isscalar
-        if isscalar(value):
-            yield (header, str(value))
+    return list(iterheaders(d))
+
+def iterheaders(headers):
+    '''
+    Generate (header, value) pairs, one per value
+
+    This is the single pass that flattens multi-valued headers, as
+    found in the dicts we use to represent http headers, into the list
+    form WSGI requires.  Headers can be given in either form: a dict,
+    whose values are either a string or an iterable of strings; or a
+    sequence of (header, value) pairs, where the value may also be an
+    iterable.  Values are converted to str.
+
+    @param headers : Headers
+    @type  headers : dict, or sequence of (header, value)
+
+    @return        : (header, value) pairs
+    @rtype         : iterator of (str, str)
+    
+    '''
+    from mobilize.util import isscalar
+    if hasattr(headers, 'items'):
+        headers = headers.items()
+    for header, value in headers:
+        if type(value) is str:
+            yield header, value
+        elif isscalar(value):
+            yield header, str(value)
         else:
             for oneval in value:
-                yield (header, str(oneval))
-    return [item for header, value in d.items() for item in items(header, value)]
+                yield header, str(oneval)
+
+def add_vary(headers, fields):
+    '''
+    Add request header names to the Vary response header
+
+    Any existing Vary headers are merged into a single one, keeping
+    their fields in order, with each field appearing only once
+    (compared case-insensitively).  If a Vary value is "*", the
+    response already varies on everything, and is left alone.
+
+    @param headers : Response headers
+    @type  headers : list of (name, value)
+
+    @param fields  : Request header names the response varies on
+    @type  fields  : sequence of str
+
+    @return        : Modified response headers
+    @rtype         : list of (name, value)
+    
+    '''
+    existing = []
+    others = []
+    for header, value in headers:
+        if 'vary' == header.lower():
+            existing.extend(field.strip() for field in value.split(',') if field.strip())
+        else:
+            others.append((header, value))
+    if '*' in existing:
+        return headers
+    merged = []
+    seen = set()
+    for field in existing + list(fields):
+        if field.lower() not in seen:
+            seen.add(field.lower())
+            merged.append(field)
+    return others + [('vary', ', '.join(merged))]
 
 class QueryParams(dict):
     '''
@@ -244,9 +322,30 @@ class RequestInfo:
       rel_url      : the relative request URL
       root_url     : the request URL sans the request path
       url          : full request URL
+      lite         : the site's lite profile if lite mode applies to this request, else None
+      headers_logged : whether headers are logged for this request, or None if not yet decided (see mobilize.log.headers_logged)
+      timings      : timings of the request's stages (a mobilize.timing.Timings), or None if not timed
+      trace        : trace context (a mobilize.tracing.TraceContext), or None if not traced
+      fragments    : the site's fragment cache (a mobilize.fragcache.FragmentCache), or None if disabled
+
+    Creating an instance is cheap: the request body, query params and
+    URLs are only computed when first accessed.  This matters for
+    requests dropped by security screening, which only needs rel_url
+    and querystring.  In particular, the body is not read from
+    wsgi.input until something asks for it.
 
     '''
     _rawheaders = None
+    _queryparams = None
+    _root_url = None
+    _body_read = False
+    _body = None
+    lite = None
+    headers_logged = None
+    timings = None
+    trace = None
+    fragments = None
+    sources = None
     def __init__(self, wsgienviron):
         '''
         ctor
@@ -257,62 +356,92 @@ class RequestInfo:
         '''
         self.wsgienviron = wsgienviron
         self.method = wsgienviron['REQUEST_METHOD'].upper()
-        if self.method in ('POST', 'PUT'):
-            self.body = wsgienviron['wsgi.input'].read()
-        else:
-            self.body = None
         self.querystring = wsgienviron['QUERY_STRING']
-        self.queryparams = QueryParams(self.querystring)
-        self.root_url = _get_root_url(wsgienviron)
         self.rel_url = get_rel_url(wsgienviron)
-        self.url = self.root_url + self.rel_url
         self.protocol = wsgienviron['wsgi.url_scheme']
         self.mobilizeable = wsgienviron.get('HTTP_X_REQUESTED_WITH', None) != 'XMLHttpRequest'
 
-    def headers(self, overrides):
+    def body_stream(self, maxlength=None):
+        '''
+        The request body, as a stream for forwarding to the source
+
+        Unlike the body property, this does not read the body into
+        memory: the returned object reads it from wsgi.input in
+        chunks, as the consumer asks for them.  It can only be read
+        once, and must not be combined with the body property.
+
+        @param maxlength : Maximum body size in bytes, or None for no limit
+        @type  maxlength : int
+
+        @return          : Body stream, or None if not applicable for this request method
+        @rtype           : RequestBody
+
+        @raises mobilize.exceptions.RequestBodyTooLarge : The declared Content-Length is over maxlength
+        
+        '''
+        if self.method not in ('POST', 'PUT'):
+            return None
+        assert not self._body_read, 'request body already read'
+        self._body_read = True
+        return RequestBody(self.wsgienviron, maxlength)
+
+    @property
+    def body(self):
+        if not self._body_read:
+            if self.method in ('POST', 'PUT'):
+                self._body = self.wsgienviron['wsgi.input'].read()
+            self._body_read = True
+        return self._body
+
+    @property
+    def queryparams(self):
+        if self._queryparams is None:
+            self._queryparams = QueryParams(self.querystring)
+        return self._queryparams
+
+    @property
+    def root_url(self):
+        if self._root_url is None:
+            self._root_url = _get_root_url(self.wsgienviron)
+        return self._root_url
+
+    @property
+    def url(self):
+        return self.root_url + self.rel_url
+
+    def headers(self, overrides, plan=None):
         '''
         get request headers
     
         See docs of get_response_headers for an explanation of overrides.
         
-        @param environ   : WSGI environment
-        @type  environ   : dict
-    
         @param overrides : Additional response transformations
         @type  overrides : dict: str -> mixed
+
+        @param plan      : Stock transformations and additions; None for the standard ones
+        @type  plan      : mobilize.headers.HeaderPlan
     
         @return          : transformed request headers
         @rtype           : dict
         
         '''
-        from .headers import get_request_xform
-        from .headers.request import request_additions
-        headers = {}
-        for header, value in self.rawheaders().items():
-            # We want to preserve the Camel-Casing of the header names
-            # we're about to send, because who knows what web server
-            # or gateway will randomly go crazy if we don't.  But for
-            # consistency and simplicity, related data
-            # (e.g. overrides) are keyed by their fully-lowercased
-            # equivalents.  These two ideas are labeled "header" and
-            # "headerkey" respectively.
-            headerkey = header.lower()
-            if headerkey in overrides:
-                # An override has been specified for this request header
-                override = overrides[headerkey]
-                if isinstance(override, collections.Callable):
-                    newvalue = override(self.wsgienviron, value)
-                else:
-                    newvalue = override
-            else:
-                # No override defined, so check whether there is a stock transformer
-                xformer = get_request_xform(headerkey, self.method)
-                newvalue = xformer(self.wsgienviron, value)
-            headers[header] = newvalue
-        for header, xformer in request_additions:
+        if plan is None:
+            from .headers import request_plan as plan
+        # We want to preserve the Camel-Casing of the header names
+        # we're about to send, because who knows what web server or
+        # gateway will randomly go crazy if we don't.  But for
+        # consistency and simplicity, related data (e.g. overrides)
+        # are keyed by their fully-lowercased equivalents; the plan
+        # takes care of the mapping.
+        headers = {header : plan.transform(self.wsgienviron, header, value, overrides)
+                   for header, value in self.rawheaders().items()}
+        for header, xformer in plan.additions:
             if header not in headers:
-                headerkey = header.lower()
                 headers[header] = xformer(self.wsgienviron, None)
+        if self.trace is not None:
+            # Replaces any traceparent of the client; our source fetch is the parent now
+            headers.pop('Traceparent', None)
+            headers['traceparent'] = self.trace.traceparent()
         return headers
 
     def rawheaders(self):
@@ -333,23 +462,131 @@ class RequestInfo:
         @rtype  : iterator of (str, str)
         
         '''
-        extrakeys = (
-            'CONTENT_LENGTH',
-            'CONTENT_TYPE',
-            )
-        def headername(rawkey):
-            '''Returns Camel-Case field name if this is an http request header, or None if it's not.'''
-            header = None
-            if rawkey.startswith('HTTP_'):
-                header = _name2field(rawkey, 'HTTP_')
-            elif rawkey in extrakeys:
-                header = _name2field(rawkey)
-            return header
         for rawkey, value in self.wsgienviron.items():
-            header = headername(rawkey)
+            header = _environ_field(rawkey)
             if header is not None:
                 yield header, value
 
+class RequestBody:
+    '''
+    File-like reader of the request body, from wsgi.input
+
+    http.client sends such objects in chunks of up to
+    REQUEST_BODY_CHUNK bytes, and when no Content-Length is known,
+    with chunked transfer encoding.
+
+    When the request declares a Content-Length, no more than that is
+    read, as PEP 3333 requires.  Otherwise wsgi.input is read until
+    exhausted.  Reading past maxlength raises RequestBodyTooLarge; as
+    the HTTP client may swallow the exception, it is also recorded in
+    the exceeded attribute.
+
+    Pass the HTTP client sendable(), rather than the object itself.
+
+    '''
+    #: Whether reading stopped because the body is over maxlength
+    exceeded = False
+
+    #: Whether the HTTP client tried to send the body a second time
+    resent = False
+
+    def __init__(self, wsgienviron, maxlength=None):
+        '''
+        ctor
+
+        @param wsgienviron : WSGI environment
+        @type  wsgienviron : dict
+
+        @param maxlength   : Maximum body size in bytes, or None for no limit
+        @type  maxlength   : int
+
+        @raises mobilize.exceptions.RequestBodyTooLarge : The declared Content-Length is over maxlength
+        
+        '''
+        from mobilize.exceptions import RequestBodyTooLarge
+        self.input = wsgienviron['wsgi.input']
+        self.maxlength = maxlength
+        self.length = content_length(wsgienviron)
+        self.remaining = self.length
+        self.total = 0
+        if None not in (self.length, maxlength) and self.length > maxlength:
+            self.exceeded = True
+            raise RequestBodyTooLarge(self.length)
+
+    def read(self, size=-1):
+        from mobilize.exceptions import RequestBodyTooLarge
+        if size is None or size < 0:
+            size = REQUEST_BODY_CHUNK
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+            if 0 == size:
+                return b''
+        chunk = self.input.read(size)
+        self.total += len(chunk)
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        if self.maxlength is not None and self.total > self.maxlength:
+            self.exceeded = True
+            raise RequestBodyTooLarge(self.total)
+        return chunk
+
+    def sendable(self):
+        '''
+        The body, to pass to the HTTP client
+
+        After some connection failures, httplib2 retries the request,
+        sending the same body again.  A stream cannot be rewound:
+        resending it would send what is left of it, if anything, under
+        the original Content-Length.  So the body is given to
+        http.client as an iterable, which it iterates over anew for
+        each attempt, and a second attempt raises RequestBodyResent
+        instead.  As the HTTP client turns the exception into an error
+        response, it is also recorded in the resent attribute.
+
+        @return : Body, in chunks
+        @rtype  : iterable of bytes
+
+        '''
+        return _SendOnce(self)
+
+class _SendOnce:
+    '''
+    Iterable over the chunks of a request body, only once (see RequestBody.sendable)
+    '''
+    def __init__(self, body):
+        self.body = body
+        self.started = False
+
+    def __iter__(self):
+        from mobilize.exceptions import RequestBodyResent
+        if self.started:
+            self.body.resent = True
+            raise RequestBodyResent('request body already sent')
+        self.started = True
+        return iter(lambda: self.body.read(REQUEST_BODY_CHUNK), b'')
+
+#: Size of chunks read from the request body, in bytes
+REQUEST_BODY_CHUNK = 64 * 1024
+
+def content_length(environ):
+    '''
+    The declared length of the request body
+
+    @param environ : WSGI environment
+    @type  environ : dict
+
+    @return        : Content-Length, or None if unknown
+    @rtype         : int
+    
+    '''
+    try:
+        length = int(environ.get('CONTENT_LENGTH', ''))
+    except ValueError:
+        return None
+    if length < 0:
+        return None
+    return length
+
 def _headbytes(html_bytes):
     '''fetch the portion of a document before the opening of the body element'''
     def findpos(key):
@@ -477,36 +714,72 @@ def mk_wsgi_application(msite):
     
     '''
     def application(environ, start_response):
+        from mobilize import (
+            metrics,
+            profiling,
+            )
         from mobilize.handlers import (
+            WebSourcer,
             passthrough,
             securityblock,
+            bodytoolarge,
+            metricsendpoint,
             )
         from mobilize.secure import DropResponseSignal
-        from mobilize.exceptions import NoMatchingHandlerException
+        from mobilize.exceptions import (
+            NoMatchingHandlerException,
+            RequestBodyTooLarge,
+            )
         def response(_handler):
             return _handler.wsgi_response(msite, environ, start_response)
+        rel_url = get_rel_url(environ)
+        if msite.metrics_path is not None and rel_url.partition('?')[0] == msite.metrics_path:
+            return response(metricsendpoint)
         try:
-            handler = msite.handler_map.get_handler_for(get_rel_url(environ))
+            handler = msite.handler_map.get_handler_for(rel_url)
         except NoMatchingHandlerException:
             handler = passthrough
-        
+        metrics.REQUESTS.inc(handler=handler.name)
+        if isinstance(handler, WebSourcer):
+            # Screen requests bound for the source site before
+            # anything else, so dropped ones cost next to nothing.
+            # A failing rule blocks the request, rather than letting
+            # the passthrough fallback send it on unscreened.
+            try:
+                msite.security_rules().check_environ(environ)
+            except DropResponseSignal:
+                metrics.SECURITY_BLOCKS.inc()
+                return response(securityblock)
+            except Exception as ex:
+                logger.critical('Security rule failed for %s: %s', environ.get('REQUEST_URI', '???'), ex)
+                if not msite.is_production:
+                    raise
+                metrics.SECURITY_BLOCKS.inc()
+                return response(securityblock)
         try:
+            profiler = profiling.requested(msite, environ)
+            if profiler is not None:
+                return profiling.run(profiler, msite.profile_dir, handler.name, environ, lambda: response(handler))
             return response(handler)
         except DropResponseSignal:
+            metrics.SECURITY_BLOCKS.inc()
             return response(securityblock)
+        except RequestBodyTooLarge:
+            return response(bodytoolarge)
         except Exception as ex:
             # Something went fatally wrong, so attempt to fallback on the passthrough handler.
             try:
                 reqinfo = RequestInfo(environ)
-                logger.critical('Fatal error for {} {}: {}'.format(reqinfo.method, reqinfo.rel_url, str(ex)))
+                logger.critical('Fatal error for %s %s: %s', reqinfo.method, reqinfo.rel_url, ex)
             except:
-                logger.critical('Very Fatal error for {}'.format(environ.get('REQUEST_URI', '???')))
+                logger.critical('Very Fatal error for %s', environ.get('REQUEST_URI', '???'))
             if not msite.is_production:
                 # Don't mask the problem in development mode
                 raise
             if handler == passthrough:
                 # Nothing to do here...
                 raise
+            metrics.PASSTHROUGH_FALLBACKS.inc(handler=handler.name)
             return response(passthrough)
     return application
 
@@ -516,6 +789,7 @@ HTTP_STATUSES = dict((code, '{} {}'.format(code, message))
         301 : 'Moved Permanently',
         302 : 'Found',
         403 : 'Forbidden',
+        413 : 'Request Entity Too Large',
         }.items())
 
 #: Mapping of protocol port numbers (int) to names (str)
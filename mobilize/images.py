@@ -22,12 +22,48 @@ the dimensions of the source image.
 
 '''
 
-from mobilize.filters.filterbase import filterapi
+import functools
+from mobilize.filters.filterbase import (
+    filterapi,
+    Filter,
+    )
 from mobilize.log import logger
+from mobilize import metrics
 
 #: maximum image width when otherwise unspecified
 DEFAULT_MAXW=300
 
+#: Device pixel ratios for which srcset candidates are generated
+DEFAULT_DENSITIES = (1, 2, 3)
+
+#: Key of the low-quality image placeholder (a data URL) in ImgDb records.
+#: Set by the resize service when it measures the image.
+LQIP_KEY = 'lqip'
+
+#: Client Hints request headers consulted for image sizing.  The
+#: unprefixed names are the legacy forms still sent by some browsers.
+CLIENT_HINTS = (
+    'Sec-CH-DPR',
+    'Sec-CH-Viewport-Width',
+    'DPR',
+    'Viewport-Width',
+    )
+
+#: Value of the Accept-CH response header, requesting the hints above
+ACCEPT_CH = ', '.join(CLIENT_HINTS)
+
+#: Device pixel ratio classes; a reported DPR is rounded down to one of these
+DPR_CLASSES = (1, 1.5, 2, 3)
+
+#: Viewport widths are rounded down to a multiple of this, to form a device class
+VIEWPORT_STEP = 40
+
+#: Smallest and largest viewport widths (CSS pixels) honored from client hints
+VIEWPORT_RANGE = (240, 1280)
+
+#: Horizontal space (CSS pixels) reserved for page margins around an image
+VIEWPORT_MARGIN = 20
+
 def to_imgserve_url(url, maxw, maxh):
     '''
     Calculate the value of an imgserve URL for an image
@@ -63,7 +99,7 @@ def to_imgserve_url(url, maxw, maxh):
     @rtype      : str
     
     '''
-    logger.debug('Converting img URL: {}'.format(url))
+    logger.debug('Converting img URL: %s', url)
     from urllib.parse import quote
     assert maxw > 0, maxw
     imgserve_url = '/_mwuimg/?src={src}&maxw={maxw}'.format(src=quote(url, safe=''), maxw=str(maxw))
@@ -117,7 +153,7 @@ def scale_width(start_width, start_height, end_height):
     return int(round(start_width * end_height / start_height))
 
 @filterapi
-def to_imgserve(elem):
+def to_imgserve(elem, srcset=False, densities=DEFAULT_DENSITIES, default_maxw=DEFAULT_MAXW, dpr=1):
     '''
     Convert all img tags within the tree to point to imgserve source, as needed
 
@@ -126,39 +162,323 @@ def to_imgserve(elem):
     info will be used to decide whether we need to scale the image for
     the mobile device.  If we do, the img tag's src attribute is
     modified appropriately.
+
+    See ImgServe for the meaning of the other arguments.  Features
+    that depend on an image's position within the page (such as
+    low-quality placeholders) need an ImgServe instance that persists
+    across the whole page, and are not available here.
+
+    @param elem : Root element to search within
+    @type  elem : lxml.html.HtmlElement
+    
+    '''
+    ImgServe(srcset=srcset, densities=densities, default_maxw=default_maxw, dpr=dpr)(elem)
+
+class ImgServe(Filter):
+    '''
+    Class-based form of the to_imgserve filter
+
+    An instance is meant to be used for the rendering of a single
+    page: it counts the images it has converted so far, so that the
+    first few images of the page can be treated differently.  (The
+    site filters, which include this one, are created anew for each
+    request; see MobileSite.mk_site_filters.)
+
+    If srcset is True, images whose data width is known also get
+    "srcset" and "sizes" attributes, offering one imgserve variant per
+    pixel density in densities (see srcset_candidates).  The src,
+    width and height attributes are unchanged, so browsers without
+    srcset support render exactly as before.
+
+    default_maxw and dpr are normally chosen per device by img_sizing.
+    default_maxw caps the width attribute (in CSS pixels).  When the
+    measured width of the image is known, a converted image is fetched
+    from imgserve at dpr times that width, though never wider than the
+    source image.
+
+    The first lqip images of the page get a low-quality image
+    placeholder (LQIP): a tiny blurred preview, inlined in the src
+    attribute as a data URL.  The real src (and srcset) are moved to
+    data-src (and data-srcset), and swapped back in by the script in
+    globalbase.html once the real image has loaded.  Placeholders are
+    generated once per source image by the resize service, which
+    stores them in the image's ImgDb record under LQIP_KEY next to the
+    measured dimensions.  Images without a stored placeholder are left
+    as they are.
+
+    If eager is not None, only the first eager images of the page load
+    right away: every later image gets loading="lazy" and
+    decoding="async", so the browser fetches it only as it nears the
+    viewport.  Their width and height attributes are kept, so the
+    layout does not shift when they load.  Images that already have a
+    loading attribute - such as BigImage hero images, marked by the
+    heroimg filter - are left alone.
+
+    '''
+
+    def __init__(self,
+                 srcset=False,
+                 densities=DEFAULT_DENSITIES,
+                 default_maxw=DEFAULT_MAXW,
+                 dpr=1,
+                 lqip=0,
+                 eager=None,
+                 ):
+        '''
+        ctor
+
+        @param srcset       : Whether to emit srcset and sizes attributes
+        @type  srcset       : bool
+
+        @param densities    : Pixel densities to offer in the srcset
+        @type  densities    : sequence of int or float
+
+        @param default_maxw : Maximum width of an image, in CSS pixels
+        @type  default_maxw : int
+
+        @param dpr          : Device pixel ratio of the requesting device
+        @type  dpr          : int or float
+
+        @param lqip         : Number of images, from the top of the page, to give placeholders
+        @type  lqip         : int
+
+        @param eager        : Number of images, from the top of the page, to load eagerly; or None to disable lazy loading
+        @type  eager        : int, or None
+        
+        '''
+        self.srcset = srcset
+        self.densities = densities
+        self.default_maxw = default_maxw
+        self.dpr = dpr
+        self.lqip = lqip
+        self.eager = eager
+        #: Number of images converted so far
+        self.count = 0
+
+    def __call__(self, elem):
+        from imgserve import ImgDb
+        imgdb = ImgDb()
+        for img_elem in elem.iter(tag='img'):
+            if 'src' in img_elem.attrib:
+                if img_elem.attrib['src'].lower().startswith('data:'):
+                    # Inline image, or a placeholder from an earlier pass
+                    continue
+                img_data = imgdb.get(img_elem.attrib['src']) or {}
+                metrics.CACHE.inc(cache='imgdb', result='hit' if img_data else 'miss')
+                self.convert(img_elem, img_data)
+                self.count += 1
+
+    def state(self):
+        '''
+        Snapshot of the state kept over the page (see mobilize.fragcache)
+        '''
+        return self.count
+
+    def fingerprint(self):
+        '''
+        Fingerprint of the filter (see mobilize.fragcache)
+
+        As fragments are only cached when this filter left them
+        unchanged (see state), it does not depend on the options.
+        '''
+        return 'mobilize.images.ImgServe'
+
+    def convert(self, img_elem, img_data):
+        '''
+        Convert a single img element
+
+        @param img_elem : Image element, having a src attribute
+        @type  img_elem : lxml.html.HtmlElement
+
+        @param img_data : ImgDb record of the image source; empty if not known
+        @type  img_data : dict
+        
+        '''
+        from imgserve import normalize_img_size
+        tag_width = normalize_img_size(img_elem.attrib.get('width', None))
+        tag_height = normalize_img_size(img_elem.attrib.get('height', None))
+        data_width = img_data.get('width', None)
+        data_height = img_data.get('height', None)
+        sizes = new_img_sizes(tag_width, tag_height, data_width, data_height, self.default_maxw)
+        # need to cast size values to type str, for lxml
+        for k, v in sizes.items():
+            sizes[k] = str(v)
+        for k in 'width', 'height':
+            if k in img_elem.attrib:
+                del img_elem.attrib[k]
+        img_elem.attrib.update(sizes)
+        src = img_elem.attrib['src']
+        if convertable(img_elem, data_width):
+            maxw = int(img_elem.attrib['width'])
+            if 'height' in img_elem.attrib:
+                maxh = int(img_elem.attrib['height'])
+            else:
+                maxh = None
+            if self.dpr != 1 and data_width is not None:
+                maxw, maxh = _density_scaled(maxw, maxh, data_width, self.dpr)
+            img_elem.attrib['src'] = to_imgserve_url(img_elem.attrib['src'], maxw, maxh)
+        if self.srcset and data_width is not None and 'width' in img_elem.attrib:
+            width = int(img_elem.attrib['width'])
+            height = int(img_elem.attrib['height']) if 'height' in img_elem.attrib else None
+            candidates = srcset_candidates(src, width, height, data_width, self.densities)
+            if len(candidates) > 1:
+                img_elem.attrib['srcset'] = ', '.join('{} {}w'.format(url, cand_width)
+                                                      for url, cand_width in candidates)
+                img_elem.attrib['sizes'] = '(max-width: {0}px) 100vw, {0}px'.format(width)
+        if self.count < self.lqip and img_data.get(LQIP_KEY):
+            add_placeholder(img_elem, img_data[LQIP_KEY])
+        if self.eager is not None and self.count >= self.eager and 'loading' not in img_elem.attrib:
+            img_elem.attrib['loading'] = 'lazy'
+            img_elem.attrib['decoding'] = 'async'
+
+def add_placeholder(img_elem, placeholder):
+    '''
+    Show a low-quality placeholder in an image until the real one loads
+
+    The image's src and srcset attributes are moved to data-src and
+    data-srcset; the placeholder becomes the src, and the image is
+    marked with the CSS class "mwu-elem-lqip".  The script in
+    globalbase.html restores the real attributes.
+
+    @param img_elem    : Image element
+    @type  img_elem    : lxml.html.HtmlElement
+
+    @param placeholder : Placeholder image, as a data URL
+    @type  placeholder : str
+    
+    '''
+    from mobilize.util import classname
+    for attr in ('src', 'srcset'):
+        if attr in img_elem.attrib:
+            img_elem.attrib['data-' + attr] = img_elem.attrib.pop(attr)
+    img_elem.attrib['src'] = placeholder
+    marker = classname('lqip')
+    if 'class' in img_elem.attrib:
+        img_elem.attrib['class'] = img_elem.attrib['class'] + ' ' + marker
+    else:
+        img_elem.attrib['class'] = marker
+
+def _density_scaled(width, height, data_width, dpr):
+    '''
+    Scale imgserve dimensions for a device pixel ratio, without upscaling the source
+    '''
+    scaled_width = min(int(round(width * dpr)), data_width)
+    scaled_height = None
+    if height is not None:
+        scaled_height = scale_height(width, height, scaled_width)
+    return scaled_width, scaled_height
+
+def img_sizing(environ):
+    '''
+    Choose image sizing for the requesting device from its client hints
+
+    Reads the DPR and viewport width client hints (see CLIENT_HINTS)
+    from the request.  Any hint that is missing or malformed falls
+    back to the default: a DPR of 1, or a maximum width of
+    DEFAULT_MAXW.  The values are then rounded down to a device class
+    (see device_class_sizing), so that similar devices share both the
+    computation and the resulting imgserve URLs.
+
+    The response must then carry an Accept-CH header, so browsers send
+    the hints on later requests; and a Vary header naming the same
+    hints, so caches keep a separate copy of the page per device.
+
+    @param environ : WSGI environment
+    @type  environ : dict
+
+    @return        : maximum image width in CSS pixels, and device pixel ratio
+    @rtype         : tuple(int, int or float)
     
     '''
-    from imgserve import (
-        normalize_img_size,
-        ImgDb,
-        )
-    imgdb = ImgDb()
-    for img_elem in elem.iter(tag='img'):
-        if 'src' in img_elem.attrib:
-            if elem.attrib.get('src', '').lower().startswith('data:'):
-                logger.error('Should not be converting data URL: {}'.format(elem.attrib.get('src', '')))
+    def hint(*keys):
+        for key in keys:
+            try:
+                value = float(environ[key].strip().strip('"'))
+            except (KeyError, ValueError):
                 continue
-            img_data = imgdb.get(img_elem.attrib['src']) or {}
-            tag_width = normalize_img_size(img_elem.attrib.get('width', None))
-            tag_height = normalize_img_size(img_elem.attrib.get('height', None))
-            data_width = img_data.get('width', None)
-            data_height = img_data.get('height', None)
-            sizes = new_img_sizes(tag_width, tag_height, data_width, data_height)
-            # need to cast size values to type str, for lxml
-            for k, v in sizes.items():
-                sizes[k] = str(v)
-            for k in 'width', 'height':
-                if k in img_elem.attrib:
-                    del img_elem.attrib[k]
-            img_elem.attrib.update(sizes)
-            if convertable(img_elem, data_width):
-                if 'height' in img_elem.attrib:
-                    maxh = int(img_elem.attrib['height'])
-                else:
-                    maxh = None
-                img_elem.attrib['src'] = to_imgserve_url(img_elem.attrib['src'],
-                                                         int(img_elem.attrib['width']),
-                                                         maxh)
+            if value > 0:
+                return value
+        return None
+    dpr = hint('HTTP_SEC_CH_DPR', 'HTTP_DPR')
+    viewport_width = hint('HTTP_SEC_CH_VIEWPORT_WIDTH', 'HTTP_VIEWPORT_WIDTH')
+    dpr_class = 1
+    if dpr is not None:
+        dpr_class = max([cls for cls in DPR_CLASSES if cls <= dpr] or [DPR_CLASSES[0]])
+    viewport_class = None
+    if viewport_width is not None:
+        low, high = VIEWPORT_RANGE
+        viewport_class = int(min(max(viewport_width, low), high)) // VIEWPORT_STEP * VIEWPORT_STEP
+    return device_class_sizing(dpr_class, viewport_class)
+
+@functools.lru_cache(maxsize=256)
+def device_class_sizing(dpr_class, viewport_class):
+    '''
+    Image sizing for a device class
+
+    @param dpr_class      : Device pixel ratio class; one of DPR_CLASSES
+    @type  dpr_class      : int or float
+
+    @param viewport_class : Viewport width class in CSS pixels, or None if not known
+    @type  viewport_class : int, or None
+
+    @return               : maximum image width in CSS pixels, and device pixel ratio
+    @rtype                : tuple(int, int or float)
+    
+    '''
+    maxw = DEFAULT_MAXW
+    if viewport_class is not None:
+        maxw = viewport_class - VIEWPORT_MARGIN
+    return maxw, dpr_class
+
+def srcset_candidates(src, width, height, data_width, densities=DEFAULT_DENSITIES):
+    '''
+    Calculate the srcset candidates of an image
+
+    For each pixel density, the candidate is the image scaled to
+    (width * density) pixels wide, served through imgserve.  Since
+    there is nothing to gain from upscaling, no candidate is wider
+    than the source image: the first density reaching data_width is
+    served by the unmodified source URL, and higher densities are
+    dropped.
+
+    Example:
+    srcset_candidates('http://example.com/foo.png', 100, 50, 250)
+      -> [('/_mwuimg/?src=http%3A%2F%2Fexample.com%2Ffoo.png&maxw=100&maxh=50', 100),
+          ('/_mwuimg/?src=http%3A%2F%2Fexample.com%2Ffoo.png&maxw=200&maxh=100', 200),
+          ('http://example.com/foo.png', 250)]
+
+    @param src        : URL pointing to the source image
+    @type  src        : str
+
+    @param width      : Width of the img tag in the mobile view (i.e., at density 1)
+    @type  width      : int > 0
+
+    @param height     : Height of the img tag in the mobile view
+    @type  height     : None, or int > 0
+
+    @param data_width : Measured width of the source image
+    @type  data_width : int > 0
+
+    @param densities  : Pixel densities to generate candidates for
+    @type  densities  : sequence of int or float
+
+    @return           : (url, width) pairs, in increasing order of width
+    @rtype            : list of (str, int)
+    
+    '''
+    assert width > 0, width
+    assert data_width > 0, data_width
+    candidates = []
+    for density in sorted(densities):
+        cand_width = int(round(width * density))
+        if cand_width >= data_width:
+            candidates.append((src, data_width))
+            break
+        cand_height = None
+        if height is not None:
+            cand_height = scale_height(width, height, cand_width)
+        candidates.append((to_imgserve_url(src, cand_width, cand_height), cand_width))
+    return candidates
 
 def convertable(img_elem, data_width):
     '''
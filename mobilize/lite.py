@@ -0,0 +1,153 @@
+'''
+Lite mode: lighter mobile pages for constrained connections
+
+Visitors on slow or metered connections can ask for less data with
+the "Save-Data: on" request header, which browsers send when the
+user turns on a data saver setting.  A site that defines a
+LiteProfile (see MobileSite.lite_profile) answers such requests with
+a lighter version of each moplate-rendered page.  Exactly what is
+dropped is configured by the profile.
+
+Lite mode can also be toggled without browser support: visiting any
+page with "?lite=1" sets a cookie that keeps lite mode on for later
+requests, and "?lite=0" clears it.
+
+Since lite and regular pages are served from the same URLs, lite
+responses Vary on Save-Data (and on Cookie, if the cookie toggle is
+enabled).  Any cache in front of the mobile site thus stores the two
+as separate variants.
+
+'''
+
+from mobilize import filters
+
+class LiteProfile:
+    '''
+    Settings for lite mode
+
+    Each setting is a class attribute, which may be overridden in a
+    subclass, or for a single instance by passing keyword arguments
+    to the constructor:
+
+      lite_profile = LiteProfile(maxw=160, nodecorativeimg=False)
+
+    '''
+
+    #: Maximum image width, in CSS pixels
+    maxw = 200
+
+    #: Whether to replace iframe and object embeds with links (see filters.noembeds)
+    noembeds = True
+
+    #: Whether to remove decorative images (see filters.nodecorativeimg)
+    nodecorativeimg = True
+
+    #: Whether to leave out components marked as optional (see Component.relevant)
+    skip_optional = True
+
+    #: Name of the cookie toggling lite mode; or None to disable the toggle
+    cookie = 'mwu_lite'
+
+    #: Name of the query parameter toggling the cookie
+    queryparam = 'lite'
+
+    def __init__(self, **settings):
+        for name, value in settings.items():
+            assert hasattr(self, name), 'Unknown lite profile setting: {}'.format(name)
+            setattr(self, name, value)
+
+    def requested(self, environ):
+        '''
+        Whether lite mode is requested
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @return        : True iff the request should get the lite page
+        @rtype         : bool
+
+        '''
+        if 'on' == environ.get('HTTP_SAVE_DATA', '').strip().lower():
+            return True
+        if self.cookie is None:
+            return False
+        toggle = self._toggle(environ)
+        if toggle is not None:
+            return toggle
+        return '1' == _cookies(environ).get(self.cookie)
+
+    def mk_filters(self):
+        '''
+        Create the filters removing heavy content
+
+        These are applied after all other filters, including site-level ones.
+
+        @return : Filters
+        @rtype  : list of callable
+
+        '''
+        lite_filters = []
+        if self.noembeds:
+            lite_filters.append(filters.noembeds)
+        if self.nodecorativeimg:
+            lite_filters.append(filters.nodecorativeimg)
+        return lite_filters
+
+    def response_headers(self, headers, environ):
+        '''
+        Add the lite mode response headers
+
+        This is applied to all moplate responses of a site with a lite
+        profile, whether or not lite mode was requested: the Vary
+        header must be on both variants.
+
+        @param headers : Response headers
+        @type  headers : list of (name, value)
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @return        : Modified response headers
+        @rtype         : list of (name, value)
+
+        '''
+        from mobilize.httputil import add_vary
+        vary = ['Save-Data']
+        if self.cookie is not None:
+            vary.append('Cookie')
+            toggle = self._toggle(environ)
+            if toggle is True:
+                headers.append(('set-cookie', '{}=1; path=/'.format(self.cookie)))
+            elif toggle is False:
+                headers.append(('set-cookie', '{}=0; path=/; max-age=0'.format(self.cookie)))
+        return add_vary(headers, vary)
+
+    def _toggle(self, environ):
+        '''
+        Check for the toggle query parameter
+
+        @return : True or False if the visitor is switching lite mode on or off; else None
+        @rtype  : bool, or None
+
+        '''
+        from mobilize.httputil import QueryParams
+        values = QueryParams(environ.get('QUERY_STRING', '')).get(self.queryparam)
+        if values:
+            return '1' == values[-1]
+        return None
+
+def _cookies(environ):
+    '''
+    Parse the request cookies
+
+    @return : cookie values, keyed by name
+    @rtype  : dict: str -> str
+
+    '''
+    from http.cookies import SimpleCookie, CookieError
+    cookies = SimpleCookie()
+    try:
+        cookies.load(environ.get('HTTP_COOKIE', ''))
+    except CookieError:
+        return {}
+    return {name : morsel.value for name, morsel in cookies.items()}
@@ -1,6 +1,19 @@
 '''
 Mobilize logging facilities
 
+Verbose logging on the request path (such as the header dumps of
+log_headers) is level-guarded, so it costs next to nothing when the
+level is disabled: no message is formatted, and no log record is
+created.
+
+Handler I/O - writing to disk, syslog, etc. - can be moved off the
+request thread with queue_logging.
+
+The mobile site can set these in defs.py:
+
+  LOGLEVEL           : level of the mobilize logger
+  HEADERS_LOG_SAMPLE : fraction of requests, from 0 to 1, whose headers are logged at INFO level
+
 '''
 
 import logging
@@ -10,19 +23,132 @@ try:
     from defs import LOGLEVEL
 except ImportError:
     LOGLEVEL = logging.WARNING
+try:
+    from defs import HEADERS_LOG_SAMPLE
+except ImportError:
+    HEADERS_LOG_SAMPLE = 1.0
 logger = logging.getLogger('mobilize')
 logger.setLevel(LOGLEVEL)
 
+#: The listener of queue_logging, once started
+_listener = None
+
 def format_headers_log(label, reqinfo, headers, **kw):
     '''
     Format HTTP headers for logging
     '''
+    return _format_headers_log(label, reqinfo.method, reqinfo.url, headers, kw)
+
+def _format_headers_log(label, method, url, headers, kw):
     msg = '%s (%s %s): %s' % (
         label,
-        reqinfo.method,
-        reqinfo.url,
+        method,
+        url,
         str(headers),
         )
     for k, v in kw.items():
         msg += ', %s=%s' % (k, v)
     return msg
+
+class HeadersLog:
+    '''
+    Log message of HTTP headers, formatted only if and when emitted
+
+    The attributes are available to handlers and filters wanting
+    structured data rather than the formatted message, through the
+    msg attribute of the log record.
+    
+    '''
+    def __init__(self, label, reqinfo, headers, **kw):
+        self.label = label
+        self.method = reqinfo.method
+        self.url = reqinfo.url
+        self.headers = headers
+        self.kw = kw
+
+    def __str__(self):
+        return _format_headers_log(self.label, self.method, self.url, self.headers, self.kw)
+
+def headers_logged(reqinfo):
+    '''
+    Whether headers are logged for this request
+
+    This is False unless the logger is enabled for INFO; and then only
+    for a sample of requests (see HEADERS_LOG_SAMPLE).  The sampling
+    decision is made once per request, so all header logs of a
+    request are either logged or not.
+
+    @param reqinfo : Request info
+    @type  reqinfo : mobilize.httputil.RequestInfo
+
+    @return        : True iff headers are logged
+    @rtype         : bool
+    
+    '''
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    if reqinfo.headers_logged is None:
+        import random
+        reqinfo.headers_logged = HEADERS_LOG_SAMPLE >= 1 or random.random() < HEADERS_LOG_SAMPLE
+    return reqinfo.headers_logged
+
+def log_headers(label, reqinfo, headers, **kw):
+    '''
+    Log HTTP headers at INFO level, if enabled for this request
+
+    See headers_logged.  Arguments are as for format_headers_log.
+    
+    '''
+    if headers_logged(reqinfo):
+        logger.info(HeadersLog(label, reqinfo, headers, **kw))
+
+def queue_logging(handlers=None):
+    '''
+    Emit mobilize log records from a background thread
+
+    The logger's handlers are moved behind a queue: the request thread
+    only puts records on the queue, and a QueueListener thread passes
+    them on to the handlers.  Messages are still formatted on the
+    request thread (so they reflect the request's state at the time),
+    but only for enabled levels.
+
+    Calling this again after the first time does nothing.
+
+    @param handlers : Handlers to emit through; if None, the logger's current handlers, or a stderr handler if it has none
+    @type  handlers : list of logging.Handler
+
+    @return         : The started listener
+    @rtype          : logging.handlers.QueueListener
+    
+    '''
+    global _listener
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+    if _listener is not None:
+        return _listener
+    if handlers is None:
+        handlers = list(logger.handlers) or [logging.StreamHandler()]
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    records = queue.Queue(-1)
+    logger.addHandler(QueueHandler(records))
+    # The handlers now receive mobilize's records through the
+    # listener; don't also pass them up to the root logger's.
+    logger.propagate = False
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+def stop_queue_logging():
+    '''
+    Stop the listener of queue_logging, emitting any queued records
+
+    This is done automatically at exit.
+    
+    '''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
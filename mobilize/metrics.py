@@ -0,0 +1,337 @@
+'''
+Counters and latency histograms of mobilize internals
+
+Metrics are exposed in the Prometheus text format at an internal
+path of the mobile site, once MobileSite.metrics_path is set.
+
+Under mod_wsgi, a mobile site runs in several processes.  So that a
+scrape sees the totals of all of them, each process keeps its values
+in its own memory-mapped file, in a directory shared by all of them;
+the metrics handler sums the files of every process.  The directory
+is set with METRICS_DIR in defs.py, and must be writable by the
+server processes, and emptied when the server (re)starts.  Without
+METRICS_DIR, values are kept in memory, and a scrape only sees those
+of the process serving it.
+
+Metrics are declared once, at module level:
+
+  REQUESTS = Counter('mobilize_requests_total', 'Requests, by handler', ('handler',))
+  REQUESTS.inc(handler='home')
+
+'''
+
+import os
+import json
+import mmap
+import struct
+import threading
+
+try:
+    from defs import METRICS_DIR
+except ImportError:
+    METRICS_DIR = None
+
+#: Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+#: All declared metrics, in order of declaration
+REGISTRY = []
+
+class Metric:
+    '''
+    Base class of metrics
+
+    A metric has a fixed set of label names; each distinct
+    combination of label values is a separate time series.
+
+    '''
+    #: Prometheus metric type
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        '''
+        ctor
+
+        @param name       : Metric name
+        @type  name       : str
+
+        @param doc        : Help text
+        @type  doc        : str
+
+        @param labelnames : Label names
+        @type  labelnames : sequence of str
+
+        '''
+        assert self.kind is not None, 'subclass must define kind'
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _check(self, labels):
+        assert set(labels) == set(self.labelnames), (self.name, labels)
+
+    def _key(self, sample, labels):
+        return json.dumps([sample, sorted((k, str(v)) for k, v in labels.items())])
+
+    def samples(self, values):
+        '''
+        Samples of this metric, for exposition
+
+        @param values : Aggregated values of all metrics, by sample name, then sorted label pairs
+        @type  values : dict: str -> dict: tuple -> float
+
+        @return       : (sample name, labels, value) triples
+        @rtype        : iterator of (str, list of (str, str), float)
+
+        '''
+        for labels, value in sorted(values.get(self.name, {}).items()):
+            yield self.name, list(labels), value
+
+class Counter(Metric):
+    '''
+    A value that only goes up
+    '''
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._check(labels)
+        _store().add(self._key(self.name, labels), amount)
+
+class Histogram(Metric):
+    '''
+    Distribution of observed values, such as latencies
+
+    Values are counted in buckets by upper bound.  Each observation
+    only updates one bucket; the cumulative counts of the Prometheus
+    format are computed at exposition time.
+
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        '''
+        ctor
+
+        See Metric.  Buckets are the upper bounds of the buckets,
+        sorted; an infinite bucket is implied.
+
+        '''
+        super().__init__(name, doc, labelnames)
+        assert list(buckets) == sorted(buckets), buckets
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def observe(self, value, **labels):
+        import bisect
+        self._check(labels)
+        store = _store()
+        index = bisect.bisect_left(self.buckets, value)
+        bound = self.buckets[index] if index < len(self.buckets) else float('inf')
+        store.add(self._key(self.name + '_bucket', dict(labels, le=_floatstr(bound))), 1)
+        store.add(self._key(self.name + '_sum', labels), value)
+        store.add(self._key(self.name + '_count', labels), 1)
+
+    def time(self, **labels):
+        '''
+        Context manager observing the time spent in its block, in seconds
+        '''
+        return _Timer(self, labels)
+
+    def samples(self, values):
+        buckets = values.get(self.name + '_bucket', {})
+        counts = values.get(self.name + '_count', {})
+        sums = values.get(self.name + '_sum', {})
+        for labels in sorted(counts):
+            cumulative = 0
+            for bound in self.buckets + (float('inf'),):
+                le = _floatstr(bound)
+                cumulative += buckets.get(tuple(sorted(labels + (('le', le),))), 0)
+                yield self.name + '_bucket', list(labels) + [('le', le)], cumulative
+            yield self.name + '_sum', list(labels), sums.get(labels, 0)
+            yield self.name + '_count', list(labels), counts[labels]
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        import time
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        import time
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+def exposition():
+    '''
+    The current values of all metrics, in the Prometheus text format
+
+    @return : Exposition text
+    @rtype  : str
+
+    '''
+    values = {}
+    for key, value in collect().items():
+        sample, labels = json.loads(key)
+        values.setdefault(sample, {})[tuple(tuple(pair) for pair in labels)] = value
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP {} {}'.format(metric.name, metric.doc.replace('\\', r'\\').replace('\n', r'\n')))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        for sample, labels, value in metric.samples(values):
+            if labels:
+                sample += '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels) + '}'
+            lines.append('{} {}'.format(sample, _floatstr(value)))
+    return '\n'.join(lines) + '\n'
+
+def collect():
+    '''
+    Values of all samples, summed over all processes
+
+    @return : Values by sample key
+    @rtype  : dict: str -> float
+
+    '''
+    if METRICS_DIR is None:
+        return dict(_store().items())
+    totals = {}
+    for filename in os.listdir(METRICS_DIR):
+        if not (filename.startswith(_FILE_PREFIX) and filename.endswith('.db')):
+            continue
+        with open(os.path.join(METRICS_DIR, filename), 'rb') as handle:
+            data = handle.read()
+        for key, value, _ in _read_entries(data):
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+# Metrics of mobilize itself
+
+REQUESTS = Counter('mobilize_requests_total', 'Requests, by handler', ('handler',))
+ORIGIN_RESPONSES = Counter('mobilize_origin_responses_total', 'Responses from the source site, by status code', ('status',))
+ORIGIN_LATENCY = Histogram('mobilize_origin_seconds', 'Time waiting on the source site', ('handler',))
+RENDER_LATENCY = Histogram('mobilize_render_seconds', 'Moplate rendering time', ('moplate',))
+CACHE = Counter('mobilize_cache_lookups_total', 'Cache lookups, by cache and result (hit or miss)', ('cache', 'result'))
+SECURITY_BLOCKS = Counter('mobilize_security_blocks_total', 'Requests dropped by security hooks')
+PASSTHROUGH_FALLBACKS = Counter('mobilize_passthrough_fallbacks_total', 'Fatal handler errors falling back to passthrough, by handler', ('handler',))
+RESPONSE_BYTES = Counter('mobilize_response_bytes_total', 'Response body bytes, by handler', ('handler',))
+
+# supporting code
+
+_FILE_PREFIX = 'metrics_'
+_store_lock = threading.Lock()
+_stores = {}
+
+def _store():
+    '''
+    The value store of the current process
+
+    Stores are keyed by process ID, so a process forked after the
+    store was opened gets its own file.
+    '''
+    pid = os.getpid()
+    store = _stores.get(pid)
+    if store is None:
+        with _store_lock:
+            store = _stores.get(pid)
+            if store is None:
+                if METRICS_DIR is None:
+                    store = _MemoryDict()
+                else:
+                    store = _MmapedDict(os.path.join(METRICS_DIR, '{}{}.db'.format(_FILE_PREFIX, pid)))
+                _stores[pid] = store
+    return store
+
+class _MemoryDict:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+class _MmapedDict:
+    '''
+    Dict of str -> float, kept in a memory-mapped file
+
+    The file starts with the number of bytes in use (a 4 byte int,
+    padded to 8 bytes), followed by entries of: key length (4 byte
+    int), key (utf-8, padded to a multiple of 8 bytes along with the
+    length), value (8 byte float).  Entries are never removed, and the
+    used length is updated after an entry is complete, so other
+    processes can read the file at any time.
+
+    Only one process writes to a file.
+    '''
+    _INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if 0 == os.fstat(self._file.fileno()).st_size:
+            self._file.truncate(self._INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = struct.unpack_from('=i', self._mmap, 0)[0]
+        if 0 == self._used:
+            self._used = 8
+            struct.pack_into('=i', self._mmap, 0, self._used)
+        self._positions = {key : pos for key, _, pos in _read_entries(self._mmap)}
+
+    def add(self, key, amount):
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._append(key)
+            value = struct.unpack_from('=d', self._mmap, pos)[0]
+            struct.pack_into('=d', self._mmap, pos, value + amount)
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _read_entries(self._mmap)]
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack('=i{}sd'.format(len(padded)), len(encoded), padded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('=i', self._mmap, 0, self._used)
+        pos = self._used - 8
+        self._positions[key] = pos
+        return pos
+
+def _read_entries(data):
+    '''
+    Generate the (key, value, value position) entries of a _MmapedDict file
+    '''
+    used = struct.unpack_from('=i', data, 0)[0] if len(data) >= 8 else 0
+    pos = 8
+    while pos < used:
+        keylen = struct.unpack_from('=i', data, pos)[0]
+        key = bytes(data[pos + 4:pos + 4 + keylen]).decode('utf-8')
+        pos += 4 + keylen + (8 - (keylen + 4) % 8)
+        yield key, struct.unpack_from('=d', data, pos)[0], pos
+        pos += 8
+
+def _floatstr(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
@@ -0,0 +1,292 @@
+'''
+On-demand profiling of individual requests
+
+A site with a profile spool directory (MobileSite.profile_dir) can
+have single requests run under a profiler, with the results written
+to that directory.  A request is profiled when either:
+
+  - it is sampled: one in every MobileSite.profile_sample requests; or
+  - it carries a valid signed token, in the X-MWU-Profile request
+    header or the mwu_profile query parameter, and comes from an
+    address in MobileSite.profile_allow.  The query parameter is not
+    passed on to the source site.
+
+Tokens are signed with MobileSite.profile_secret, and expire; create
+them with mk_token:
+
+  python3 -c 'from mobilize.profiling import mk_token; print(mk_token("SECRET"))'
+
+Each profiled request leaves two files in the spool directory, named
+after the time, process, handler (e.g. moplate) name and URL: the
+profile itself, and a .json file describing the request.  The profile
+is either a pstats file (profile_mode 'cprofile'), or collapsed stacks
+from a statistical sampler (profile_mode 'sample'), which
+flamegraph.pl and similar tools turn into flame graphs.
+
+'''
+
+import os
+import sys
+import time
+import threading
+
+#: WSGI environment key of the request header carrying a profiling token
+PROFILE_HEADER = 'HTTP_X_MWU_PROFILE'
+
+#: Query parameter carrying a profiling token
+PROFILE_QUERYPARAM = 'mwu_profile'
+
+def mk_token(secret, ttl=300, now=None):
+    '''
+    Create a token requesting a profile
+
+    @param secret : Shared secret (see MobileSite.profile_secret)
+    @type  secret : str
+
+    @param ttl    : Seconds the token is valid for
+    @type  ttl    : int
+
+    @return       : Token
+    @rtype        : str
+
+    '''
+    if now is None:
+        now = time.time()
+    expires = int(now) + ttl
+    return '{}.{}'.format(expires, _sign(secret, expires))
+
+def valid_token(secret, token, now=None):
+    '''
+    Whether a token is correctly signed, and not expired
+
+    @param secret : Shared secret
+    @type  secret : str
+
+    @param token  : Token from mk_token
+    @type  token  : str
+
+    @return       : True iff valid
+    @rtype        : bool
+
+    '''
+    import hmac
+    if now is None:
+        now = time.time()
+    expires, _, signature = token.partition('.')
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    if expires < now:
+        return False
+    return hmac.compare_digest(signature, _sign(secret, expires))
+
+def requested(msite, environ):
+    '''
+    The profiler to run the request under, if any
+
+    @param msite   : Mobile site
+    @type  msite   : mobilize.base.MobileSite
+
+    @param environ : WSGI environment
+    @type  environ : dict
+
+    @return        : Profiler, or None to not profile the request
+    @rtype         : CProfiler, or SamplingProfiler
+
+    '''
+    import random
+    if msite.profile_dir is None:
+        return None
+    if msite.profile_sample and 0 == random.randrange(msite.profile_sample):
+        return PROFILERS[msite.profile_mode]()
+    if msite.profile_secret is None or environ.get('REMOTE_ADDR') not in msite.profile_allow:
+        return None
+    token = _token(environ)
+    if token is not None and valid_token(msite.profile_secret, token):
+        return PROFILERS[msite.profile_mode]()
+    return None
+
+def without_token(msite, rel_url):
+    '''
+    A requested URL, without any profiling token query parameter
+
+    Tokens are for mobilize alone, and are not passed on to the
+    source site.
+
+    @param msite   : Mobile site
+    @type  msite   : mobilize.base.MobileSite
+
+    @param rel_url : Relative URL of the request
+    @type  rel_url : str
+
+    @return        : Relative URL
+    @rtype         : str
+
+    '''
+    path, _, query = rel_url.partition('?')
+    if msite.profile_dir is None or PROFILE_QUERYPARAM not in query:
+        return rel_url
+    from urllib.parse import unquote_plus
+    kept = [param for param in query.split('&')
+            if unquote_plus(param.partition('=')[0]) != PROFILE_QUERYPARAM]
+    if not kept:
+        return path
+    return path + '?' + '&'.join(kept)
+
+def run(profiler, spooldir, name, environ, func):
+    '''
+    Run a function under a profiler, writing the results to the spool directory
+
+    Profiling never breaks the request: if the profiler cannot start
+    (for instance, because another request is being profiled in the
+    same process, which cProfile does not support on all Python
+    versions), or its results cannot be written, a warning is logged
+    and the function runs normally.
+
+    @param profiler : Profiler
+    @type  profiler : CProfiler, or SamplingProfiler
+
+    @param spooldir : Directory to write the profile to
+    @type  spooldir : str
+
+    @param name     : Name of the handler of the request
+    @type  name     : str
+
+    @param environ  : WSGI environment
+    @type  environ  : dict
+
+    @param func     : Function to profile, taking no arguments
+    @type  func     : callable
+
+    @return         : What func returns
+
+    '''
+    from mobilize.log import logger
+    try:
+        profiler.start()
+    except ValueError as ex:
+        logger.warning('Could not start profiler: %s', ex)
+        return func()
+    started = time.time()
+    try:
+        return func()
+    finally:
+        profiler.stop()
+        seconds = time.time() - started
+        try:
+            _write(profiler, spooldir, name, environ, started, seconds)
+        except OSError as ex:
+            logger.warning('Could not write profile to %s: %s', spooldir, ex)
+
+class CProfiler:
+    '''
+    Deterministic profiler, from cProfile, writing pstats files
+    '''
+    kind = 'cprofile'
+    suffix = '.pstats'
+
+    def start(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+class SamplingProfiler:
+    '''
+    Statistical profiler, writing collapsed stacks
+
+    A background thread samples the stack of the profiled thread at
+    a fixed interval.  This has much less overhead than cProfile,
+    and its output is what flame graph tools expect.
+    '''
+    kind = 'sample'
+    suffix = '.collapsed'
+
+    #: Seconds between samples
+    interval = 0.005
+
+    def start(self):
+        import collections
+        self.thread_id = threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='mobilize-profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def write(self, path):
+        with open(path, 'w') as handle:
+            for stack, count in sorted(self.stacks.items()):
+                handle.write('{} {}\n'.format(stack, count))
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+#: Profilers, by MobileSite.profile_mode
+PROFILERS = {profiler.kind : profiler for profiler in (CProfiler, SamplingProfiler)}
+
+# supporting code
+
+def _sign(secret, expires):
+    import hmac
+    import hashlib
+    return hmac.new(secret.encode('utf-8'), str(expires).encode('utf-8'), hashlib.sha256).hexdigest()
+
+def _token(environ):
+    token = environ.get(PROFILE_HEADER)
+    if token is None and PROFILE_QUERYPARAM in environ.get('QUERY_STRING', ''):
+        from mobilize.httputil import QueryParams
+        values = QueryParams(environ['QUERY_STRING']).get(PROFILE_QUERYPARAM)
+        if values:
+            token = values[-1]
+    return token
+
+def _collapse(frame):
+    '''
+    A stack in the collapsed format: frames from the outermost, separated by semicolons
+    '''
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _slug(value, maxlen=60):
+    import re
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', value).strip('_')[:maxlen] or '_'
+
+def _write(profiler, spooldir, name, environ, started, seconds):
+    import json
+    from mobilize.httputil import get_rel_url
+    rel_url = get_rel_url(environ)
+    base = os.path.join(spooldir, '{}.{:03d}-{}-{}-{}'.format(
+            time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)),
+            int(started * 1000) % 1000,
+            os.getpid(),
+            _slug(name),
+            _slug(rel_url),
+            ))
+    profiler.write(base + profiler.suffix)
+    with open(base + '.json', 'w') as handle:
+        json.dump({
+                'handler'  : name,
+                'method'   : environ.get('REQUEST_METHOD'),
+                'rel_url'  : rel_url,
+                'started'  : started,
+                'seconds'  : seconds,
+                'profiler' : profiler.kind,
+                'profile'  : os.path.basename(base + profiler.suffix),
+                }, handle)
@@ -0,0 +1,163 @@
+'''
+Render plans: what a moplate works out once, rather than per request
+
+A moplate renders every page with the same components and filters,
+and much of what it takes to apply them does not depend on the
+request.  So each Moplate compiles a RenderPlan when it is created,
+holding:
+
+  - each extracted component's own filters, with no-op filters
+    dropped (see noop), and a filter listed more than once applied
+    only where it first appears (see prune);
+  - the moplate-level filters (see Moplate.mk_moplate_filters), bound
+    to the moplate's settings - unless a subclass makes its own,
+    which may then depend on the request; and
+  - for each request class, the components relevant to it, in order,
+    with their IDs.
+
+The request class is whether optional components are left out (see
+mobilize.lite).  If any component decides its relevance itself, by
+overriding Component.relevant, relevant components are instead found
+for each request.
+
+At render time, the plan is completed with what depends on the
+request: the site filters (see MobileSite.mk_site_filters), and the
+relevance of filters having a relevant() method.
+
+A plan is compiled from the components as they are when the moplate
+is created.  Modify them afterwards, and the moplate's plan must be
+compiled again (see Moplate.compile_plan).
+
+'''
+
+from collections import namedtuple
+from functools import partial
+from mobilize import filters
+from mobilize import util
+
+#: For filter functions that do nothing when a keyword argument is empty: the name of that argument
+NOOP_IF_EMPTY = {
+    filters.imgsub : 'subs',
+    }
+
+#: A component to render, with its ID and its own filters (empty if not extracted)
+Step = namedtuple('Step', ('component', 'component_id', 'filters'))
+
+class RenderPlan:
+    '''
+    Request-independent parts of the rendering of a moplate
+    '''
+    def __init__(self, components, moplate_filters=None):
+        '''
+        ctor
+
+        @param components      : Components of the moplate
+        @type  components      : list
+
+        @param moplate_filters : Moplate-level filters; None if they must be made for each request
+        @type  moplate_filters : list of callable
+
+        '''
+        self.components = tuple(components)
+        if moplate_filters is None:
+            self.moplate_filters = None
+        else:
+            self.moplate_filters = prune(moplate_filters)
+        self._filters = [prune(component.filters) if component.extracted else ()
+                         for component in self.components]
+        #: Steps by request class, if relevance depends on the request class only; else None
+        self.steps_by_class = None
+        if all(default_relevance(component) for component in self.components):
+            self.steps_by_class = {
+                False : self._steps(lambda component: True),
+                True  : self._steps(lambda component: not component.optional),
+                }
+
+    def steps(self, reqinfo):
+        '''
+        The components to render for a request
+
+        @param reqinfo : request info
+        @type  reqinfo : mobilize.httputil.RequestInfo
+
+        @return        : Steps, in order
+        @rtype         : tuple of Step
+
+        '''
+        if self.steps_by_class is not None:
+            return self.steps_by_class[request_class(reqinfo)]
+        return self._steps(lambda component: component.relevant(reqinfo))
+
+    def _steps(self, relevant):
+        steps = []
+        for component, component_filters in zip(self.components, self._filters):
+            if relevant(component):
+                component_id = getattr(component, 'idname', None) or util.idname(len(steps))
+                steps.append(Step(component, component_id, component_filters))
+        return tuple(steps)
+
+def request_class(reqinfo):
+    '''
+    Class of a request, as far as default component relevance goes
+
+    @param reqinfo : request info
+    @type  reqinfo : mobilize.httputil.RequestInfo
+
+    @return        : Whether optional components are left out
+    @rtype         : bool
+
+    '''
+    lite = getattr(reqinfo, 'lite', None)
+    return lite is not None and lite.skip_optional
+
+def default_relevance(component):
+    '''
+    Whether a component's relevance follows Component.relevant
+
+    @param component : Component
+    @type  component : mobilize.components.Component
+
+    @return          : False if the component decides its relevance itself
+    @rtype           : bool
+
+    '''
+    from mobilize.components import Component, SiteChrome
+    if isinstance(component, SiteChrome):
+        return default_relevance(component.component)
+    return type(component).relevant is Component.relevant
+
+def noop(filt):
+    '''
+    Whether a filter is known to do nothing, whatever it is applied to
+
+    @param filt : Filter
+    @type  filt : callable
+
+    @return     : True iff the filter does nothing
+    @rtype      : bool
+
+    '''
+    if isinstance(filt, partial) and filt.func in NOOP_IF_EMPTY:
+        argument = NOOP_IF_EMPTY[filt.func]
+        return argument in filt.keywords and not filt.keywords[argument]
+    return False
+
+def prune(filts):
+    '''
+    Filters, without no-op ones, and each applied once only
+
+    @param filts : Filters, in the order applied
+    @type  filts : list of callable
+
+    @return      : Pruned filters, in the order applied
+    @rtype       : tuple of callable
+
+    '''
+    pruned = []
+    seen = set()
+    for filt in filts:
+        if id(filt) in seen or noop(filt):
+            continue
+        seen.add(id(filt))
+        pruned.append(filt)
+    return tuple(pruned)
@@ -48,6 +48,12 @@ security of the client's mobile web presence is concerned.
 '''
 import re
 
+#: Known phpnuke sql injection vectors
+_PHPNUKE_SQLINJECTION_REGEXES = (
+    r'(?i)^/modules.php\?.*select.*nuke_',
+    r'(?i)^/index.php\?.*select.*nuke_authors',
+    )
+
 class SecurityException(Exception):
     pass
 
@@ -57,11 +63,48 @@ class DropResponseSignal(SecurityException):
 class SecurityHook:
     '''
     Represents a single security hook designed to protect against one or more vulnerabilities
+
+    DECLARATIVE RULES
+
+    Most hooks just need to drop requests whose URL matches some
+    pattern.  Rather than implementing check_request, such a hook
+    declares its rules as class attributes:
+
+      path_prefixes : relative URLs starting with any of these are dropped
+      path_suffixes : relative URLs ending with any of these are dropped
+      query_keys    : requests with any of these query parameters are dropped
+      query_values  : dict mapping a query parameter to forbidden values
+      regexes       : regular expressions searched for in the relative URL
+
+    The relative URL here is the full request URI, including any query
+    string.  Query parameters and their values are compared after
+    unquoting (see mobilize.httputil.QueryParams).
+
+    A site compiles the rules of all its hooks into a single
+    SecurityRules matcher, which checks each request once, no matter
+    how many hooks there are (see MobileSite.security_rules).  A hook
+    can still implement check_request for checks the rules cannot
+    express; it is called after the compiled rules.
     '''
 
     #: Tags of vulnerabilites addressed by this hook
     vulntags = {}
 
+    #: Forbidden relative URL prefixes
+    path_prefixes = ()
+
+    #: Forbidden relative URL suffixes
+    path_suffixes = ()
+
+    #: Forbidden query parameters
+    query_keys = ()
+
+    #: Forbidden query parameter values: dict mapping parameter name to a collection of values
+    query_values = {}
+
+    #: Regular expressions (as str) that must not match the relative URL
+    regexes = ()
+
     def response(self, headers):
         '''
         Handle security needs for response headers
@@ -74,10 +117,15 @@ class SecurityHook:
         '''
         Checks for any security issues at the initial http request phase
 
+        By default, this checks the hook's declarative rules.  Note
+        that within a site, the rules of all hooks are compiled and
+        checked together by SecurityRules instead; it only invokes
+        this method on hooks that override it.
+
         @raises DropResponseSignal : appears to be an incoming security attack worthy of dropping a response entirely
         
         '''
-        pass
+        SecurityRules([self]).check_request(reqinfo)
 
 class NoPoweredBy(SecurityHook):
     '''
@@ -97,14 +145,10 @@ class WpTagListing(SecurityHook):
     http://web.nvd.nist.gov/view/vuln/detail?vulnId=CVE-2000-0236
     '''
     vulntags = { 'cve-2000-0236' }
-    
-    def check_request(self, reqinfo):
-        forbiddens = {
-            'wp-cs-dump',
-            'wp-ver-info',
-            }
-        if not forbiddens.isdisjoint(reqinfo.queryparams.keys()):
-            raise DropResponseSignal()
+    query_keys = (
+        'wp-cs-dump',
+        'wp-ver-info',
+        )
 
 class SquirrelMailMisc(SecurityHook):
     '''
@@ -140,10 +184,8 @@ class SquirrelMailMisc(SecurityHook):
         'cve-2005-2095',
         'cve-2006-3665',
         }
-    def check_request(self, reqinfo):
-        # Drop requests to URLs related to squirrelmail
-        if reqinfo.rel_url.startswith('/mail/src/'):
-            raise DropResponseSignal()
+    # Drop requests to URLs related to squirrelmail
+    path_prefixes = ('/mail/src/',)
 
 class PhpInfo(SecurityHook):
     '''
@@ -158,9 +200,7 @@ class PhpInfo(SecurityHook):
       http://m.example.com/phpinfo.php
       
     '''
-    def check_request(self, reqinfo):
-        if reqinfo.rel_url.startswith('/phpinfo.php'):
-            raise DropResponseSignal()
+    path_prefixes = ('/phpinfo.php',)
 
 class PhpEasterEggs(SecurityHook):
     '''
@@ -171,16 +211,14 @@ class PhpEasterEggs(SecurityHook):
       http://m.example.com/?=PHPB8B5F2A0-3C92-11d3-A3A9-4C7B08C10000
 
     '''
-    def check_request(self, reqinfo):
-        forbiddens = {
+    query_values = {
+        '' : {
             'PHPB8B5F2A0-3C92-11d3-A3A9-4C7B08C10000',
             'PHPE9568F34-D428-11d2-A769-00AA001ACF42',
             'PHPE9568F35-D428-11d2-A769-00AA001ACF42',
             'PHPE9568F36-D428-11d2-A769-00AA001ACF42',
-            }
-        if '' in reqinfo.queryparams:
-            if not forbiddens.isdisjoint(reqinfo.queryparams['']):
-                raise DropResponseSignal()
+            },
+        }
 
 class PhpNuke(SecurityHook):
     '''
@@ -193,10 +231,7 @@ class PhpNuke(SecurityHook):
       http://m.example.com/index.php?kala=p0hh+UNION+ALL+SELECT+1,2,3,pwd,5+FROM+nuke_authors/*
     '''
     vulntags = { 'cve-2004-0269' }
-    
-    def check_request(self, reqinfo):
-        if _phpnuke_sqlinjection_urlmatch(reqinfo.rel_url):
-            raise DropResponseSignal()
+    regexes = _PHPNUKE_SQLINJECTION_REGEXES
 
 class TomcatNull(SecurityHook):
     '''
@@ -213,21 +248,196 @@ class TomcatNull(SecurityHook):
         'cve-2003-0043',
         'cve-2003-0042',
         }
+    path_suffixes = ('%00',)
+    path_prefixes = ('/cgi-bin/tomcat_proxy_directory_traversal',)
+
+class SecurityRules:
+    '''
+    The security hooks of a site, compiled for checking requests in one pass
+
+    The declarative rules of all hooks (see SecurityHook) are merged
+    into a few data structures, each checked once per request no
+    matter how many hooks contributed to it:
+
+      - path prefixes, in a trie walked along the relative URL
+      - path suffixes, in a trie walked backwards from its end
+      - query parameters and forbidden values, in a set and a dict
+      - regular expressions, combined into a single alternation
+
+    The query string is only parsed if some hook has query rules.
+
+    '''
+    def __init__(self, hooks):
+        '''
+        ctor
+
+        @param hooks : Security hooks to compile
+        @type  hooks : ordered sequence of SecurityHook
+        
+        '''
+        self.hooks = list(hooks)
+        self.prefixes = _Trie()
+        self.suffixes = _Trie()
+        self.query_keys = set()
+        self.query_values = {}
+        regexes = []
+        for hook in self.hooks:
+            for prefix in hook.path_prefixes:
+                self.prefixes.add(prefix)
+            for suffix in hook.path_suffixes:
+                self.suffixes.add(suffix[::-1])
+            self.query_keys.update(hook.query_keys)
+            for key, values in hook.query_values.items():
+                self.query_values.setdefault(key, set()).update(values)
+            regexes.extend(hook.regexes)
+        self.regex = None
+        if regexes:
+            self.regex = re.compile('|'.join(_scoped_regex(regex) for regex in regexes))
+        #: Hooks with their own check_request, which are called after the compiled rules
+        self.custom_hooks = [hook for hook in self.hooks
+                             if type(hook).check_request is not SecurityHook.check_request]
+
+    def forbidden(self, rel_url, queryparams):
+        '''
+        Whether the compiled rules forbid a request
+
+        queryparams may be a callable returning the parsed query
+        parameters, which is then only invoked if needed.
+
+        @param rel_url     : Relative request URL, including the query string
+        @type  rel_url     : str
+
+        @param queryparams : Query parameters
+        @type  queryparams : mobilize.httputil.QueryParams, or a callable returning one
+
+        @return            : True iff the request is to be dropped
+        @rtype             : bool
+        
+        '''
+        if self.prefixes.matches(rel_url):
+            return True
+        if self.suffixes.matches(reversed(rel_url)):
+            return True
+        if self.regex is not None and self.regex.search(rel_url) is not None:
+            return True
+        if self.query_keys or self.query_values:
+            if callable(queryparams):
+                queryparams = queryparams()
+            if not self.query_keys.isdisjoint(queryparams.keys()):
+                return True
+            for key, values in self.query_values.items():
+                if key in queryparams and not values.isdisjoint(queryparams[key]):
+                    return True
+        return False
+
     def check_request(self, reqinfo):
-        if reqinfo.rel_url.endswith('%00') or reqinfo.rel_url.startswith('/cgi-bin/tomcat_proxy_directory_traversal'):
+        '''
+        Check a request against all security hooks
+
+        @param reqinfo : Request info
+        @type  reqinfo : mobilize.httputil.RequestInfo
+
+        @raises DropResponseSignal : appears to be an incoming security attack worthy of dropping a response entirely
+        
+        '''
+        if self.forbidden(reqinfo.rel_url, lambda: reqinfo.queryparams):
             raise DropResponseSignal()
+        for hook in self.custom_hooks:
+            hook.check_request(reqinfo)
+
+    def check_environ(self, environ):
+        '''
+        Check a request against all security hooks, straight from the WSGI environment
+
+        The compiled rules are checked against the raw request URL and
+        query string, before a RequestInfo is created or the request
+        body is read.  A RequestInfo is only created if some hook
+        implements its own check_request.
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @raises DropResponseSignal : appears to be an incoming security attack worthy of dropping a response entirely
         
+        '''
+        from mobilize.httputil import (
+            get_rel_url,
+            QueryParams,
+            RequestInfo,
+            )
+        if self.forbidden(get_rel_url(environ), lambda: QueryParams(environ.get('QUERY_STRING', ''))):
+            raise DropResponseSignal()
+        if self.custom_hooks:
+            reqinfo = RequestInfo(environ)
+            for hook in self.custom_hooks:
+                hook.check_request(reqinfo)
+
+    def response(self, headers):
+        '''
+        Apply the response handling of all security hooks
+
+        @param headers : Response headers
+        @type  headers : list of (name, value)
+
+        @return        : Modified response headers
+        @rtype         : list of (name, value)
+        
+        '''
+        for hook in self.hooks:
+            headers = hook.response(headers)
+        return headers
+
 # supporting code
 
+class _Trie:
+    '''
+    Character trie, for matching many string prefixes at once
+    '''
+    #: Key marking the end of an added string
+    _END = None
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, s):
+        node = self.root
+        for char in s:
+            node = node.setdefault(char, {})
+        node[self._END] = True
+
+    def matches(self, chars):
+        '''
+        Whether any added string is a prefix of the character sequence
+        '''
+        node = self.root
+        if self._END in node:
+            return True
+        for char in chars:
+            node = node.get(char)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+_GLOBAL_FLAGS_RE = re.compile(r'^\(\?([aiLmsux]+)\)')
+def _scoped_regex(regex):
+    '''
+    Wrap a regex in a group, so it can be joined with others in an alternation
+
+    Leading global inline flags, like "(?i)", are turned into flags
+    scoped to the group, since global flags are only allowed at the
+    start of the combined expression.
+    '''
+    match = _GLOBAL_FLAGS_RE.match(regex)
+    if match is None:
+        return '(?:{})'.format(regex)
+    return '(?{}:{})'.format(match.group(1), regex[match.end():])
+
 def _phpnuke_sqlinjection_urlmatch(rel_url: str):
     '''
     Check whether the relative url matches some known phpnuke sql injection vectors
     '''
-    regexes = map(re.compile, {
-            r'(?i)^/modules.php\?.*select.*nuke_',
-            r'(?i)^/index.php\?.*select.*nuke_authors',
-            })
-
-    return any(regex.search(rel_url) is not None
-               for regex in regexes)
+    return _PHPNUKE_SQLINJECTION_RE.search(rel_url) is not None
 
+_PHPNUKE_SQLINJECTION_RE = re.compile('|'.join(map(_scoped_regex, _PHPNUKE_SQLINJECTION_REGEXES)))
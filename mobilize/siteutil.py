@@ -54,7 +54,5 @@ def mk_tparams(sitedefs, is_https=False):
         '''
         Parameters for templates.  Common defaults, overrideable with keyword parameters.
         '''
-        p = dict(default_params)
-        p.update(kw)
-        return p
+        return {**default_params, **kw}
     return tparams
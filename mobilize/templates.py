@@ -76,3 +76,46 @@ class TemplateLoader:
         return template
             
     
+def template_variables(template):
+    '''
+    Names of the parameters a template may use
+
+    These are found by static analysis of the template's source, and
+    that of the templates it extends, includes or imports, so they
+    are known when the template is loaded.  Variables the template
+    sets itself are left out; on the other hand, a name found may not
+    actually be used in every rendering.
+
+    @param template : Template
+    @type  template : jinja2.Template
+
+    @return         : Variable names, or None if they cannot be determined
+    @rtype          : frozenset of str, or None
+
+    '''
+    from jinja2 import meta
+    from jinja2.exceptions import TemplateNotFound
+    env = template.environment
+    if template.name is None or env.loader is None:
+        # Created from a string: the source is not kept
+        return None
+    names = set()
+    seen = set()
+    pending = [template.name]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            source = env.loader.get_source(env, name)[0]
+        except TemplateNotFound:
+            return None
+        ast = env.parse(source)
+        names |= meta.find_undeclared_variables(ast)
+        for referenced in meta.find_referenced_templates(ast):
+            if referenced is None:
+                # Name computed at render time
+                return None
+            pending.append(referenced)
+    return frozenset(names)
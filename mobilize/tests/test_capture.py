@@ -0,0 +1,98 @@
+import unittest
+from utils4test import FakeResp
+
+PAGE = '<html><head><title>Caf\xe9</title></head><body><div id="content"><p>Hello</p></div></body></html>'
+
+def environ(**kw):
+    import io
+    env = {
+        'REQUEST_METHOD'  : 'GET',
+        'REQUEST_URI'     : '/about/us.html?x=1',
+        'QUERY_STRING'    : 'x=1',
+        'HTTP_HOST'       : 'm.example.com',
+        'HTTP_COOKIE'     : 'session=secret',
+        'SERVER_PORT'     : '80',
+        'wsgi.url_scheme' : 'http',
+        'wsgi.input'      : io.BytesIO(b''),
+        'mod_wsgi.listener_port' : '80',
+        }
+    env.update(kw)
+    return env
+
+class TestCapture(unittest.TestCase):
+    def test_environ_subset(self):
+        from mobilize.capture import environ_subset
+        subset = environ_subset(environ(HTTP_AUTHORIZATION='Basic Zm9vOmJhcg=='))
+        self.assertEqual({
+                'REQUEST_METHOD'  : 'GET',
+                'REQUEST_URI'     : '/about/us.html?x=1',
+                'QUERY_STRING'    : 'x=1',
+                'HTTP_HOST'       : 'm.example.com',
+                'SERVER_PORT'     : '80',
+                'wsgi.url_scheme' : 'http',
+                }, subset)
+
+    def test_write_load(self):
+        import os
+        import tempfile
+        from mobilize.capture import write, load, capture_paths
+        resp = FakeResp({'content-type' : 'text/html; charset=iso-8859-1', 'status' : '200', 'Set-Cookie' : 'sess=SECRET'})
+        body = PAGE.encode('iso-8859-1')
+        with tempfile.TemporaryDirectory() as capture_dir:
+            path = write(capture_dir, 'about', environ(), resp, body)
+            self.assertEqual([path], capture_paths([capture_dir]))
+            self.assertTrue(path.endswith('-about-about_us.html_x_1.capture.json.gz'), path)
+            self.assertEqual([os.path.basename(path)], os.listdir(capture_dir))
+            capture = load(path)
+        self.assertEqual('about', capture.handler)
+        self.assertEqual(200, capture.status)
+        self.assertEqual({'content-type' : 'text/html; charset=iso-8859-1'}, capture.headers)
+        self.assertEqual(body, capture.body)
+        self.assertEqual('/about/us.html?x=1', capture.environ['REQUEST_URI'])
+        self.assertFalse('HTTP_COOKIE' in capture.environ)
+        self.assertEqual(os.path.basename(path)[:-len('.capture.json.gz')], capture.name)
+
+    def test_sampled(self):
+        import tempfile
+        from mobilize.capture import sampled, write
+        class Site:
+            capture_dir = None
+            capture_sample = 1
+            capture_limit = 1
+        site = Site()
+        self.assertFalse(sampled(site))
+        with tempfile.TemporaryDirectory() as capture_dir:
+            site.capture_dir = capture_dir
+            self.assertTrue(sampled(site))
+            write(capture_dir, 'about', environ(), FakeResp(), b'<html></html>')
+            # limit reached
+            self.assertFalse(sampled(site))
+            site.capture_limit = None
+            self.assertTrue(sampled(site))
+            site.capture_sample = 0
+            self.assertFalse(sampled(site))
+
+    def test_replay(self):
+        import mobilize
+        from mobilize import components
+        from mobilize.base import HandlerMap
+        from mobilize.capture import Capture, replay
+        from utils4test import fake_site, test_template_loader
+        class TestMoplate(mobilize.Moplate):
+            def default_template_loader(self):
+                return test_template_loader
+        moplate = TestMoplate([components.CssPath('#content', idname='content')], template='one.html')
+        hmap = HandlerMap([
+                ('/about/', moplate),
+                ('/files/', mobilize.passthrough),
+                ])
+        msite = fake_site(hmap)
+        headers = {'content-type' : 'text/html; charset=iso-8859-1'}
+        capture = Capture('about', 0, environ(), 200, headers, PAGE.encode('iso-8859-1'))
+        rendered = replay(msite, capture)
+        self.assertTrue('<title>Caf\xe9</title>' in rendered, rendered)
+        self.assertTrue('<p>Hello</p>' in rendered, rendered)
+        # Requests no moplate handles any more
+        for rel_url in ('/files/a.html', '/nomatch'):
+            capture = Capture('about', 0, environ(REQUEST_URI=rel_url), 200, headers, b'<html></html>')
+            self.assertEqual(None, replay(msite, capture))
@@ -384,3 +384,80 @@ class TestExtracted(unittest.TestCase):
         self.assertEqual(1, len(extracted))
         
 
+
+class TestSiteChrome(unittest.TestCase):
+    def test_refresh(self):
+        import time
+        from mobilize.components import CssPath, SiteChrome
+        from mobilize.httputil import RequestInfo
+        from utils4test import FakeHttp, fake_site, wsgienviron
+        pages = []
+        http = FakeHttp(lambda url: pages.pop(0))
+        fetched = http.fetched
+        msite = fake_site(http=http)
+        chrome = SiteChrome(CssPath('#nav', idname='nav', filters=[]), ttl=60, retry=60)
+        environ = wsgienviron(REQUEST_METHOD='GET', REQUEST_URI='/products/', HTTP_COOKIE='session=secret')
+        def refresh():
+            chrome.refresh_if_stale(msite, environ, RequestInfo(environ))
+            for _ in range(100):
+                if not chrome._refreshing:
+                    break
+                time.sleep(0.01)
+        self.assertEqual('', chrome.html())
+        # first fetch, in the request
+        pages.append((200, '<html><body><ul id="nav"><li>One</li></ul></body></html>'))
+        refresh()
+        self.assertEqual(1, len(fetched))
+        url, method, headers = fetched[0]
+        self.assertTrue(url.endswith('/'), url)
+        self.assertFalse('cookie' in {header.lower() for header in headers}, headers)
+        first = chrome.html()
+        self.assertTrue('<li>One</li>' in first, first)
+        # fresh
+        refresh()
+        self.assertEqual(1, len(fetched))
+        # stale; a failed fetch keeps the content
+        chrome._due = 0
+        pages.append((500, 'Oops'))
+        refresh()
+        self.assertEqual(2, len(fetched))
+        self.assertEqual(first, chrome.html())
+        # stale again; refreshed in the background
+        chrome._due = 0
+        pages.append((200, '<html><body><ul id="nav"><li>Two</li></ul></body></html>'))
+        refresh()
+        self.assertEqual(3, len(fetched))
+        self.assertTrue('<li>Two</li>' in chrome.html(), chrome.html())
+
+    def test_idname(self):
+        from mobilize.components import CssPath, SiteChrome
+        self.assertEqual('nav', SiteChrome(CssPath('#nav', idname='nav')).idname)
+        self.assertRaises(AssertionError, SiteChrome, CssPath('#nav'))
+
+    def test_refresh_error(self):
+        from mobilize.components import CssPath, SiteChrome
+        from mobilize.httputil import RequestInfo
+        from utils4test import fake_site, wsgienviron
+        class BrokenRequestInfo(RequestInfo):
+            def headers(self, overrides, plan=None):
+                raise ValueError('broken')
+        msite = fake_site()
+        chrome = SiteChrome(CssPath('#nav', idname='nav'))
+        environ = wsgienviron(REQUEST_METHOD='GET', REQUEST_URI='/products/')
+        self.assertRaises(ValueError, chrome.refresh_if_stale, msite, environ, BrokenRequestInfo(environ))
+        self.assertFalse(chrome._refreshing)
+
+    def test_images(self):
+        import mobilize
+        from mobilize.components import CssPath, SiteChrome
+        from utils4test import FakeHttp, fake_imgserve, fake_site
+        logo = 'http://example.com/logo.png'
+        page = '<html><body><div id="nav"><img src="{}"/></div></body></html>'.format(logo)
+        msite = fake_site(http=FakeHttp(lambda url: (200, page)), img_lqip=2, img_eager=0,
+                          mk_site_filters=mobilize.MobileSite.mk_site_filters)
+        chrome = SiteChrome(CssPath('#nav', idname='nav'))
+        with fake_imgserve({logo : {'width' : 100, 'height' : 50, 'lqip' : 'data:image/png;base64,AAAA'}}):
+            html = chrome.render_source(msite, 'http://example.com/', {})
+        self.assertTrue('id="nav"' in html, html)
+        self.assertFalse('loading=' in html, html)
+        self.assertFalse('data:image' in html, html)
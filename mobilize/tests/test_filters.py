@@ -199,6 +199,10 @@ class TestFilters(TestCase):
             {'iframe_str' : '''<p>Nothing to see here.</p>''',
              'resized_str' : '''<p>Nothing to see here.</p>''',
              },
+            # zero width: no aspect ratio to keep
+            {'iframe_str' : '''<iframe src="https://www.googletagmanager.com/ns.html?id=GTM-X" height="0" width="0" style="display:none"></iframe>''',
+             'resized_str' : '''<iframe src="https://www.googletagmanager.com/ns.html?id=GTM-X" width="280" style="display:none"></iframe>''',
+             },
             ]
         for ii, td in enumerate(testdata):
             iframe_elem = html.fragment_fromstring(td['iframe_str'], create_parent=False)
@@ -1306,3 +1310,114 @@ here's some extra trailing text for you too
         self.assertEqual('/mobile/h.png', img_h.attrib['src'])
         self.assertEqual('145', img_h.attrib['width'])
         self.assertFalse('height' in img_h.attrib)
+
+    def test_noembeds(self):
+        from mobilize.filters import noembeds
+        testdata = [
+            {'in'  : '''<div><p>Watch:</p><iframe width="560" height="315" src="https://www.youtube.com/embed/fJ8FGIQG8gM"></iframe> after</div>''',
+             'out' : '''<div><p>Watch:</p><a href="https://www.youtube.com/embed/fJ8FGIQG8gM" class="mwu-elem-embedlink">View embedded content</a> after</div>''',
+             },
+            # every embed is replaced, not just the first
+            {'in'  : '''<div><iframe src="/map1"></iframe><iframe src="/map2"></iframe></div>''',
+             'out' : '''<div><a href="/map1" class="mwu-elem-embedlink">View embedded content</a><a href="/map2" class="mwu-elem-embedlink">View embedded content</a></div>''',
+             },
+            {'in'  : '''<div><object width="800" height="344"><param name="movie" value="http://www.youtube.com/v/fJ8FGIQG8gM"><embed src="http://www.youtube.com/v/fJ8FGIQG8gM" width="800" height="344"></embed></object></div>''',
+             'out' : '''<div><a href="http://www.youtube.com/v/fJ8FGIQG8gM" class="mwu-elem-embedlink">View embedded content</a></div>''',
+             },
+            {'in'  : '''<div><object width="800" height="344"><param name="movie" value="http://www.youtube.com/v/fJ8FGIQG8gM"></object></div>''',
+             'out' : '''<div><a href="http://www.youtube.com/v/fJ8FGIQG8gM" class="mwu-elem-embedlink">View embedded content</a></div>''',
+             },
+            # no URL to link to
+            {'in'  : '''<div>a<iframe></iframe>b</div>''',
+             'out' : '''<div>ab</div>''',
+             },
+            # hidden: dropped
+            {'in'  : '''<div>a<noscript><iframe src="https://www.googletagmanager.com/ns.html?id=GTM-X" height="0" width="0" style="display:none;visibility:hidden"></iframe></noscript>b</div>''',
+             'out' : '''<div>a<noscript></noscript>b</div>''',
+             },
+            {'in'  : '''<div>a<iframe src="/pixel" width="1" height="1"></iframe><iframe src="/track" style="DISPLAY: none"></iframe><iframe src="/x" hidden></iframe>b</div>''',
+             'out' : '''<div>ab</div>''',
+             },
+            {'in'  : '''<iframe src="/map1"></iframe>''',
+             'out' : '''<a href="/map1" class="mwu-elem-embedlink">View embedded content</a>''',
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            elem = html.fromstring(td['in'])
+            noembeds(elem)
+            self.assertSequenceEqual(normxml(td['out']), normxml(elem2str(elem)), ii)
+
+    def test_nodecorativeimg(self):
+        from mobilize.filters import nodecorativeimg
+        testdata = [
+            {'in'  : '''<div><img src="/spacer.gif" alt="">One<img src="/logo.png" alt="Logo"><img src="/photo.jpg"></div>''',
+             'out' : '''<div>One<img src="/logo.png" alt="Logo"><img src="/photo.jpg"></div>''',
+             },
+            {'in'  : '''<div><img src="/a.png" role="presentation"><img src="/b.png" alt="b" aria-hidden="true"><img src="/c.png" alt="c" role="img"></div>''',
+             'out' : '''<div><img src="/c.png" alt="c" role="img"></div>''',
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            elem = html.fromstring(td['in'])
+            nodecorativeimg(elem)
+            self.assertSequenceEqual(normxml(td['out']), normxml(elem2str(elem)), ii)
+
+    def test_embedfacade(self):
+        from mobilize.filters import embedfacade
+        testdata = [
+            {'in'  : '''<div><iframe width="560" height="315" src="https://www.youtube.com/embed/fJ8FGIQG8gM" frameborder="0"></iframe> after</div>''',
+             'out' : '''<div><div class="mwu-elem-facade" data-mwu-embed="https://www.youtube.com/embed/fJ8FGIQG8gM" data-mwu-width="280" data-mwu-height="158"><img src="https://i.ytimg.com/vi/fJ8FGIQG8gM/hqdefault.jpg" width="280" height="158" alt=""><a href="https://www.youtube.com/embed/fJ8FGIQG8gM" class="mwu-elem-facade-load">Tap to load</a></div> after</div>''',
+             },
+            # every embed is processed, not just the first; unknown providers get no poster
+            {'in'  : '''<div><iframe src="/map1" width="400" height="400"></iframe><iframe src="/map2"></iframe></div>''',
+             'out' : '''<div><div class="mwu-elem-facade" data-mwu-embed="/map1" data-mwu-width="280" data-mwu-height="280"><a href="/map1" class="mwu-elem-facade-load">Tap to load</a></div><div class="mwu-elem-facade" data-mwu-embed="/map2" data-mwu-width="280" data-mwu-height="158"><a href="/map2" class="mwu-elem-facade-load">Tap to load</a></div></div>''',
+             },
+            {'in'  : '''<div><object width="800" height="344"><param name="movie" value="http://www.youtube.com/v/fJ8FGIQG8gM?fs=1"><embed src="http://www.youtube.com/v/fJ8FGIQG8gM?fs=1" width="800" height="344"></embed></object></div>''',
+             'out' : '''<div><div class="mwu-elem-facade" data-mwu-embed="http://www.youtube.com/v/fJ8FGIQG8gM?fs=1" data-mwu-width="280" data-mwu-height="120"><img src="https://i.ytimg.com/vi/fJ8FGIQG8gM/hqdefault.jpg" width="280" height="120" alt=""><a href="http://www.youtube.com/v/fJ8FGIQG8gM?fs=1" class="mwu-elem-facade-load">Tap to load</a></div></div>''',
+             },
+            # no URL: left alone
+            {'in'  : '''<div><iframe width="560"></iframe></div>''',
+             'out' : '''<div><iframe width="560"></iframe></div>''',
+             },
+            # hidden: left alone
+            {'in'  : '''<div><noscript><iframe src="https://www.googletagmanager.com/ns.html?id=GTM-X" height="0" width="0" style="display:none;visibility:hidden"></iframe></noscript></div>''',
+             'out' : '''<div><noscript><iframe src="https://www.googletagmanager.com/ns.html?id=GTM-X" height="0" width="0" style="display:none;visibility:hidden"></iframe></noscript></div>''',
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            elem = html.fromstring(td['in'])
+            embedfacade(elem)
+            self.assertSequenceEqual(normxml(td['out']), normxml(elem2str(elem)), ii)
+
+    def test_embedfacade_site_filters(self):
+        # the poster is converted to imgserve once, by the site filters
+        import mobilize
+        from mobilize.filters import embedfacade
+        from mobilize.images import to_imgserve_url
+        from utils4test import fake_imgserve
+        msite = mobilize.MobileSite(mobilize.Domains(mobile='m.example.com', desktop='www.example.com'), [])
+        elem = html.fromstring('''<div><iframe width="560" height="315" src="https://www.youtube.com/embed/fJ8FGIQG8gM"></iframe></div>''')
+        with fake_imgserve():
+            for filt in [embedfacade] + msite.mk_site_filters({'fullsite' : 'www.example.com', 'request_path' : '/video.html'}):
+                filt(elem)
+        img = elem.find('.//img')
+        self.assertEqual(to_imgserve_url('https://i.ytimg.com/vi/fJ8FGIQG8gM/hqdefault.jpg', 280, 158), img.attrib['src'])
+        self.assertEqual(1, elem2str(elem).count('_mwuimg'))
+
+    def test_heroimg(self):
+        from mobilize.filters import heroimg
+        testdata = [
+            {'in'  : '''<div><img src="/a.png" width="100"><img src="/b.png"></div>''',
+             'out' : '''<div><img src="/a.png" width="100" loading="eager" fetchpriority="high"><img src="/b.png"></div>''',
+             },
+            {'in'  : '''<img src="/a.png">''',
+             'out' : '''<img src="/a.png" loading="eager" fetchpriority="high">''',
+             },
+            {'in'  : '''<div>No images</div>''',
+             'out' : '''<div>No images</div>''',
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            elem = html.fromstring(td['in'])
+            heroimg(elem)
+            self.assertSequenceEqual(normxml(td['out']), normxml(elem2str(elem)), ii)
@@ -0,0 +1,111 @@
+import unittest
+from functools import partial
+from lxml import html
+
+SOURCE = '<html><body><div id="nav"><a href="/a">A</a> <a href="/b">B</a></div>{}<div id="main">Main</div></body></html>'
+
+#: Number of calls of countingfilter
+calls = 0
+
+def countingfilter(elem):
+    global calls
+    calls += 1
+    elem.attrib['data-filtered'] = '1'
+
+class Counting:
+    '''
+    A stateful filter, counting the links it has seen over the page
+    '''
+    def __init__(self):
+        self.count = 0
+    def __call__(self, elem):
+        self.count += sum(1 for _ in elem.iter('img'))
+    def state(self):
+        return self.count
+    def fingerprint(self):
+        return 'Counting'
+
+class FakeRequestInfo:
+    timings = None
+    def __init__(self, fragments):
+        self.fragments = fragments
+
+class TestFragmentCache(unittest.TestCase):
+    def test_fingerprint(self):
+        from mobilize import filters
+        from mobilize.images import ImgServe
+        from mobilize.fragcache import fingerprint
+        def nested(elem):
+            pass
+        self.assertEqual('mobilize.filters.remove.nobr', fingerprint(filters.nobr))
+        self.assertEqual(fingerprint(partial(filters.imgsub, subs={'/a.gif' : '/b.gif'})),
+                         fingerprint(partial(filters.imgsub, subs={'/a.gif' : '/b.gif'})))
+        self.assertNotEqual(fingerprint(partial(filters.imgsub, subs={'/a.gif' : '/b.gif'})),
+                            fingerprint(partial(filters.imgsub, subs={'/a.gif' : '/c.gif'})))
+        self.assertTrue(fingerprint(partial(filters.nomiscattrib_if, predicate=filters.nobr)) is not None)
+        self.assertTrue(fingerprint(partial(filters.table2divgroups, specmap=[filters.Spec('a', 0, 0, 1, 1)])) is not None)
+        self.assertEqual('mobilize.images.ImgServe', fingerprint(ImgServe(dpr=2)))
+        for filt in (lambda elem: None, nested, partial(filters.nomiscattrib_if, predicate=lambda elem: True), object()):
+            self.assertEqual(None, fingerprint(filt))
+
+    def test_lru(self):
+        from mobilize.fragcache import FragmentCache
+        cache = FragmentCache(2)
+        cache.put('a', 'A')
+        cache.put('b', 'B')
+        self.assertEqual('A', cache.get('a'))
+        cache.put('c', 'C')
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual('A', cache.get('a'))
+        self.assertEqual('C', cache.get('c'))
+
+    def test_component(self):
+        from mobilize.components import CssPath
+        from mobilize.fragcache import FragmentCache
+        reqinfo = FakeRequestInfo(FragmentCache(10))
+        component = CssPath('#nav', idname='nav', filters=[countingfilter], cacheable=True)
+        def render(extra_filters=None):
+            doc = html.fromstring(SOURCE.format(''))
+            component.extract(doc)
+            newelem = component.process(extra_filters=extra_filters, reqinfo=reqinfo)
+            # extracted content leaves the source document, hit or miss
+            self.assertEqual(None, doc.find('.//*[@id="nav"]'))
+            return newelem, component.html()
+        global calls
+        calls = 0
+        newelem, first = render()
+        self.assertTrue(newelem is not None)
+        self.assertEqual(1, calls)
+        self.assertTrue('data-filtered="1"' in first, first)
+        newelem, second = render()
+        self.assertEqual(None, newelem)
+        self.assertEqual(1, calls)
+        self.assertEqual(first, second)
+        # other filters make another fragment
+        render(extra_filters=[partial(countingfilter)])
+        self.assertEqual(3, calls)
+        # filters that cannot be fingerprinted prevent caching
+        for ii in range(2):
+            render(extra_filters=[lambda elem: None])
+        self.assertEqual(5, calls)
+        # without a cache, or not cacheable
+        for fragments, cacheable in ((None, True), (reqinfo.fragments, False)):
+            reqinfo.fragments = fragments
+            component.cacheable = cacheable
+            newelem, html_str = render()
+            self.assertTrue(newelem is not None)
+            self.assertEqual(first, html_str)
+
+    def test_stateful(self):
+        from mobilize.components import CssPath
+        from mobilize.fragcache import FragmentCache
+        reqinfo = FakeRequestInfo(FragmentCache(10))
+        for img, cached in (('', True), ('<img src="/x.png">', False)):
+            component = CssPath('body > div', idname='content', filters=[], cacheable=True)
+            for ii in range(2):
+                counting = Counting()
+                component.extract(html.fromstring(SOURCE.format('<div>{}</div>'.format(img))))
+                newelem = component.process(extra_filters=[counting], reqinfo=reqinfo)
+            self.assertEqual(cached, newelem is None, img)
+            self.assertEqual(0 if cached else 1, counting.count)
@@ -127,6 +127,22 @@ class TestForMoplate(unittest.TestCase):
         actual = _rendering_params(doc, [{'title' : 'Override Title'}])
         self.assertEqual(expected, actual)
 
+        # only those the template uses
+        actual = _rendering_params(doc, [{'a' : 42}], {'a', 'title'})
+        self.assertEqual({'a' : 42, 'title' : 'Source Title'}, actual)
+        actual = _rendering_params(doc, [], set())
+        self.assertEqual({}, actual)
+
+    def test_template_variables(self):
+        from jinja2 import Template
+        from mobilize.templates import template_variables
+        self.assertEqual({'title', 'elements'}, template_variables(gtt('one.html')))
+        # from the template extended
+        self.assertEqual({'title', 'elements'}, template_variables(gtt('extends.html')))
+        self.assertEqual(set(), template_variables(gtt('a.html')))
+        self.assertEqual(None, template_variables(Template('{{title}}')))
+        self.assertEqual(frozenset(['a']), TestMoplate([], template='b.html').template_variables)
+
     def test__todesktoplink(self):
         from mobilize.handlers import _todesktoplink
         self.assertEqual('http://example.com/foobar.html?mredir=0',
@@ -136,6 +152,22 @@ class TestForMoplate(unittest.TestCase):
         self.assertEqual('http://example.com/foobar.html?baz=2&mredir=0',
                          _todesktoplink('http', 'example.com', '/foobar.html?baz=2'))
 
+    def test_profiling_token(self):
+        # the token is neither fetched nor shown in the page
+        from jinja2 import Template
+        from mobilize.components import CssPath
+        from utils4test import FakeHttp, fake_site, wsgienviron
+        http = FakeHttp(lambda url: (200, MINIMAL_HTML_DOCUMENT))
+        msite = fake_site(http=http, profile_dir='/tmp')
+        moplate = mobilize.Moplate([CssPath('body', filters=[])],
+                                   template=Template('{{ request_path }} {{ todesktop }}'))
+        environ = wsgienviron(REQUEST_METHOD='GET', REQUEST_URI='/a.html?x=1&mwu_profile=123-abc',
+                              QUERY_STRING='x=1&mwu_profile=123-abc', CONTENT_LENGTH='', HTTP_HOST='m.example.com')
+        body = b''.join(moplate.wsgi_response(msite, environ, lambda status, headers: None)).decode('utf-8')
+        self.assertEqual('/a.html?x=1 http://example.com/a.html?x=1&mredir=0', body)
+        url, method, headers = http.fetched[0]
+        self.assertTrue(url.endswith('/a.html?x=1'), url)
+
 class TestWebSourcer(unittest.TestCase):
     def test_source_url(self):
         from mobilize.handlers import WebSourcer
@@ -312,3 +344,70 @@ class TestHandlers(unittest.TestCase):
             actual_html = normxml(html.tostring(actual))
             self.assertEqual(expected_html, actual_html, '{} [{}]'.format(label, ii))
 
+
+class TestMultiSourceMoplate(unittest.TestCase):
+    def test_sources(self):
+        import threading
+        from mobilize.components import CssPath
+        from mobilize.handlers import MultiSourceMoplate
+        from utils4test import FakeHttp, fake_site, wsgienviron
+        pages = {
+            '/product.html'  : (200, '<html><body><div id="product">Chair</div></body></html>'),
+            '/reviews.html'  : (200, '<html><body><div id="reviews">Comfy</div></body></html>'),
+            '/stock.html'    : (200, '<html><body><div id="stock">In stock</div></body></html>'),
+            '/missing.html'  : (404, '<html><body><div id="missing">Not found</div></body></html>'),
+            }
+        release = threading.Event()
+        def path_of(url):
+            return url[url.index('/', len('http://')):].split('?')[0]
+        def source(url):
+            if '/stock.html' == path_of(url):
+                release.wait(5)
+            return pages[path_of(url)]
+        http = FakeHttp(source)
+        class TestMultiSource(MultiSourceMoplate):
+            def default_template_loader(self):
+                return test_template_loader
+        moplate = TestMultiSource([
+                CssPath('#product', idname='product', filters=[]),
+                CssPath('#reviews', idname='reviews', filters=[], source='reviews'),
+                CssPath('#stock', idname='stock', filters=[], source='stock'),
+                CssPath('#missing', idname='missing', filters=[], source='missing'),
+                ], sources={
+                'reviews' : '/reviews.html',
+                'stock'   : '/stock.html',
+                'missing' : '/missing.html',
+                }, deadline=0.2, template='one.html')
+        msite = fake_site(http=http)
+        environ = wsgienviron(REQUEST_METHOD='GET', REQUEST_URI='/product.html?id=3', QUERY_STRING='id=3',
+                              CONTENT_LENGTH='', HTTP_HOST='m.example.com')
+        responses = []
+        try:
+            body = b''.join(moplate.wsgi_response(msite, environ, lambda status, headers: responses.append(status)))
+        finally:
+            release.set()
+        self.assertEqual(['200 OK'], responses)
+        body = body.decode('utf-8')
+        self.assertTrue('Chair' in body, body)
+        self.assertTrue('Comfy' in body, body)
+        # past the deadline, or not a 200: empty
+        self.assertFalse('In stock' in body, body)
+        self.assertFalse('Not found' in body, body)
+        self.assertEqual({'/product.html', '/reviews.html', '/stock.html', '/missing.html'},
+                         {path_of(url) for url, method, headers in http.fetched})
+        for url, method, headers in http.fetched:
+            self.assertEqual('GET', method)
+        # rendered outside a request, the other sources are empty
+        rendered = moplate.render(pages['/product.html'][1] + '<div id="reviews">Stale</div>', {})
+        self.assertTrue('Chair' in rendered, rendered)
+        self.assertFalse('Stale' in rendered, rendered)
+
+    def test_unknown_source(self):
+        from mobilize.components import CssPath
+        from mobilize.handlers import Moplate, MultiSourceMoplate
+        with self.assertRaises(AssertionError):
+            MultiSourceMoplate([CssPath('#reviews', source='reviews')], sources={'revues' : '/reviews.html'},
+                               template=gtt('a.html'))
+        # a plain moplate has no other sources
+        with self.assertRaises(AssertionError):
+            Moplate([CssPath('#reviews', source='reviews')], template=gtt('a.html'))
@@ -560,6 +560,56 @@ class TestHttp(unittest.TestCase):
             actual2 = set(dict2list(dict2))
             self.assertSetEqual(expected2, actual2, str(ii))
 
+    def test_iterheaders(self):
+        from mobilize.httputil import iterheaders
+        expected = [('a', 'b'), ('c', '1'), ('c', '2'), ('content-length', '42')]
+        self.assertListEqual(expected, list(iterheaders([('a', 'b'), ('c', ['1', '2']), ('content-length', 42)])))
+        self.assertListEqual([('a', 'b')], list(iterheaders({'a' : 'b'})))
+
+    def test_header_plan(self):
+        from mobilize.headers import HeaderPlan
+        plan = HeaderPlan({'location' : lambda e, v: v.upper()}, [('X-Added', lambda e, v: 'yes')])
+        overrides = {
+            'content-length' : '10',
+            'set-cookie'     : lambda e, v: v + '; secure',
+            }
+        testdata = [
+            ('Location', 'http://a/', 'HTTP://A/'),
+            ('Content-Length', '5', '10'),
+            ('set-cookie', 'a=b', 'a=b; secure'),
+            ('X-Other', 'same', 'same'),
+            ]
+        for header, value, expected in testdata:
+            self.assertEqual(expected, plan.transform({}, header, value, overrides), header)
+        # each header name is only resolved once
+        plan.transform({}, 'Location', 'http://b/', {})
+        self.assertEqual(len(testdata), plan.resolve.cache_info().misses)
+
+    def test_add_vary(self):
+        from mobilize.httputil import add_vary
+        testdata = [
+            {'headers' : [('content-type', 'text/html')],
+             'fields'  : ['DPR'],
+             'out'     : [('content-type', 'text/html'), ('vary', 'DPR')],
+             },
+            {'headers' : [('vary', 'Accept-Encoding'), ('content-type', 'text/html')],
+             'fields'  : ['DPR', 'Viewport-Width'],
+             'out'     : [('content-type', 'text/html'), ('vary', 'Accept-Encoding, DPR, Viewport-Width')],
+             },
+            # merge several Vary headers, and don't repeat fields
+            {'headers' : [('vary', 'Accept-Encoding'), ('Vary', 'dpr, Cookie')],
+             'fields'  : ['DPR'],
+             'out'     : [('vary', 'Accept-Encoding, dpr, Cookie')],
+             },
+            # already varies on everything
+            {'headers' : [('vary', '*')],
+             'fields'  : ['DPR'],
+             'out'     : [('vary', '*')],
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            self.assertListEqual(td['out'], add_vary(td['headers'], td['fields']), ii)
+
     def test_queryparams(self):
         from mobilize.httputil import QueryParams
         self.assertDictEqual({}, QueryParams())
@@ -602,3 +652,92 @@ class TestRequestInfo(unittest.TestCase):
         self.assertTrue(type(rawheaders) is dict, type(rawheaders))
         self.assertSequenceEqual('Mozilla/5.0 (X11; U; Linux x86_64; en-US; rv:1.9.2.7) Gecko/20100710 Firefox/3.6.7', rawheaders['User-Agent'])
         
+
+    def test_lazy(self):
+        from mobilize.httputil import RequestInfo
+        class Input:
+            reads = 0
+            def read(self):
+                self.reads += 1
+                return 'hello'
+        environ = dict(wsgienviron())
+        environ['wsgi.input'] = Input()
+        reqinfo = RequestInfo(environ)
+        self.assertEqual(0, environ['wsgi.input'].reads)
+        self.assertEqual('/Scripts/FormMail_WP2.asp', reqinfo.rel_url)
+        self.assertEqual('hello', reqinfo.body)
+        self.assertEqual('hello', reqinfo.body)
+        self.assertEqual(1, environ['wsgi.input'].reads)
+        environ['REQUEST_METHOD'] = 'GET'
+        self.assertEqual(None, RequestInfo(environ).body)
+
+    def test_body_stream(self):
+        import io
+        from mobilize.httputil import RequestInfo
+        from mobilize.exceptions import RequestBodyTooLarge
+        def environ(body, **kw):
+            env = dict(wsgienviron())
+            env['wsgi.input'] = io.BytesIO(body)
+            env.update(kw)
+            return env
+        # reads no more than the declared length
+        stream = RequestInfo(environ(b'abcdefgh', CONTENT_LENGTH='5')).body_stream()
+        self.assertEqual(5, stream.length)
+        self.assertEqual(b'abc', stream.read(3))
+        self.assertEqual(b'de', stream.read(3))
+        self.assertEqual(b'', stream.read(3))
+        # unknown length: read until exhausted
+        stream = RequestInfo(environ(b'abcdefgh', CONTENT_LENGTH='')).body_stream(maxlength=10)
+        self.assertEqual(None, stream.length)
+        self.assertEqual(b'abcdefgh', stream.read())
+        self.assertEqual(b'', stream.read())
+        # over the limit
+        self.assertRaises(RequestBodyTooLarge, RequestInfo(environ(b'abcdefgh', CONTENT_LENGTH='8')).body_stream, 4)
+        stream = RequestInfo(environ(b'abcdefgh', CONTENT_LENGTH='')).body_stream(maxlength=4)
+        self.assertEqual(b'abc', stream.read(3))
+        self.assertRaises(RequestBodyTooLarge, stream.read, 3)
+        self.assertTrue(stream.exceeded)
+        # not applicable
+        self.assertEqual(None, RequestInfo(environ(b'', REQUEST_METHOD='GET')).body_stream())
+
+    def test_body_stream_retry(self):
+        # httplib2 retries once when the connection drops before the
+        # response; the body, already consumed, must not be resent
+        import io
+        import http.client
+        import httplib2
+        from mobilize.httputil import RequestInfo, get_http
+        sent = []
+        class FakeSocket:
+            def __init__(self):
+                sent.append(b'')
+            def sendall(self, data):
+                sent[-1] += bytes(data)
+            def makefile(self, mode):
+                return io.BytesIO(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+            def close(self):
+                pass
+        class DroppingConnection(httplib2.HTTPConnectionWithTimeout):
+            attempts = 0
+            def connect(self):
+                self.sock = FakeSocket()
+            def getresponse(self):
+                DroppingConnection.attempts += 1
+                if 1 == DroppingConnection.attempts:
+                    raise http.client.RemoteDisconnected('dropped')
+                return super().getresponse()
+        for content_length in ('8', ''):
+            DroppingConnection.attempts = 0
+            del sent[:]
+            env = dict(wsgienviron(CONTENT_LENGTH=content_length))
+            env['wsgi.input'] = io.BytesIO(b'abcdefgh')
+            body = RequestInfo(env).body_stream()
+            headers = {'content-length' : content_length} if content_length else {}
+            resp, content = get_http().request('http://example.com/form', method='POST', body=body.sendable(),
+                                               headers=headers, connection_type=DroppingConnection)
+            self.assertTrue(body.resent, content_length)
+            self.assertEqual(400, resp.status)
+            # the first attempt sent the whole body; the retry, nothing but headers
+            self.assertTrue(sent[0].endswith(b'abcdefgh' if content_length else b'8\r\nabcdefgh\r\n0\r\n\r\n'), sent[0])
+            self.assertEqual(1, len(sent) - 1, sent)
+            self.assertFalse(b'abcdefgh' in sent[1], sent[1])
@@ -211,6 +211,85 @@ class TestImageOpt(unittest.TestCase):
             actual = to_imgserve_url(td['url'], td['maxw'], maxh=maxh)
             self.assertEqual(expected, actual, ii)
 
+    def test_srcset_candidates(self):
+        from mobilize.images import srcset_candidates
+        src = 'http://example.com/foo.png'
+        imgserve = '/_mwuimg/?src=http%3A%2F%2Fexample.com%2Ffoo.png'
+        testdata = [
+            # source is wide enough for every density
+            {'in' : (src, 100, 50, 1000),
+             'out' : [
+                    (imgserve + '&maxw=100&maxh=50', 100),
+                    (imgserve + '&maxw=200&maxh=100', 200),
+                    (imgserve + '&maxw=300&maxh=150', 300),
+                    ],
+             },
+            # never upscale: source itself is the widest candidate
+            {'in' : (src, 100, 50, 250),
+             'out' : [
+                    (imgserve + '&maxw=100&maxh=50', 100),
+                    (imgserve + '&maxw=200&maxh=100', 200),
+                    (src, 250),
+                    ],
+             },
+            {'in' : (src, 100, None, 200),
+             'out' : [
+                    (imgserve + '&maxw=100', 100),
+                    (src, 200),
+                    ],
+             },
+            # already at full size
+            {'in' : (src, 100, 50, 100),
+             'out' : [
+                    (src, 100),
+                    ],
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            self.assertListEqual(td['out'], srcset_candidates(*td['in']), ii)
+        self.assertListEqual([(imgserve + '&maxw=150&maxh=75', 150), (src, 250)],
+                             srcset_candidates(src, 100, 50, 250, densities=(3, 1.5)))
+
+    def test_img_sizing(self):
+        from mobilize.images import img_sizing, DEFAULT_MAXW
+        testdata = [
+            # no hints at all
+            ({}, (DEFAULT_MAXW, 1)),
+            ({'HTTP_SEC_CH_DPR' : '2', 'HTTP_SEC_CH_VIEWPORT_WIDTH' : '375'}, (340, 2)),
+            # rounded down to the device class
+            ({'HTTP_SEC_CH_DPR' : '2.625', 'HTTP_SEC_CH_VIEWPORT_WIDTH' : '412'}, (380, 2)),
+            ({'HTTP_SEC_CH_DPR' : '1.25'}, (DEFAULT_MAXW, 1)),
+            # legacy hint names
+            ({'HTTP_DPR' : '3', 'HTTP_VIEWPORT_WIDTH' : '414'}, (380, 3)),
+            # prefixed hints win over legacy ones
+            ({'HTTP_SEC_CH_DPR' : '1.5', 'HTTP_DPR' : '3'}, (DEFAULT_MAXW, 1.5)),
+            # clamped viewport widths
+            ({'HTTP_SEC_CH_VIEWPORT_WIDTH' : '100'}, (220, 1)),
+            ({'HTTP_SEC_CH_VIEWPORT_WIDTH' : '4000'}, (1260, 1)),
+            # malformed hints are ignored
+            ({'HTTP_SEC_CH_DPR' : 'high', 'HTTP_SEC_CH_VIEWPORT_WIDTH' : '-5'}, (DEFAULT_MAXW, 1)),
+            ]
+        for ii, (environ, expected) in enumerate(testdata):
+            self.assertEqual(expected, img_sizing(environ), ii)
+
+    def test_add_placeholder(self):
+        from lxml import html
+        from mobilize.images import add_placeholder
+        from mobilize.util import elem2str
+        placeholder = 'data:image/jpeg;base64,/9j/4AAQ'
+        testdata = [
+            {'in'  : '<img src="/_mwuimg/?src=a.png&amp;maxw=100" width="100">',
+             'out' : '<img width="100" data-src="/_mwuimg/?src=a.png&amp;maxw=100" src="data:image/jpeg;base64,/9j/4AAQ" class="mwu-elem-lqip">',
+             },
+            {'in'  : '<img class="photo" src="a.png" srcset="a.png 100w, b.png 200w">',
+             'out' : '<img class="photo mwu-elem-lqip" data-src="a.png" data-srcset="a.png 100w, b.png 200w" src="data:image/jpeg;base64,/9j/4AAQ">',
+             },
+            ]
+        for ii, td in enumerate(testdata):
+            img = html.fromstring(td['in'])
+            add_placeholder(img, placeholder)
+            self.assertEqual(td['out'], elem2str(img), ii)
+
     def test_convertable(self):
         '''tests for mobilize.images.convertable'''
         from lxml import html
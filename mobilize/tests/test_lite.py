@@ -0,0 +1,61 @@
+import unittest
+from mobilize.lite import LiteProfile
+
+class TestLiteProfile(unittest.TestCase):
+    def test_settings(self):
+        profile = LiteProfile(maxw=160, noembeds=False)
+        self.assertEqual(160, profile.maxw)
+        self.assertFalse(profile.noembeds)
+        self.assertEqual(200, LiteProfile().maxw)
+        from mobilize.filters import nodecorativeimg
+        self.assertListEqual([nodecorativeimg], profile.mk_filters())
+        self.assertRaises(AssertionError, LiteProfile, nosuchsetting=True)
+
+    def test_requested(self):
+        profile = LiteProfile()
+        testdata = [
+            ({}, False),
+            ({'HTTP_SAVE_DATA' : 'on'}, True),
+            ({'HTTP_SAVE_DATA' : 'off'}, False),
+            ({'HTTP_COOKIE' : 'mwu_lite=1; sid=42'}, True),
+            ({'HTTP_COOKIE' : 'mwu_lite=0'}, False),
+            ({'QUERY_STRING' : 'a=b&lite=1'}, True),
+            # query parameter overrides the cookie
+            ({'QUERY_STRING' : 'lite=0', 'HTTP_COOKIE' : 'mwu_lite=1'}, False),
+            # but not Save-Data
+            ({'QUERY_STRING' : 'lite=0', 'HTTP_SAVE_DATA' : 'on'}, True),
+            ]
+        for ii, (environ, expected) in enumerate(testdata):
+            self.assertEqual(expected, profile.requested(environ), ii)
+        nocookie = LiteProfile(cookie=None)
+        self.assertFalse(nocookie.requested({'HTTP_COOKIE' : 'mwu_lite=1'}))
+        self.assertFalse(nocookie.requested({'QUERY_STRING' : 'lite=1'}))
+        self.assertTrue(nocookie.requested({'HTTP_SAVE_DATA' : 'on'}))
+
+    def test_response_headers(self):
+        profile = LiteProfile()
+        headers = [('content-type', 'text/html'), ('vary', 'Accept-Encoding')]
+        self.assertListEqual(
+            [('content-type', 'text/html'), ('vary', 'Accept-Encoding, Save-Data, Cookie')],
+            profile.response_headers(list(headers), {}))
+        self.assertListEqual(
+            [('content-type', 'text/html'), ('set-cookie', 'mwu_lite=1; path=/'), ('vary', 'Accept-Encoding, Save-Data, Cookie')],
+            profile.response_headers(list(headers), {'QUERY_STRING' : 'lite=1'}))
+        self.assertListEqual(
+            [('content-type', 'text/html'), ('vary', 'Accept-Encoding, Save-Data')],
+            LiteProfile(cookie=None).response_headers(list(headers), {'QUERY_STRING' : 'lite=1'}))
+
+    def test_optional_component(self):
+        from mobilize.components import XPath
+        class FakeRequestInfo:
+            lite = None
+        reqinfo = FakeRequestInfo()
+        optional = XPath('//div', optional=True)
+        required = XPath('//div')
+        self.assertTrue(optional.relevant(None))
+        self.assertTrue(optional.relevant(reqinfo))
+        reqinfo.lite = LiteProfile()
+        self.assertFalse(optional.relevant(reqinfo))
+        self.assertTrue(required.relevant(reqinfo))
+        reqinfo.lite = LiteProfile(skip_optional=False)
+        self.assertTrue(optional.relevant(reqinfo))
@@ -0,0 +1,53 @@
+import unittest
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        from mobilize.log import logger
+        self.level = logger.level
+        self.handlers = list(logger.handlers)
+
+    def tearDown(self):
+        from mobilize.log import logger
+        logger.setLevel(self.level)
+        logger.handlers[:] = self.handlers
+
+    def test_log_headers(self):
+        import logging
+        from mobilize import log
+        class FakeRequestInfo:
+            method = 'GET'
+            url = 'http://example.com/'
+            headers_logged = None
+        class Headers(dict):
+            formatted = 0
+            def __str__(self):
+                self.formatted += 1
+                return super().__str__()
+        class Collect(logging.Handler):
+            def __init__(self):
+                super().__init__()
+                self.records = []
+            def emit(self, record):
+                self.records.append(record)
+        collect = Collect()
+        log.logger.handlers[:] = [collect]
+        headers = Headers({'a' : 'b'})
+
+        # disabled level: nothing formatted or recorded
+        log.logger.setLevel(logging.WARNING)
+        log.log_headers('resp', FakeRequestInfo(), headers, status=200)
+        self.assertEqual(0, headers.formatted)
+        self.assertEqual([], collect.records)
+
+        log.logger.setLevel(logging.INFO)
+        log.log_headers('resp', FakeRequestInfo(), headers, status=200)
+        self.assertEqual(1, len(collect.records))
+        record = collect.records[0]
+        self.assertEqual({'a' : 'b'}, record.msg.headers)
+        self.assertEqual("resp (GET http://example.com/): {'a': 'b'}, status=200", record.getMessage())
+
+        # sampled out
+        reqinfo = FakeRequestInfo()
+        reqinfo.headers_logged = False
+        log.log_headers('resp', reqinfo, headers)
+        self.assertEqual(1, len(collect.records))
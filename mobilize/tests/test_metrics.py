@@ -0,0 +1,61 @@
+import unittest
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from mobilize import metrics
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = metrics.METRICS_DIR, dict(metrics._stores), list(metrics.REGISTRY)
+        metrics.METRICS_DIR = self.tmpdir.name
+        metrics._stores.clear()
+        del metrics.REGISTRY[:]
+
+    def tearDown(self):
+        from mobilize import metrics
+        metrics.METRICS_DIR, stores, registry = self.saved
+        metrics._stores.clear()
+        metrics._stores.update(stores)
+        metrics.REGISTRY[:] = registry
+        self.tmpdir.cleanup()
+
+    def test_exposition(self):
+        from mobilize import metrics
+        requests = metrics.Counter('test_requests_total', 'Requests', ('handler',))
+        latency = metrics.Histogram('test_seconds', 'Latency', buckets=(.1, 1))
+        requests.inc(handler='home')
+        requests.inc(2, handler='home')
+        requests.inc(handler='a"b')
+        latency.observe(.05)
+        latency.observe(.5)
+        latency.observe(5)
+        expected = '''# HELP test_requests_total Requests
+# TYPE test_requests_total counter
+test_requests_total{handler="a\\"b"} 1
+test_requests_total{handler="home"} 3
+# HELP test_seconds Latency
+# TYPE test_seconds histogram
+test_seconds_bucket{le="0.1"} 1
+test_seconds_bucket{le="1"} 2
+test_seconds_bucket{le="+Inf"} 3
+test_seconds_sum 5.55
+test_seconds_count 3
+'''
+        self.assertEqual(expected, metrics.exposition())
+
+    def test_processes(self):
+        import os
+        from mobilize import metrics
+        requests = metrics.Counter('test_requests_total', 'Requests')
+        requests.inc()
+        # Another process's file, in the same directory
+        other = metrics._MmapedDict(os.path.join(self.tmpdir.name, 'metrics_0.db'))
+        for ii in range(1000):
+            # enough entries to grow the file
+            other.add(requests._key('test_other_{}'.format(ii), {}), 1)
+        other.add(requests._key('test_requests_total', {}), 2)
+        self.assertEqual(3, metrics.collect()[requests._key('test_requests_total', {})])
+        # reopened files keep their values
+        reopened = metrics._MmapedDict(os.path.join(self.tmpdir.name, 'metrics_0.db'))
+        reopened.add(requests._key('test_requests_total', {}), 1)
+        self.assertEqual(4, metrics.collect()[requests._key('test_requests_total', {})])
+        self.assertEqual(1001, len(reopened.items()))
@@ -0,0 +1,77 @@
+import unittest
+
+class TestProfiling(unittest.TestCase):
+    def test_token(self):
+        from mobilize.profiling import mk_token, valid_token
+        token = mk_token('secret', ttl=60, now=1000)
+        self.assertTrue(valid_token('secret', token, now=1000))
+        self.assertTrue(valid_token('secret', token, now=1060))
+        # expired
+        self.assertFalse(valid_token('secret', token, now=1061))
+        # wrong secret
+        self.assertFalse(valid_token('other', token, now=1000))
+        # tampered
+        self.assertFalse(valid_token('secret', '2000' + token[4:], now=1000))
+        self.assertFalse(valid_token('secret', 'garbage', now=1000))
+
+    def test_requested(self):
+        from mobilize.profiling import requested, mk_token, CProfiler
+        class Site:
+            profile_dir = '/tmp'
+            profile_sample = 0
+            profile_secret = 'secret'
+            profile_allow = ('127.0.0.1',)
+            profile_mode = 'cprofile'
+        token = mk_token('secret')
+        testdata = [
+            ({'REMOTE_ADDR' : '127.0.0.1', 'HTTP_X_MWU_PROFILE' : token}, True),
+            ({'REMOTE_ADDR' : '127.0.0.1', 'QUERY_STRING' : 'a=b&mwu_profile=' + token}, True),
+            ({'REMOTE_ADDR' : '10.1.2.3', 'HTTP_X_MWU_PROFILE' : token}, False),
+            ({'REMOTE_ADDR' : '127.0.0.1', 'HTTP_X_MWU_PROFILE' : mk_token('other')}, False),
+            ({'REMOTE_ADDR' : '127.0.0.1'}, False),
+            ]
+        for ii, (environ, expected) in enumerate(testdata):
+            self.assertEqual(expected, isinstance(requested(Site(), environ), CProfiler), ii)
+        site = Site()
+        site.profile_sample = 1
+        self.assertTrue(isinstance(requested(site, {}), CProfiler))
+        site.profile_dir = None
+        self.assertEqual(None, requested(site, {}))
+
+    def test_without_token(self):
+        from mobilize.profiling import without_token
+        class Site:
+            profile_dir = '/tmp'
+        testdata = [
+            ('/a.html', '/a.html'),
+            ('/a.html?mwu_profile=123-abc', '/a.html'),
+            ('/a.html?x=1&mwu_profile=123-abc&y=2', '/a.html?x=1&y=2'),
+            ('/a.html?x=1&mwu_profile=1&mwu_profile=2', '/a.html?x=1'),
+            ('/a.html?x=mwu_profile', '/a.html?x=mwu_profile'),
+            ]
+        site = Site()
+        for rel_url, expected in testdata:
+            self.assertEqual(expected, without_token(site, rel_url), rel_url)
+        # left alone when profiling is off
+        site.profile_dir = None
+        self.assertEqual('/a.html?mwu_profile=1', without_token(site, '/a.html?mwu_profile=1'))
+
+    def test_run(self):
+        import os
+        import json
+        import tempfile
+        from mobilize.profiling import run, CProfiler, SamplingProfiler
+        def work():
+            return sum(ii * ii for ii in range(200000))
+        environ = {'REQUEST_URI' : '/foo/bar.html?x=1', 'REQUEST_METHOD' : 'GET'}
+        for profiler in (CProfiler(), SamplingProfiler()):
+            with tempfile.TemporaryDirectory() as spooldir:
+                self.assertEqual(work(), run(profiler, spooldir, 'home', environ, work))
+                files = sorted(os.listdir(spooldir))
+                self.assertEqual(2, len(files), files)
+                meta = [name for name in files if name.endswith('.json')][0]
+                self.assertTrue('-home-foo_bar.html_x_1' in meta, meta)
+                with open(os.path.join(spooldir, meta)) as handle:
+                    info = json.load(handle)
+                self.assertEqual('/foo/bar.html?x=1', info['rel_url'])
+                self.assertTrue(info['profile'] in files)
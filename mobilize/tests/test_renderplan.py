@@ -0,0 +1,65 @@
+import unittest
+from functools import partial
+
+class TestRenderPlan(unittest.TestCase):
+    def test_prune(self):
+        from mobilize import filters
+        from mobilize.renderplan import noop, prune
+        subs = partial(filters.imgsub, subs={'/a.gif' : '/b.gif'})
+        nosubs = partial(filters.imgsub, subs={})
+        self.assertTrue(noop(nosubs))
+        self.assertFalse(noop(subs))
+        self.assertFalse(noop(filters.nobr))
+        self.assertEqual((filters.nobr, subs, filters.noimgsize),
+                         prune([filters.nobr, nosubs, subs, filters.nobr, filters.noimgsize]))
+        self.assertEqual((), prune([]))
+
+    def test_steps(self):
+        from mobilize.components import CssPath, RawString
+        from mobilize.lite import LiteProfile
+        from mobilize.renderplan import RenderPlan
+        from mobilize import filters
+        class FakeRequestInfo:
+            def __init__(self, lite=None):
+                self.lite = lite
+        nav = CssPath('#nav', idname='nav', postfilters=[filters.nomiscattrib])
+        ad = CssPath('#ad', optional=True)
+        footer = RawString('<p>Footer</p>')
+        plan = RenderPlan([nav, ad, footer])
+        self.assertEqual(None, plan.moplate_filters)
+        self.assertTrue(plan.steps_by_class is not None)
+        steps = plan.steps(None)
+        self.assertEqual([nav, ad, footer], [step.component for step in steps])
+        self.assertEqual(['nav', 'mwu-elem-1', 'mwu-elem-2'], [step.component_id for step in steps])
+        self.assertEqual((filters.nomiscattrib,), steps[0].filters)
+        self.assertEqual((), steps[2].filters)
+        # optional components left out
+        self.assertEqual(steps, plan.steps(FakeRequestInfo(LiteProfile(skip_optional=False))))
+        steps = plan.steps(FakeRequestInfo(LiteProfile()))
+        self.assertEqual([nav, footer], [step.component for step in steps])
+        self.assertEqual(['nav', 'mwu-elem-1'], [step.component_id for step in steps])
+        # components deciding their relevance themselves
+        class Sometimes(RawString):
+            def relevant(self, reqinfo):
+                return reqinfo.lite is None
+        sometimes = Sometimes('<p>Sometimes</p>')
+        plan = RenderPlan([sometimes, footer])
+        self.assertEqual(None, plan.steps_by_class)
+        self.assertEqual([sometimes, footer], [step.component for step in plan.steps(FakeRequestInfo())])
+        self.assertEqual([footer], [step.component for step in plan.steps(FakeRequestInfo(LiteProfile(skip_optional=False)))])
+
+    def test_moplate(self):
+        import mobilize
+        from mobilize.components import CssPath
+        from utils4test import gtt
+        moplate = mobilize.Moplate([CssPath('#content')], template=gtt('one.html'), imgsubs={'/a.gif' : '/b.gif'})
+        moplate_filters = moplate.plan.moplate_filters
+        self.assertEqual(1, len(moplate_filters))
+        self.assertEqual({'/a.gif' : '/b.gif'}, moplate_filters[0].keywords['subs'])
+        # made for each request, if a subclass makes its own
+        class OwnFilters(mobilize.Moplate):
+            def mk_moplate_filters(self, params):
+                return []
+        self.assertEqual(None, OwnFilters([], template=gtt('one.html')).plan.moplate_filters)
+        rendered = moplate.render('<html><body><div id="content"><img src="/a.gif"></div></body></html>')
+        self.assertTrue('/b.gif' in rendered, rendered)
@@ -1,4 +1,10 @@
 import unittest
+from utils4test import (
+    FakeHttp,
+    fake_site,
+    gtt,
+    wsgienviron,
+    )
 
 class TestSecurity(unittest.TestCase):
     def test_phpnuke_sqlinjection_urlmatch(self):
@@ -13,3 +19,111 @@ class TestSecurity(unittest.TestCase):
             }
         for testurl in testurls:
             self.assertTrue(_phpnuke_sqlinjection_urlmatch(testurl), testurl)
+
+    def test_security_rules(self):
+        from mobilize.httputil import QueryParams
+        from mobilize.secure import (
+            SecurityRules,
+            WpTagListing,
+            SquirrelMailMisc,
+            PhpInfo,
+            PhpEasterEggs,
+            PhpNuke,
+            TomcatNull,
+            )
+        rules = SecurityRules([
+                WpTagListing(),
+                SquirrelMailMisc(),
+                PhpInfo(),
+                PhpEasterEggs(),
+                PhpNuke(),
+                TomcatNull(),
+                ])
+        testdata = [
+            ('/', False),
+            ('/mail/', False),
+            ('/mail/src/login.php', True),
+            ('/phpinfo.php', True),
+            ('/phpinfo.php?a=b', True),
+            ('/info.php', False),
+            ('/?wp-cs-dump', True),
+            ('/?foo=wp-cs-dump', False),
+            ('/?=PHPB8B5F2A0-3C92-11d3-A3A9-4C7B08C10000', True),
+            ('/?=PHPE9568F36-D428-11d2-A769-00AA001ACF42', True),
+            ('/?=PHPE9568F37-D428-11d2-A769-00AA001ACF42', False),
+            ('/?x=PHPB8B5F2A0-3C92-11d3-A3A9-4C7B08C10000', False),
+            ('/index.php?template=../config.php%00', True),
+            ('/index.php?template=%00a', False),
+            ('/cgi-bin/tomcat_proxy_directory_traversal', True),
+            ('/INDEX.PHP?kala=1+UNION+SELECT+pwd+FROM+nuke_authors', True),
+            ('/index.php?kala=1+UNION+SELECT+pwd+FROM+users', False),
+            ]
+        for rel_url, expected in testdata:
+            query = rel_url.partition('?')[2]
+            self.assertEqual(expected, rules.forbidden(rel_url, QueryParams(query)), rel_url)
+        # the query string is not parsed when no hook has query rules
+        def noparse():
+            raise AssertionError('query string parsed')
+        self.assertFalse(SecurityRules([PhpInfo()]).forbidden('/?wp-cs-dump', noparse))
+
+    def test_check_environ(self):
+        from mobilize.secure import SecurityRules, SecurityHook, SquirrelMailMisc, DropResponseSignal
+        class Input:
+            def read(self):
+                raise AssertionError('request body read')
+        class NoPut(SecurityHook):
+            def check_request(self, reqinfo):
+                if 'PUT' == reqinfo.method:
+                    raise DropResponseSignal()
+        def environ(method, rel_url):
+            return {
+                'REQUEST_METHOD' : method,
+                'REQUEST_URI'    : rel_url,
+                'QUERY_STRING'   : rel_url.partition('?')[2],
+                'wsgi.url_scheme' : 'http',
+                'wsgi.input'     : Input(),
+                }
+        rules = SecurityRules([SquirrelMailMisc(), NoPut()])
+        self.assertRaises(DropResponseSignal, rules.check_environ, environ('POST', '/mail/src/login.php'))
+        self.assertRaises(DropResponseSignal, rules.check_environ, environ('PUT', '/foo'))
+        rules.check_environ(environ('POST', '/foo'))
+
+    def test_application(self):
+        import io
+        import mobilize
+        from mobilize.base import HandlerMap
+        from mobilize.handlers import redirect_to
+        from mobilize.httputil import mk_wsgi_application
+        from mobilize.secure import SecurityHook, DropResponseSignal
+        class Screen(SecurityHook):
+            def check_request(self, reqinfo):
+                if reqinfo.rel_url.startswith('/attack'):
+                    raise DropResponseSignal()
+                if reqinfo.rel_url.startswith('/broken'):
+                    raise ValueError('broken hook')
+                if reqinfo.rel_url.startswith('/go'):
+                    raise AssertionError('redirect screened')
+        hmap = HandlerMap([
+                ('/go', redirect_to('/there')),
+                ('/broken', mobilize.Moplate([], template=gtt('a.html'))),
+                ])
+        msite = fake_site(hmap, http=FakeHttp(lambda url: (200, 'source'), 'text/plain'),
+                          is_production=True, sechooks=lambda self: [Screen()],
+                          mk_site_filters=mobilize.MobileSite.mk_site_filters)
+        application = mk_wsgi_application(msite)
+        def request(rel_url):
+            statuses = []
+            environ = wsgienviron(REQUEST_METHOD='GET', REQUEST_URI=rel_url, PATH_INFO=rel_url, CONTENT_LENGTH='',
+                                  HTTP_HOST='m.example.com')
+            environ['wsgi.input'] = io.BytesIO(b'')
+            body = application(environ, lambda status, headers: statuses.append(status))
+            return statuses[-1], body
+        self.assertEqual('403 Forbidden', request('/attack')[0])
+        self.assertEqual(('200 OK', [b'source']), request('/page'))
+        # only requests bound for the source site are screened
+        self.assertEqual('302 Found', request('/go')[0])
+        # a hook failing blocks the request, rather than passing it through unscreened
+        self.assertEqual('403 Forbidden', request('/broken')[0])
+        # ... or shows the error, in development
+        msite.is_production = False
+        self.assertRaises(ValueError, request, '/broken')
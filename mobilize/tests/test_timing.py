@@ -0,0 +1,84 @@
+import unittest
+
+class TestTiming(unittest.TestCase):
+    def test_record(self):
+        from mobilize.timing import Timings
+        timings = Timings()
+        timings.note(url='http://example.com/', charset='utf-8')
+        with timings.stage('render'):
+            with timings.stage('extract', component='mwu-elem-0'):
+                pass
+            with timings.stage('process', component='mwu-elem-0'):
+                for ii in range(2):
+                    with timings.stage('filter', component='mwu-elem-0', filter='f'):
+                        pass
+            with timings.stage('template'):
+                pass
+        self.assertEqual(['extract', 'filter', 'filter', 'process', 'template', 'render'],
+                         [stage['name'] for stage in timings.stages])
+        self.assertEqual([1, 2, 2, 1, 1, 0], [stage['depth'] for stage in timings.stages])
+        self.assertEqual([1, 3, 4, 2, 5, 0], [stage['id'] for stage in timings.stages])
+        self.assertEqual([0, 2, 2, 0, 0, None], [stage['parent'] for stage in timings.stages])
+        record = timings.record()
+        self.assertEqual('utf-8', record['charset'])
+        self.assertEqual({'render', 'template'}, set(record['stages']))
+        component = record['components']['mwu-elem-0']
+        self.assertEqual({'extract', 'process', 'filters'}, set(component))
+        self.assertEqual({'f'}, set(component['filters']))
+        self.assertTrue(record['seconds'] >= record['stages']['render'])
+
+    def test_stage_untimed(self):
+        from mobilize.timing import stage
+        class FakeRequestInfo:
+            timings = None
+        for reqinfo in (None, FakeRequestInfo()):
+            with stage(reqinfo, 'render'):
+                pass
+
+    def test_callable_name(self):
+        from functools import partial
+        from mobilize import filters
+        from mobilize.timing import callable_name
+        from mobilize.images import ImgServe
+        self.assertEqual('mobilize.filters.misc.absimgsrc', callable_name(partial(filters.absimgsrc, desktop_url='http://example.com/')))
+        self.assertEqual('mobilize.images.ImgServe', callable_name(ImgServe()))
+
+    def test_slow_request_log(self):
+        import os
+        import json
+        import tempfile
+        from mobilize.timing import Timings, SlowRequestLog
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'slow.jsonl')
+            self.assertFalse(SlowRequestLog(path, 60).write(Timings()))
+            self.assertFalse(os.path.exists(path))
+            timings = Timings()
+            timings.note(url='http://example.com/')
+            self.assertTrue(SlowRequestLog(path, 0).write(timings))
+            self.assertTrue(SlowRequestLog(path, 0).write(timings))
+            with open(path) as handle:
+                records = [json.loads(line) for line in handle]
+            self.assertEqual(2, len(records))
+            self.assertEqual('http://example.com/', records[0]['url'])
+
+    def test_render_timings(self):
+        import mobilize
+        from mobilize import components
+        from mobilize.httputil import RequestInfo
+        from mobilize.timing import Timings
+        from utils4test import gtt
+        moplate = mobilize.Moplate([
+                components.CssPath('#content', idname='content', postfilters=[mobilize.filters.nobr]),
+                components.RawString('<p>Footer</p>'),
+                ], template=gtt('one.html'))
+        reqinfo = RequestInfo({'REQUEST_METHOD' : 'GET', 'REQUEST_URI' : '/', 'QUERY_STRING' : '',
+                               'HTTP_HOST' : 'm.example.com', 'wsgi.url_scheme' : 'http'})
+        reqinfo.timings = Timings()
+        moplate.render('<html><body><div id="content">Hi<br></div></body></html>', reqinfo=reqinfo)
+        record = reqinfo.timings.record()
+        self.assertEqual({'parse', 'template'}, set(record['stages']))
+        self.assertEqual({'extract', 'process', 'html', 'filters'}, set(record['components']['content']))
+        self.assertTrue('mobilize.filters.remove.nobr' in record['components']['content']['filters'])
+        self.assertEqual({'html', 'filters'}, set(record['components']['mwu-elem-1']))
+        self.assertEqual({'content' : len(moplate.components[0].html()), 'mwu-elem-1' : len('<p>Footer</p>')},
+                         record['component_bytes'])
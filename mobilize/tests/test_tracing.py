@@ -0,0 +1,92 @@
+import unittest
+
+from utils4test import wsgienviron
+
+TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+class TestTracing(unittest.TestCase):
+    def test_from_environ(self):
+        from mobilize.tracing import TraceContext
+        trace = TraceContext.from_environ({'HTTP_TRACEPARENT' : TRACEPARENT})
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', trace.trace_id)
+        self.assertEqual('b7ad6b7169203331', trace.parent_id)
+        self.assertEqual('01', trace.flags)
+        # the desktop site sees the same trace, under the source fetch span
+        self.assertEqual('00-0af7651916cd43dd8448eb211c80319c-{}-01'.format(trace.origin_span_id), trace.traceparent())
+        self.assertNotEqual(trace.span_id, trace.origin_span_id)
+        # missing or malformed headers start a new trace
+        testdata = [
+            {},
+            {'HTTP_TRACEPARENT' : 'garbage'},
+            {'HTTP_TRACEPARENT' : '00-00000000000000000000000000000000-b7ad6b7169203331-01'},
+            {'HTTP_TRACEPARENT' : '00-0af7651916cd43dd8448eb211c80319c-0000000000000000-01'},
+            ]
+        for ii, environ in enumerate(testdata):
+            trace = TraceContext.from_environ(environ)
+            self.assertEqual(32, len(trace.trace_id), ii)
+            self.assertIsNone(trace.parent_id, ii)
+
+    def test_request_headers(self):
+        from mobilize.httputil import RequestInfo
+        from mobilize.tracing import TraceContext
+        environ = dict(wsgienviron())
+        environ['HTTP_TRACEPARENT'] = TRACEPARENT
+        reqinfo = RequestInfo(environ)
+        self.assertEqual(TRACEPARENT, reqinfo.headers({})['Traceparent'])
+        reqinfo = RequestInfo(environ)
+        reqinfo.trace = TraceContext.from_environ(environ)
+        headers = reqinfo.headers({})
+        self.assertNotIn('Traceparent', headers)
+        self.assertEqual(reqinfo.trace.traceparent(), headers['traceparent'])
+
+    def test_spans(self):
+        from mobilize.timing import Timings
+        from mobilize.tracing import TraceContext, spans, SPAN_KIND_SERVER, SPAN_KIND_CLIENT, SPAN_KIND_INTERNAL
+        trace = TraceContext.from_environ({'HTTP_TRACEPARENT' : TRACEPARENT})
+        timings = Timings()
+        with timings.stage('origin'):
+            pass
+        with timings.stage('render'):
+            with timings.stage('process', component='mwu-elem-0'):
+                with timings.stage('filter', component='mwu-elem-0', filter='f'):
+                    pass
+        result = spans(trace, timings, 'GET home', {'http.request.method' : 'GET'})
+        self.assertEqual(['GET home', 'origin', 'render', 'process mwu-elem-0', 'filter f'],
+                         [span['name'] for span in result])
+        request, origin, render, process, filt = result
+        self.assertEqual({trace.trace_id}, {span['traceId'] for span in result})
+        self.assertEqual(SPAN_KIND_SERVER, request['kind'])
+        self.assertEqual(trace.span_id, request['spanId'])
+        self.assertEqual(trace.parent_id, request['parentSpanId'])
+        self.assertEqual(SPAN_KIND_CLIENT, origin['kind'])
+        self.assertEqual(trace.origin_span_id, origin['spanId'])
+        self.assertEqual(trace.span_id, origin['parentSpanId'])
+        self.assertEqual(SPAN_KIND_INTERNAL, filt['kind'])
+        self.assertEqual(render['spanId'], process['parentSpanId'])
+        self.assertEqual(process['spanId'], filt['parentSpanId'])
+        self.assertIn({'key' : 'mobilize.component', 'value' : {'stringValue' : 'mwu-elem-0'}}, filt['attributes'])
+        for span in result:
+            self.assertTrue(int(span['startTimeUnixNano']) <= int(span['endTimeUnixNano']), span['name'])
+
+    def test_file_exporter(self):
+        import os
+        import json
+        import tempfile
+        from mobilize.timing import Timings
+        from mobilize.tracing import TraceContext, FileExporter, spans
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'trace.jsonl')
+            exporter = FileExporter(path)
+            for ii in range(2):
+                exporter.export(spans(TraceContext(), Timings(), 'GET home', {'http.response.status_code' : 200}))
+            with open(path) as handle:
+                lines = [json.loads(line) for line in handle]
+        self.assertEqual(2, len(lines))
+        resource_spans = lines[0]['resourceSpans'][0]
+        self.assertIn({'key' : 'service.name', 'value' : {'stringValue' : 'mobilize'}}, resource_spans['resource']['attributes'])
+        span, = resource_spans['scopeSpans'][0]['spans']
+        self.assertEqual([{'key' : 'http.response.status_code', 'value' : {'intValue' : '200'}}], span['attributes'])
+
+if '__main__'==__name__:
+    import unittest
+    unittest.main()
@@ -98,3 +98,98 @@ def wsgienviron(**kw):
             ])
     environ.update(**kw)
     return environ
+
+def fake_imgserve(records=None):
+    '''
+    Stand in for the imgserve module, within a with block
+
+    The real imgserve.ImgDb looks images up in a shared database; this
+    one only knows the given records.
+
+    @param records : ImgDb records, by image URL
+    @type  records : dict: str -> dict
+
+    @return        : context manager
+    '''
+    import sys
+    import types
+    from unittest import mock
+    if records is None:
+        records = {}
+    class ImgDb:
+        def get(self, src):
+            return records.get(src)
+    def normalize_img_size(value):
+        try:
+            size = int(value)
+        except (TypeError, ValueError):
+            return None
+        return size if size > 0 else None
+    module = types.ModuleType('imgserve')
+    module.ImgDb = ImgDb
+    module.normalize_img_size = normalize_img_size
+    return mock.patch.dict(sys.modules, {'imgserve' : module})
+
+class FakeResp(dict):
+    '''
+    Stand in for an httplib2 response: its headers, with a status and reason
+    '''
+    def __init__(self, headers=None, status=200, reason='OK'):
+        super().__init__(headers or {})
+        self.status = status
+        self.reason = reason
+
+class FakeHttp:
+    '''
+    Stand in for an httplib2.Http object
+
+    Each request is answered by calling source with its URL, and
+    recorded in fetched as (url, method, headers).
+    '''
+    def __init__(self, source, content_type='text/html; charset=utf-8'):
+        '''
+        ctor
+
+        @param source       : Returns the status and page for a URL
+        @type  source       : callable: str -> (int, str)
+
+        @param content_type : Content type of all responses
+        @type  content_type : str
+        
+        '''
+        self.source = source
+        self.content_type = content_type
+        #: (url, method, headers) of each request so far
+        self.fetched = []
+
+    def request(self, url, method='GET', body=None, headers=None):
+        self.fetched.append((url, method, headers))
+        status, page = self.source(url)
+        return FakeResp({'content-type' : self.content_type}, status), page.encode('utf-8')
+
+def fake_site(handler_map=(), http=None, **attrs):
+    '''
+    Create a test mobile site, for m.example.com and example.com
+
+    The site has no site filters, and fetches its source pages
+    through http if given.  Other attributes are overridden by attrs,
+    e.g. mk_site_filters=MobileSite.mk_site_filters to restore the
+    site filters.
+
+    @param handler_map : Handler map
+    @type  handler_map : mobilize.base.HandlerMap, or list
+
+    @param http        : HTTP object to fetch source pages with
+    @type  http        : FakeHttp
+
+    @return            : mobile site
+    @rtype             : mobilize.MobileSite
+    
+    '''
+    import mobilize
+    members = {'mk_site_filters' : lambda self, params: []}
+    if http is not None:
+        members['get_http'] = lambda self: http
+    members.update(attrs)
+    Site = type('Site', (mobilize.MobileSite,), members)
+    return Site(mobilize.Domains(mobile='m.example.com', desktop='example.com'), handler_map)
@@ -0,0 +1,220 @@
+'''
+Per-request timing of the mobilization pipeline
+
+When a site enables the slow request log (MobileSite.slow_request_log)
+or tracing (see mobilize.tracing), each request gets a Timings
+instance, as reqinfo.timings.  The
+pipeline records its stages in it - fetching from the source,
+parsing, extracting and filtering each component, running each
+filter, rendering the template - along with facts about the request,
+such as the charset chosen and the DOM size.  Requests taking longer
+than MobileSite.slow_request_threshold are then written to the log,
+one JSON record per line.
+
+Timing costs nothing for requests without a Timings instance: use
+stage(), which does no work when reqinfo.timings is None.
+
+'''
+
+import time
+import threading
+
+class Timings:
+    '''
+    Stages and facts of a single request
+
+    Each stage is a dict with these keys:
+
+      name    : Stage name (e.g. 'origin', 'extract')
+      start   : Start time, in seconds since the request started
+      seconds : Duration
+      depth   : Nesting level; top-level stages are at 0
+      attrs   : Stage attributes, such as the component ID
+      id      : Stage number, in the order stages start
+      parent  : id of the enclosing stage; None for top-level stages
+
+    Stages are listed in the order they end.
+
+    '''
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = []
+        self.facts = {}
+        self._open = []
+        self._count = 0
+
+    def stage(self, name, **attrs):
+        '''
+        Context manager timing a stage
+
+        @param name  : Stage name
+        @type  name  : str
+
+        @param attrs : Stage attributes
+        @type  attrs : dict: str -> JSON-serializable value
+
+        '''
+        return _Stage(self, name, attrs)
+
+    def note(self, **facts):
+        '''
+        Record facts about the request
+        '''
+        self.facts.update(facts)
+
+    def elapsed(self):
+        '''
+        Seconds since the request started
+        '''
+        return time.perf_counter() - self._start
+
+    def record(self):
+        '''
+        Summary of the request, for the slow request log
+
+        Besides the facts, the summary has the total time, the total
+        time of each stage by name, and per component, the time to
+        extract, process (filters included) and render it to HTML,
+        and the time of each filter, summed over all elements.
+
+        @return : Summary
+        @rtype  : dict
+
+        '''
+        stages = {}
+        components = {}
+        for stage in self.stages:
+            component = stage['attrs'].get('component')
+            if component is None:
+                stages[stage['name']] = stages.get(stage['name'], 0) + stage['seconds']
+                continue
+            times = components.setdefault(component, {'filters' : {}})
+            if 'filter' == stage['name']:
+                name = stage['attrs']['filter']
+                times['filters'][name] = times['filters'].get(name, 0) + stage['seconds']
+            else:
+                times[stage['name']] = times.get(stage['name'], 0) + stage['seconds']
+        record = {
+            'time'       : self.started,
+            'seconds'    : self.elapsed(),
+            'stages'     : stages,
+            'components' : components,
+            }
+        record.update(self.facts)
+        return record
+
+class _Stage:
+    def __init__(self, timings, name, attrs):
+        self.timings = timings
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        timings = self.timings
+        self.id = timings._count
+        timings._count += 1
+        self.parent = timings._open[-1] if timings._open else None
+        self.depth = len(timings._open)
+        timings._open.append(self.id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        timings = self.timings
+        timings._open.pop()
+        timings.stages.append({
+                'name'    : self.name,
+                'start'   : self.start - timings._start,
+                'seconds' : end - self.start,
+                'depth'   : self.depth,
+                'attrs'   : self.attrs,
+                'id'      : self.id,
+                'parent'  : self.parent,
+                })
+        return False
+
+class _NoStage:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+_nostage = _NoStage()
+
+def stage(reqinfo, name, **attrs):
+    '''
+    Time a stage of the request, if it is being timed
+
+    reqinfo may be None, as when rendering outside of a request.
+
+    @param reqinfo : Request info
+    @type  reqinfo : mobilize.httputil.RequestInfo
+
+    @return        : Context manager
+
+    '''
+    timings = getattr(reqinfo, 'timings', None)
+    if timings is None:
+        return _nostage
+    return timings.stage(name, **attrs)
+
+def callable_name(func):
+    '''
+    A readable name of a filter or other callable
+
+    @param func : Callable
+    @type  func : callable
+
+    @return     : Name
+    @rtype      : str
+
+    '''
+    import functools
+    while isinstance(func, functools.partial):
+        func = func.func
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None)
+    if name is None:
+        name = type(func).__qualname__
+    module = getattr(func, '__module__', None) or type(func).__module__
+    return '{}.{}'.format(module, name)
+
+class SlowRequestLog:
+    '''
+    Log of requests over a latency threshold, as JSON lines
+    '''
+    def __init__(self, path, threshold):
+        '''
+        ctor
+
+        @param path      : Path of the log file
+        @type  path      : str
+
+        @param threshold : Minimum request time to log, in seconds
+        @type  threshold : float
+
+        '''
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+    def write(self, timings):
+        '''
+        Log the request, if it is slow enough
+
+        @param timings : Request timings
+        @type  timings : Timings
+
+        @return        : True iff logged
+        @rtype         : bool
+
+        '''
+        import json
+        if timings.elapsed() < self.threshold:
+            return False
+        line = json.dumps(timings.record(), sort_keys=True, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as handle:
+                handle.write(line)
+        return True
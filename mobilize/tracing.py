@@ -0,0 +1,220 @@
+'''
+Span tracing of requests, written to a local file
+
+A site with a trace file (MobileSite.trace_file) traces every
+request it sources from the desktop site.  The stages recorded in
+the request's timings (see mobilize.timing) become spans: fetching
+from the source, parsing, extracting and processing each component,
+each filter call, and rendering the template.  They are children of
+a span for the whole request.
+
+Spans are written to the trace file in the OTLP JSON format, one
+ExportTraceServiceRequest per line, as the OpenTelemetry collector's
+file exporter does.  No collector is needed to record them; the file
+can be loaded into tracing tools, or replayed to a collector later.
+
+Trace context is propagated with the W3C traceparent header.  If the
+mobile request has one, its trace is continued.  The request to the
+desktop site always gets one, whose parent is the span of the source
+fetch, so a slow mobile page can be matched up with the desktop
+site's own traces.
+
+'''
+
+import os
+import re
+import threading
+
+#: Span kinds, as numbered by OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+#: Name of the stage fetching from the desktop site (see mobilize.timing)
+ORIGIN_STAGE = 'origin'
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+class TraceContext:
+    '''
+    Identifiers of the trace of a request
+
+    Span IDs of the request's own span and of the source fetch are
+    allocated up front, so the latter can be sent to the desktop site
+    before the fetch span ends.
+
+    '''
+    def __init__(self, trace_id=None, parent_id=None, flags='01'):
+        '''
+        ctor
+
+        @param trace_id  : Trace ID (32 hex digits); None to start a new trace
+        @type  trace_id  : str
+
+        @param parent_id : Span ID of the caller (16 hex digits), if continuing its trace
+        @type  parent_id : str
+
+        @param flags     : Trace flags (2 hex digits)
+        @type  flags     : str
+
+        '''
+        self.trace_id = trace_id or _random_id(16)
+        self.parent_id = parent_id
+        self.flags = flags
+        self.span_id = _random_id(8)
+        self.origin_span_id = _random_id(8)
+
+    @classmethod
+    def from_environ(cls, environ):
+        '''
+        Continue the trace of the incoming traceparent header, or start a new one
+
+        @param environ : WSGI environment
+        @type  environ : dict
+
+        @return        : Trace context
+        @rtype         : TraceContext
+
+        '''
+        match = _TRACEPARENT_RE.match(environ.get('HTTP_TRACEPARENT', '').strip().lower())
+        if match is None or set(match.group(1)) == {'0'} or set(match.group(2)) == {'0'}:
+            return cls()
+        return cls(match.group(1), match.group(2), match.group(3))
+
+    def traceparent(self):
+        '''
+        The traceparent header value for the request to the desktop site
+
+        @return : Header value
+        @rtype  : str
+
+        '''
+        return '00-{}-{}-{}'.format(self.trace_id, self.origin_span_id, self.flags)
+
+def spans(trace, timings, name, attrs):
+    '''
+    Create the spans of a request
+
+    @param trace   : Trace context of the request
+    @type  trace   : TraceContext
+
+    @param timings : Timings of the request
+    @type  timings : mobilize.timing.Timings
+
+    @param name    : Name of the request span
+    @type  name    : str
+
+    @param attrs   : Attributes of the request span
+    @type  attrs   : dict
+
+    @return        : Spans, in OTLP JSON form
+    @rtype         : list of dict
+
+    '''
+    started = _nanos(timings.started)
+    stages = sorted(timings.stages, key=lambda stage: stage['id'])
+    # The first source fetch gets the span ID sent in its traceparent
+    origin = next((stage['id'] for stage in stages if ORIGIN_STAGE == stage['name']), None)
+    stage_ids = {stage['id'] : trace.origin_span_id if stage['id'] == origin else _random_id(8)
+                 for stage in stages}
+    request_span = _span(trace.trace_id, trace.span_id, trace.parent_id, name, SPAN_KIND_SERVER,
+                         started, started + _nanos(timings.elapsed()), attrs)
+    result = [request_span]
+    for stage in stages:
+        span_name = stage['name']
+        if 'component' in stage['attrs'] and 'filter' != stage['name']:
+            span_name += ' ' + str(stage['attrs']['component'])
+        elif 'filter' in stage['attrs']:
+            span_name += ' ' + str(stage['attrs']['filter'])
+        if stage['parent'] is None:
+            parent = trace.span_id
+        else:
+            parent = stage_ids[stage['parent']]
+        start = started + _nanos(stage['start'])
+        result.append(_span(
+                trace.trace_id,
+                stage_ids[stage['id']],
+                parent,
+                span_name,
+                SPAN_KIND_CLIENT if ORIGIN_STAGE == stage['name'] else SPAN_KIND_INTERNAL,
+                start,
+                start + _nanos(stage['seconds']),
+                {'mobilize.' + key : value for key, value in stage['attrs'].items()},
+                ))
+    return result
+
+class FileExporter:
+    '''
+    Writes spans to a file, in the OTLP JSON format
+    '''
+    #: Resource attributes of all spans
+    resource = {
+        'service.name' : 'mobilize',
+        }
+
+    def __init__(self, path):
+        '''
+        ctor
+
+        @param path : Path of the trace file, appended to
+        @type  path : str
+
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        '''
+        Write spans, as one line of the file
+
+        @param spans : Spans, in OTLP JSON form (see the spans function)
+        @type  spans : list of dict
+
+        '''
+        import json
+        line = json.dumps({
+                'resourceSpans' : [{
+                        'resource' : {'attributes' : _attributes(dict(self.resource, **{'process.pid' : os.getpid()}))},
+                        'scopeSpans' : [{
+                                'scope' : {'name' : 'mobilize'},
+                                'spans' : spans,
+                                }],
+                        }],
+                }, separators=(',', ':')) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as handle:
+                handle.write(line)
+
+# supporting code
+
+def _random_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+def _nanos(seconds):
+    return int(seconds * 1e9)
+
+def _span(trace_id, span_id, parent_id, name, kind, start, end, attrs):
+    span = {
+        'traceId'           : trace_id,
+        'spanId'            : span_id,
+        'name'              : name,
+        'kind'              : kind,
+        'startTimeUnixNano' : str(start),
+        'endTimeUnixNano'   : str(end),
+        'attributes'        : _attributes(attrs),
+        }
+    if parent_id is not None:
+        span['parentSpanId'] = parent_id
+    return span
+
+def _attributes(attrs):
+    return [{'key' : key, 'value' : _value(value)} for key, value in sorted(attrs.items())]
+
+def _value(value):
+    if isinstance(value, bool):
+        return {'boolValue' : value}
+    if isinstance(value, int):
+        return {'intValue' : str(value)}
+    if isinstance(value, float):
+        return {'doubleValue' : value}
+    return {'stringValue' : str(value)}
@@ -97,6 +97,64 @@ def findonetag(elem, tagname):
         found = elem.find('.//' + tagname)
     return found
         
+def embed_url(elem):
+    '''
+    Find the URL of the content embedded by an iframe or object element
+
+    For an iframe, this is its "src" attribute.  For an object, it is
+    taken from its "data" attribute, a child embed's "src", or a
+    "movie" param, in that order.
+
+    @param elem : iframe or object element
+    @type  elem : lxml.html.HtmlElement
+
+    @return     : URL of the embedded content, or None if not found
+    @rtype      : str, or None
+    
+    '''
+    if 'iframe' == elem.tag:
+        return elem.attrib.get('src') or None
+    url = elem.attrib.get('data')
+    if not url:
+        child = elem.find('.//embed')
+        if child is not None:
+            url = child.attrib.get('src')
+    if not url:
+        for param in elem.iterfind('.//param'):
+            if 'movie' == param.attrib.get('name', '').lower():
+                url = param.attrib.get('value')
+                break
+    return url or None
+
+def hidden_embed(elem):
+    '''
+    Whether an iframe or object element is not meant to be seen
+
+    Such embeds are typically tracking frames, like Google Tag
+    Manager's noscript iframe.  An embed is hidden if it has the
+    "hidden" attribute, its inline style has display:none or
+    visibility:hidden, or it is at most 1 pixel wide or high.
+
+    @param elem : iframe or object element
+    @type  elem : lxml.html.HtmlElement
+
+    @return     : True iff the embed is hidden
+    @rtype      : bool
+    
+    '''
+    import re
+    if 'hidden' in elem.attrib:
+        return True
+    style = elem.attrib.get('style', '').replace(' ', '').lower()
+    for declaration in style.split(';'):
+        if declaration.partition('!')[0] in {'display:none', 'visibility:hidden'}:
+            return True
+    for dimension in 'width', 'height':
+        match = re.match(r'\s*(\d+(?:\.\d*)?)\s*(?:px)?\s*$', elem.attrib.get(dimension, ''))
+        if match is not None and float(match.group(1)) <= 1:
+            return True
+    return False
+
 def elem2str(elem):
     '''
     Render an HTML element as a string
@@ -242,7 +300,7 @@ def isscalar(obj):
     '''
     Returns True iff the object is a single, scalar value
 
-    This is much like "isinstance(obj, collections.Iterable)", except
+    This is much like "isinstance(obj, collections.abc.Iterable)", except
     it will return True for str and byte objects.
 
     @param obj : Python object
@@ -252,7 +310,7 @@ def isscalar(obj):
     @rtype  : bool
     
     '''
-    from collections import Iterable
+    from collections.abc import Iterable
     if type(obj) in (str, bytes):
         return True
     if isinstance(obj, Iterable):